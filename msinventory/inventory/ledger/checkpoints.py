@@ -0,0 +1,111 @@
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import LedgerEntry, LedgerCheckpoint
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return quote(LedgerEntry._meta.db_table), quote(LedgerCheckpoint._meta.db_table)
+
+
+@transaction.atomic
+def create_checkpoint():
+    """
+    Write a new checkpoint for every product/location with entries since its last one.
+
+    The ledger is briefly locked against inserts so that no entry below the
+    checkpointed id can still be in flight. Returns the number of checkpoints.
+    """
+    entries, checkpoints = _tables()
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {entries} IN SHARE MODE")
+        cursor.execute(
+            f"WITH latest AS ("
+            f"  SELECT DISTINCT ON (product_id, location_id) "
+            f"  product_id, location_id, balance, last_entry_id FROM {checkpoints} "
+            f"  ORDER BY product_id, location_id, last_entry_id DESC"
+            f"), pending AS ("
+            f"  SELECT e.product_id, e.location_id, SUM(e.quantity) AS delta, "
+            f"  MAX(e.id) AS last_entry_id FROM {entries} e "
+            f"  LEFT JOIN latest l USING (product_id, location_id) "
+            f"  WHERE e.id > COALESCE(l.last_entry_id, 0) "
+            f"  GROUP BY e.product_id, e.location_id"
+            f") "
+            f"INSERT INTO {checkpoints} "
+            f"(product_id, location_id, balance, last_entry_id, timestamp) "
+            f"SELECT p.product_id, p.location_id, COALESCE(l.balance, 0) + p.delta, "
+            f"p.last_entry_id, %s FROM pending p "
+            f"LEFT JOIN latest l USING (product_id, location_id)",
+            [timezone.now()],
+        )
+        return cursor.rowcount
+
+
+def open_existing_levels():
+    """
+    Write an opening entry for every inventory level that predates the ledger.
+
+    Levels without any ledger entry get one unlinked entry for their current
+    quantity, timestamped at the level's last update, so ledger balances match
+    the levels. Levels that already have entries are left alone, so running it
+    again writes nothing. Returns the number of entries written.
+    """
+    from inventory.products.models import InventoryLevel
+
+    entries, _ = _tables()
+    levels = connection.ops.quote_name(InventoryLevel._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {entries} (product_id, location_id, stock_move_id, quantity, timestamp) "
+            f"SELECT i.product_id, i.location_id, NULL, i.quantity, i.last_updated "
+            f"FROM {levels} i WHERE i.quantity <> 0 AND NOT EXISTS ("
+            f"  SELECT 1 FROM {entries} e "
+            f"  WHERE e.product_id = i.product_id AND e.location_id = i.location_id"
+            f")"
+        )
+        return cursor.rowcount
+
+
+def _pair_filters(alias, product_id, location_id):
+    clauses, params = [], []
+    if product_id:
+        clauses.append(f'{alias}.product_id = %s')
+        params.append(product_id)
+    if location_id:
+        clauses.append(f'{alias}.location_id = %s')
+        params.append(location_id)
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+
+def ledger_balances(as_of=None, product_id=None, location_id=None):
+    """
+    Return {(product_id, location_id): balance} as of ``as_of`` (default: now).
+
+    Each pair starts from its nearest checkpoint at or before ``as_of`` and adds
+    only the ledger entries written after that checkpoint.
+    """
+    entries, checkpoints = _tables()
+    as_of = as_of or timezone.now()
+    checkpoint_filters, checkpoint_params = _pair_filters('c', product_id, location_id)
+    entry_filters, entry_params = _pair_filters('e', product_id, location_id)
+    
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH latest AS ("
+            f"  SELECT DISTINCT ON (c.product_id, c.location_id) "
+            f"  c.product_id, c.location_id, c.balance, c.last_entry_id "
+            f"  FROM {checkpoints} c WHERE c.timestamp <= %s{checkpoint_filters} "
+            f"  ORDER BY c.product_id, c.location_id, c.last_entry_id DESC"
+            f"), pending AS ("
+            f"  SELECT e.product_id, e.location_id, SUM(e.quantity) AS delta "
+            f"  FROM {entries} e LEFT JOIN latest l USING (product_id, location_id) "
+            f"  WHERE e.timestamp <= %s AND e.id > COALESCE(l.last_entry_id, 0)"
+            f"{entry_filters} "
+            f"  GROUP BY e.product_id, e.location_id"
+            f") "
+            f"SELECT product_id, location_id, "
+            f"COALESCE(l.balance, 0) + COALESCE(p.delta, 0) "
+            f"FROM latest l FULL OUTER JOIN pending p USING (product_id, location_id)",
+            [as_of] + checkpoint_params + [as_of] + entry_params,
+        )
+        return {(product, location): balance for product, location, balance in cursor.fetchall()}
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from inventory.ledger.checkpoints import create_checkpoint
+
+class Command(BaseCommand):
+    help = 'Checkpoint ledger balances for every product/location with new entries'
+    
+    def handle(self, *args, **options):
+        created = create_checkpoint()
+        self.stdout.write(self.style.SUCCESS(f'Created {created} ledger checkpoints'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from inventory.ledger.checkpoints import open_existing_levels
+
+class Command(BaseCommand):
+    help = 'Write opening ledger entries for inventory levels recorded before the ledger existed'
+    
+    def handle(self, *args, **options):
+        created = open_existing_levels()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {created} opening ledger entries'))
@@ -0,0 +1,40 @@
+from django.db import models
+from inventory.products.models import Product
+from inventory.locations.models import Location
+
+class LedgerEntry(models.Model):
+    """Append-only signed stock change for one product at one location"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='ledger_entries')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='ledger_entries')
+    stock_move = models.ForeignKey('stockmoves.StockMove', on_delete=models.SET_NULL,
+                                   related_name='ledger_entries', null=True, blank=True)
+    quantity = models.IntegerField()
+    timestamp = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['product', 'location', 'id']),
+            models.Index(fields=['timestamp']),
+        ]
+        verbose_name_plural = 'Ledger Entries'
+    
+    def __str__(self):
+        return f"{self.product_id} at {self.location_id}: {self.quantity:+d}"
+
+class LedgerCheckpoint(models.Model):
+    """Balance of a product at a location after every entry up to ``last_entry_id``"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='ledger_checkpoints')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='ledger_checkpoints')
+    balance = models.IntegerField()
+    last_entry_id = models.BigIntegerField()
+    timestamp = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['product', 'location', '-timestamp']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} at {self.location_id}: {self.balance} @ {self.last_entry_id}"
@@ -0,0 +1,10 @@
+from rest_framework import serializers
+from .models import LedgerEntry
+
+class LedgerEntrySerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    location_name = serializers.CharField(source='location.name', read_only=True)
+    
+    class Meta:
+        model = LedgerEntry
+        fields = '__all__'
@@ -0,0 +1,151 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from .checkpoints import create_checkpoint, ledger_balances
+from .models import LedgerEntry, LedgerCheckpoint
+from inventory.products.models import Product, ProductCategory, InventoryLevel
+from inventory.locations.models import Location
+from inventory.stockmoves.models import StockMove, StockMoveLine
+
+User = get_user_model()
+
+class LedgerTest(TestCase):
+    def setUp(self):
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Test Product",
+            internal_reference="TP",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category,
+            quantity_on_hand=0
+        )
+        self.location1 = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.location2 = Location.objects.create(code="WH2", name="Warehouse 2")
+    
+    def execute(self, move_type, quantity, **locations):
+        move = StockMove.objects.create(move_type=move_type, **locations)
+        StockMoveLine.objects.create(stock_move=move, product=self.product, quantity=quantity)
+        move.execute_move()
+        return move
+    
+    def test_moves_append_signed_entries(self):
+        self.execute("INBOUND", 10, to_location=self.location1)
+        InventoryLevel.objects.create(product=self.product, location=self.location2, quantity=0)
+        transfer = self.execute(
+            "TRANSFER", 4, from_location=self.location1, to_location=self.location2
+        )
+        
+        entries = LedgerEntry.objects.filter(stock_move=transfer)
+        self.assertEqual(
+            sorted((entry.location_id, entry.quantity) for entry in entries),
+            sorted([(self.location1.id, -4), (self.location2.id, 4)])
+        )
+        self.assertEqual(
+            ledger_balances(),
+            {(self.product.id, self.location1.id): 6, (self.product.id, self.location2.id): 4}
+        )
+    
+    def test_opening_balance_entry_for_seeded_levels(self):
+        self.product.quantity_on_hand = 7
+        self.product.save()
+        self.execute("OUTBOUND", 2, from_location=self.location1)
+        
+        opening = LedgerEntry.objects.get(stock_move__isnull=True)
+        self.assertEqual(opening.quantity, 7)
+        level = InventoryLevel.objects.get(product=self.product, location=self.location1)
+        self.assertEqual(ledger_balances()[(self.product.id, self.location1.id)], level.quantity)
+    
+    def test_backfill_opens_levels_without_entries(self):
+        Product.objects.filter(pk=self.product.pk).update(quantity_on_hand=12)
+        InventoryLevel.objects.create(product=self.product, location=self.location1, quantity=12)
+        InventoryLevel.objects.create(product=self.product, location=self.location2, quantity=0)
+        
+        call_command('open_ledger_balances', stdout=StringIO())
+        call_command('open_ledger_balances', stdout=StringIO())
+        
+        self.assertEqual(LedgerEntry.objects.count(), 1)
+        self.assertEqual(ledger_balances(), {(self.product.id, self.location1.id): 12})
+        self.execute("OUTBOUND", 5, from_location=self.location1)
+        self.assertEqual(ledger_balances(), {(self.product.id, self.location1.id): 7})
+    
+    def test_balances_start_from_checkpoint(self):
+        self.execute("INBOUND", 10, to_location=self.location1)
+        self.execute("OUTBOUND", 3, from_location=self.location1)
+        self.assertEqual(create_checkpoint(), 1)
+        self.assertEqual(create_checkpoint(), 0)
+        
+        checkpoint = LedgerCheckpoint.objects.get()
+        self.assertEqual(checkpoint.balance, 7)
+        
+        LedgerEntry.objects.filter(id__lte=checkpoint.last_entry_id).update(quantity=0)
+        self.execute("INBOUND", 5, to_location=self.location1)
+        self.assertEqual(ledger_balances()[(self.product.id, self.location1.id)], 12)
+        
+        self.assertEqual(create_checkpoint(), 1)
+        self.assertEqual(
+            LedgerCheckpoint.objects.order_by('-last_entry_id').first().balance, 12
+        )
+    
+    def test_balances_as_of_past_time(self):
+        self.execute("INBOUND", 10, to_location=self.location1)
+        LedgerEntry.objects.update(timestamp=timezone.now() - timedelta(days=2))
+        self.execute("OUTBOUND", 4, from_location=self.location1)
+        
+        yesterday = timezone.now() - timedelta(days=1)
+        self.assertEqual(ledger_balances(as_of=yesterday)[(self.product.id, self.location1.id)], 10)
+        self.assertEqual(ledger_balances()[(self.product.id, self.location1.id)], 6)
+
+class LedgerAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser", 
+            email="test@example.com", 
+            password="testpass123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Test Product",
+            internal_reference="TP",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category
+        )
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.client.post('/api/stockmoves/', {
+            "move_type": "INBOUND",
+            "to_location": self.location.id,
+            "lines": [{"product": self.product.id, "quantity": 8}]
+        }, format='json')
+    
+    def test_list_entries(self):
+        response = self.client.get(f'/api/ledger/?product_id={self.product.id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['quantity'], 8)
+    
+    def test_balances_endpoint(self):
+        response = self.client.post('/api/ledger/checkpoint/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        response = self.client.get(f'/api/ledger/balances/?location_id={self.location.id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'product': self.product.id, 'location': self.location.id, 'balance': 8}
+        ])
+        
+        response = self.client.get('/api/ledger/balances/?as_of=yesterday')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.get('/api/ledger/balances/?product_id=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/ledger/balances/?location_id=1.5')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
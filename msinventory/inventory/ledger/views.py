@@ -0,0 +1,61 @@
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from .checkpoints import create_checkpoint, ledger_balances
+from .models import LedgerEntry
+from .serializers import LedgerEntrySerializer
+from utils.helpers import parse_timestamp
+
+class LedgerEntryViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = LedgerEntry.objects.all().select_related('product', 'location')
+    serializer_class = LedgerEntrySerializer
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        product_id = self.request.query_params.get('product_id')
+        location_id = self.request.query_params.get('location_id')
+        
+        if product_id:
+            queryset = queryset.filter(product_id=product_id)
+        if location_id:
+            queryset = queryset.filter(location_id=location_id)
+        
+        return queryset
+    
+    @action(detail=False, methods=['get'])
+    def balances(self, request):
+        """Reconstruct balances from the nearest checkpoint plus later entries"""
+        as_of = request.query_params.get('as_of')
+        if as_of:
+            try:
+                as_of = parse_timestamp(as_of)
+            except ValueError:
+                return Response(
+                    {'error': 'as_of must be an ISO 8601 timestamp'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        params = request.query_params
+        try:
+            product_id, location_id = (
+                int(params[name]) if params.get(name) else None
+                for name in ('product_id', 'location_id')
+            )
+        except ValueError:
+            return Response(
+                {'error': 'product_id and location_id must be integers'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        balances = ledger_balances(
+            as_of=as_of, product_id=product_id, location_id=location_id
+        )
+        return Response([
+            {'product': product_id, 'location': location_id, 'balance': balance}
+            for (product_id, location_id), balance in sorted(balances.items())
+        ])
+    
+    @action(detail=False, methods=['post'])
+    def checkpoint(self, request):
+        created = create_checkpoint()
+        return Response({'message': f'Created {created} checkpoints'})
@@ -5,6 +5,8 @@ class Location(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    # Reserve locations replenish the forward (pick) locations; see replenishment.py.
+    is_reserve = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -15,5 +15,12 @@ class LocationViewSet(viewsets.ModelViewSet):
                 queryset = queryset.filter(is_active=True)
             elif is_active.lower() == 'false':
                 queryset = queryset.filter(is_active=False)
+        
+        is_reserve = self.request.query_params.get('is_reserve')
+        if is_reserve is not None:
+            if is_reserve.lower() == 'true':
+                queryset = queryset.filter(is_reserve=True)
+            elif is_reserve.lower() == 'false':
+                queryset = queryset.filter(is_reserve=False)
                 
         return queryset
\ No newline at end of file
@@ -0,0 +1,124 @@
+from datetime import timedelta
+import numpy as np
+from django.db.models import Sum
+from django.utils import timezone
+from .models import Product
+
+ABC_CLASSES = ('A', 'B', 'C')
+XYZ_CLASSES = ('X', 'Y', 'Z')
+
+
+def weekly_demand(days=365, now=None):
+    """
+    Return (product_ids, matrix) where ``matrix[i, w]`` is the completed outbound
+    quantity of ``product_ids[i]`` in week ``w`` of the last ``days`` days,
+    rounded down to whole weeks (oldest first). Every product gets a row,
+    filled from one grouped query on the DailyMoveRollup table.
+    """
+    from inventory.stockmoves.models import DailyMoveRollup
+
+    today = timezone.localdate(now or timezone.now())
+    weeks = days // 7
+    first_day = today - timedelta(days=weeks * 7 - 1)
+    product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+    product_ids = np.array(list(product_ids), dtype=np.int64)
+    matrix = np.zeros((len(product_ids), weeks))
+
+    rows = list(
+        DailyMoveRollup.objects.filter(
+            day__gte=first_day, day__lte=today, outbound_quantity__gt=0
+        )
+        .values('product_id', 'day')
+        .annotate(total=Sum('outbound_quantity'))
+        .values_list('product_id', 'day', 'total')
+    )
+    if rows and len(product_ids):
+        row_products, row_days, totals = zip(*rows)
+        row_products = np.array(row_products, dtype=np.int64)
+        columns = np.array([(day - first_day).days // 7 for day in row_days])
+        positions = np.minimum(
+            np.searchsorted(product_ids, row_products), len(product_ids) - 1
+        )
+        known = product_ids[positions] == row_products
+        totals = np.array(totals, dtype=np.float64)
+        np.add.at(matrix, (positions[known], columns[known]), totals[known])
+    return product_ids, matrix
+
+
+def abc_classes(values, a_share=0.8, b_share=0.95):
+    """
+    Pareto classes for consumption ``values``: products making up the first
+    ``a_share`` of total value are A, up to ``b_share`` B, the rest C.
+    Products without consumption are always C.
+    """
+    classes = np.full(len(values), 'C')
+    total = values.sum()
+    if total <= 0:
+        return classes
+    order = np.argsort(-values, kind='stable')
+    # Share of value held by the products ranked before each one.
+    before = (np.cumsum(values[order]) - values[order]) / total
+    ranked = np.where(before < a_share, 'A', np.where(before < b_share, 'B', 'C'))
+    ranked[values[order] <= 0] = 'C'
+    classes[order] = ranked
+    return classes
+
+
+def xyz_classes(matrix, x_cv=0.5, y_cv=1.0):
+    """
+    Variability classes from the coefficient of variation of each row of
+    ``matrix``: X up to ``x_cv``, Y up to ``y_cv``, Z above or without demand.
+    Returns (classes, cv), with cv NaN for rows without demand.
+    """
+    mean = matrix.mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cv = np.where(mean > 0, matrix.std(axis=1) / mean, np.nan)
+    classes = np.where(cv <= x_cv, 'X', np.where(cv <= y_cv, 'Y', 'Z'))
+    return classes, cv
+
+
+def classify_products(
+    days=365, a_share=0.8, b_share=0.95, x_cv=0.5, y_cv=1.0, now=None
+):
+    """
+    Classify every product by consumption value (ABC: cost times outbound
+    quantity over the last ``days`` days) and by demand variability (XYZ:
+    coefficient of variation of weekly outbound quantities), and store the
+    classes on ``Product.abc_class`` and ``Product.xyz_class``.
+
+    Returns a summary with the product count per combined class.
+    """
+    if days < 7:
+        raise ValueError("days must be at least 7")
+    if not 0 < a_share <= b_share <= 1:
+        raise ValueError("shares must satisfy 0 < a_share <= b_share <= 1")
+    if not 0 <= x_cv <= y_cv:
+        raise ValueError("thresholds must satisfy 0 <= x_cv <= y_cv")
+
+    product_ids, matrix = weekly_demand(days, now=now)
+    costs = dict(Product.objects.values_list('pk', 'cost'))
+    cost = np.array([float(costs.get(pk, 0)) for pk in product_ids.tolist()])
+    values = cost * matrix.sum(axis=1)
+
+    abc = abc_classes(values, a_share, b_share)
+    xyz, _ = xyz_classes(matrix, x_cv, y_cv)
+    classes = dict(zip(product_ids.tolist(), zip(abc.tolist(), xyz.tolist())))
+
+    changed = []
+    for product in Product.objects.only('pk', 'abc_class', 'xyz_class'):
+        abc_class, xyz_class = classes.get(product.pk, ('C', 'Z'))
+        if (product.abc_class, product.xyz_class) != (abc_class, xyz_class):
+            product.abc_class, product.xyz_class = abc_class, xyz_class
+            changed.append(product)
+    Product.objects.bulk_update(changed, ['abc_class', 'xyz_class'], batch_size=5000)
+
+    counts = dict.fromkeys((a + x for a in ABC_CLASSES for x in XYZ_CLASSES), 0)
+    for abc_class, xyz_class in classes.values():
+        counts[abc_class + xyz_class] += 1
+    return {
+        'days': days,
+        'classified': len(classes),
+        'updated': len(changed),
+        'total_value': round(float(values.sum()), 2),
+        'counts': counts,
+    }
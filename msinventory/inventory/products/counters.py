@@ -0,0 +1,72 @@
+import random
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import Product, ProductStockDelta
+
+
+def striped_on_hand_enabled():
+    return getattr(settings, 'INVENTORY_STRIPED_ON_HAND', False)
+
+
+def pending_deltas(product_ids):
+    """Return {product_id: sum of unfolded deltas} for ``product_ids``"""
+    return dict(
+        ProductStockDelta.objects.filter(product_id__in=product_ids)
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .values_list('product_id', 'total')
+    )
+
+
+def add_stock_deltas(deltas):
+    """
+    Record on-hand changes ({product_id: delta}) in one randomly chosen stripe.
+
+    Concurrent writers on the same product usually land on different stripe rows,
+    so they only serialize when they happen to pick the same one.
+    """
+    if not deltas:
+        return
+    stripe = random.randrange(getattr(settings, 'INVENTORY_ON_HAND_STRIPES', 16))
+    product_ids = sorted(deltas)
+    table = connection.ops.quote_name(ProductStockDelta._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} AS t (product_id, stripe, quantity) "
+            f"SELECT v.product_id, %s, v.delta "
+            f"FROM unnest(%s::bigint[], %s::integer[]) AS v(product_id, delta) "
+            f"ON CONFLICT (product_id, stripe) "
+            f"DO UPDATE SET quantity = t.quantity + EXCLUDED.quantity",
+            [stripe, product_ids, [deltas[pk] for pk in product_ids]],
+        )
+
+
+@transaction.atomic
+def fold_stock_deltas(product_ids=None):
+    """
+    Move pending stripe deltas into Product.quantity_on_hand.
+
+    Folds every product when ``product_ids`` is None. Returns the number of
+    products updated.
+    """
+    deltas_table = connection.ops.quote_name(ProductStockDelta._meta.db_table)
+    products_table = connection.ops.quote_name(Product._meta.db_table)
+    where, params = '', [timezone.now()]
+    if product_ids is not None:
+        if not product_ids:
+            return 0
+        where, params = 'WHERE product_id = ANY(%s::bigint[])', [list(product_ids)] + params
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH folded AS (DELETE FROM {deltas_table} {where} "
+            f"RETURNING product_id, quantity), "
+            f"totals AS (SELECT product_id, SUM(quantity) AS delta "
+            f"FROM folded GROUP BY product_id) "
+            f"UPDATE {products_table} AS p "
+            f"SET quantity_on_hand = p.quantity_on_hand + totals.delta, updated_at = %s "
+            f"FROM totals WHERE p.id = totals.product_id AND totals.delta <> 0",
+            params,
+        )
+        return cursor.rowcount
@@ -0,0 +1,135 @@
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .counters import fold_stock_deltas, striped_on_hand_enabled
+from .models import DemandForecastRun, Product
+
+
+def demand_matrix(history_days=56, now=None):
+    """
+    Return (product_ids, matrix) where ``matrix[i, d]`` is the completed outbound
+    quantity of ``product_ids[i]`` on day ``d`` of the last ``history_days`` days
+    (oldest first, today last). Every product gets a row, filled from one
+    query on the DailyMoveRollup table.
+    """
+    from inventory.stockmoves.models import DailyMoveRollup
+
+    today = timezone.localdate(now or timezone.now())
+    first_day = today - timedelta(days=history_days - 1)
+    product_ids = np.array(list(Product.objects.order_by('pk').values_list('pk', flat=True)), dtype=np.int64)
+    matrix = np.zeros((len(product_ids), history_days))
+
+    rows = list(
+        DailyMoveRollup.objects.filter(day__gte=first_day, day__lte=today, outbound_quantity__gt=0)
+        .values('product_id', 'day')
+        .annotate(total=Sum('outbound_quantity'))
+        .values_list('product_id', 'day', 'total')
+    )
+    if rows and len(product_ids):
+        line_products, days, totals = zip(*rows)
+        line_products = np.array(line_products, dtype=np.int64)
+        columns = np.array([(day - first_day).days for day in days])
+        positions = np.minimum(np.searchsorted(product_ids, line_products), len(product_ids) - 1)
+        valid = (product_ids[positions] == line_products) & (columns >= 0) & (columns < history_days)
+        np.add.at(matrix, (positions[valid], columns[valid]), np.array(totals, dtype=np.float64)[valid])
+    return product_ids, matrix
+
+
+def moving_average(matrix, horizon, window=14):
+    """Flat forecast at the mean of the last ``window`` days"""
+    rate = matrix[:, -window:].mean(axis=1)
+    return np.repeat(rate[:, None], horizon, axis=1)
+
+
+def exponential_smoothing(matrix, horizon, alpha=0.3):
+    """Flat forecast at the simple exponentially smoothed level"""
+    level = matrix[:, 0].copy()
+    for day in matrix.T[1:]:
+        level = alpha * day + (1 - alpha) * level
+    return np.repeat(level[:, None], horizon, axis=1)
+
+
+def seasonal_naive(matrix, horizon, season=7):
+    """Repeat the last ``season`` days, so weekday patterns carry forward"""
+    last_season = matrix[:, -season:]
+    repeats = -(-horizon // last_season.shape[1])
+    return np.tile(last_season, (1, repeats))[:, :horizon]
+
+
+FORECAST_METHODS = {
+    'moving_average': moving_average,
+    'exponential_smoothing': exponential_smoothing,
+    'seasonal_naive': seasonal_naive,
+}
+
+
+def run_forecast(method='exponential_smoothing', horizon=14, history_days=56, now=None):
+    """
+    Forecast outbound demand over the next ``horizon`` days for every product,
+    store it in ``Product.forecast_demand`` and the projected stock (on hand
+    minus forecast demand) in ``Product.forecasted_quantity``, and record the
+    run as a DemandForecastRun, all in one transaction.
+
+    Returns the DemandForecastRun.
+    """
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"method must be one of: {', '.join(FORECAST_METHODS)}")
+    if horizon < 1 or history_days < 1:
+        raise ValueError("horizon and history_days must be positive")
+    max_horizon = getattr(settings, 'FORECAST_MAX_HORIZON', 365)
+    max_history_days = getattr(settings, 'FORECAST_MAX_HISTORY_DAYS', 730)
+    if horizon > max_horizon or history_days > max_history_days:
+        raise ValueError(
+            f"horizon must be at most {max_horizon} and "
+            f"history_days at most {max_history_days}"
+        )
+
+    product_ids, matrix = demand_matrix(history_days, now=now)
+    demand = np.round(FORECAST_METHODS[method](matrix, horizon).sum(axis=1)).astype(np.int64)
+    forecasts = dict(zip(product_ids.tolist(), demand.tolist()))
+
+    with transaction.atomic():
+        if striped_on_hand_enabled():
+            fold_stock_deltas()
+        changed = []
+        rows = Product.objects.values_list('pk', 'quantity_on_hand', 'forecasted_quantity', 'forecast_demand')
+        for pk, on_hand, forecasted, current_demand in rows:
+            product_demand = forecasts.get(pk, 0)
+            projected = on_hand - product_demand
+            if (forecasted, current_demand) != (projected, product_demand):
+                changed.append(Product(pk=pk, forecasted_quantity=projected, forecast_demand=product_demand))
+        Product.objects.bulk_update(changed, ['forecasted_quantity', 'forecast_demand'], batch_size=5000)
+        return DemandForecastRun.objects.create(
+            method=method, horizon_days=horizon, history_days=history_days, updated=len(changed)
+        )
+
+
+def get_forecast(product_id=None, limit=100):
+    """
+    Return the latest stored forecast run with the demand of one ``product_id``
+    or of the top ``limit`` products, or None if no forecast has been run. Only
+    reads what run_forecast() stored; nothing is computed here.
+    """
+    run = DemandForecastRun.objects.first()
+    if run is None:
+        return None
+
+    products = Product.objects.order_by('-forecast_demand', 'pk')
+    if product_id is not None:
+        products = products.filter(pk=product_id)
+    else:
+        products = products[:limit]
+    return {
+        'method': run.method,
+        'horizon_days': run.horizon_days,
+        'history_days': run.history_days,
+        'generated_at': run.generated_at,
+        'updated': run.updated,
+        'results': [
+            {'product_id': pk, 'forecast_demand': quantity}
+            for pk, quantity in products.values_list('pk', 'forecast_demand')
+        ],
+    }
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.products.classification import classify_products
+
+class Command(BaseCommand):
+    help = 'Classify every product by consumption value (ABC) and demand variability (XYZ)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Days of outbound history to use')
+        parser.add_argument('--a-share', type=float, default=0.8, help='Share of total value held by class A')
+        parser.add_argument('--b-share', type=float, default=0.95, help='Share of total value held by classes A and B')
+        parser.add_argument('--x-cv', type=float, default=0.5, help='Highest weekly coefficient of variation for class X')
+        parser.add_argument('--y-cv', type=float, default=1.0, help='Highest weekly coefficient of variation for class Y')
+    
+    def handle(self, *args, **options):
+        try:
+            result = classify_products(
+                days=options['days'],
+                a_share=options['a_share'],
+                b_share=options['b_share'],
+                x_cv=options['x_cv'],
+                y_cv=options['y_cv'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        counts = ', '.join(f'{name}: {count}' for name, count in result['counts'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Classified {result['classified']} products, updated {result['updated']} ({counts})"
+        ))
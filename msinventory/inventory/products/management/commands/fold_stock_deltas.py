@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from inventory.products.counters import fold_stock_deltas
+
+class Command(BaseCommand):
+    help = 'Fold pending striped stock deltas into Product.quantity_on_hand'
+    
+    def handle(self, *args, **options):
+        updated = fold_stock_deltas()
+        self.stdout.write(self.style.SUCCESS(f'Folded stock deltas into {updated} products'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.products.forecasting import FORECAST_METHODS, run_forecast
+
+class Command(BaseCommand):
+    help = 'Forecast outbound demand for every product and update forecasted quantities'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--method', choices=list(FORECAST_METHODS), default='exponential_smoothing')
+        parser.add_argument('--horizon', type=int, default=14, help='Days to forecast')
+        parser.add_argument('--history-days', type=int, default=56, help='Days of demand history to use')
+    
+    def handle(self, *args, **options):
+        try:
+            run = run_forecast(
+                method=options['method'],
+                horizon=options['horizon'],
+                history_days=options['history_days'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast demand with {run.method} over {run.horizon_days} days, "
+            f"updated {run.updated} forecasted quantities"
+        ))
@@ -2,6 +2,16 @@ from django.db import models
 from inventory.suppliers.models import Supplier
 from inventory.locations.models import Location
 
+def threshold_crossing(before, after, reorder_point):
+    """Return 'LOW' or 'RECOVERED' if going from ``before`` to ``after`` crosses ``reorder_point``"""
+    if reorder_point is None or before is None:
+        return None
+    if before > reorder_point >= after:
+        return 'LOW'
+    if before <= reorder_point < after:
+        return 'RECOVERED'
+    return None
+
 class ProductCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True)
@@ -18,6 +28,16 @@ class Product(models.Model):
         ('consumable', 'Consumable'),
         ('service', 'Service'),
     )
+    ABC_CLASSES = (
+        ('A', 'A - High value'),
+        ('B', 'B - Medium value'),
+        ('C', 'C - Low value'),
+    )
+    XYZ_CLASSES = (
+        ('X', 'X - Steady demand'),
+        ('Y', 'Y - Variable demand'),
+        ('Z', 'Z - Erratic demand'),
+    )
     
     favorite = models.CharField(max_length=20, default='Normal')
     name = models.CharField(max_length=200)
@@ -29,13 +49,26 @@ class Product(models.Model):
     product_category = models.ForeignKey(ProductCategory, on_delete=models.SET_NULL, null=True)
     product_type = models.CharField(max_length=20, choices=PRODUCT_TYPES, default='storable')
     quantity_on_hand = models.IntegerField(default=0)
+    reorder_point = models.IntegerField(null=True, blank=True)
     forecasted_quantity = models.IntegerField(default=0)
+    # Outbound demand over the horizon of the latest DemandForecastRun.
+    forecast_demand = models.IntegerField(default=0)
+    # Set by classify_products; empty until the first classification run.
+    abc_class = models.CharField(max_length=1, choices=ABC_CLASSES, blank=True, null=True)
+    xyz_class = models.CharField(max_length=1, choices=XYZ_CLASSES, blank=True, null=True)
     activity_exception_decoration = models.TextField(blank=True, null=True)
     supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True)
     default_location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['quantity_on_hand']),
+            models.Index(fields=['abc_class', 'xyz_class']),
+            models.Index(fields=['xyz_class']),
+        ]
+    
     def __str__(self):
         return f"{self.name} ({self.internal_reference})"
     
@@ -43,8 +76,16 @@ class Product(models.Model):
         """Update product quantity with validation"""
         if self.quantity_on_hand + quantity_change < 0:
             raise ValueError("Insufficient stock")
+        before = self.quantity_on_hand
         self.quantity_on_hand += quantity_change
         self.save()
+        
+        event_type = threshold_crossing(before, self.quantity_on_hand, self.reorder_point)
+        if event_type:
+            LowStockEvent.objects.create(
+                product=self, event_type=event_type, quantity=self.quantity_on_hand,
+                reorder_point=self.reorder_point, timestamp=self.updated_at
+            )
 
     def get_inventory_level(self, location):
         from .models import InventoryLevel
@@ -55,17 +96,79 @@ class Product(models.Model):
         )
         return level
 
+class ProductStockDelta(models.Model):
+    """Pending on-hand changes, striped so concurrent moves on a hot product don't contend"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_deltas')
+    stripe = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['product', 'stripe']
+        verbose_name = 'Product Stock Delta'
+        verbose_name_plural = 'Product Stock Deltas'
+    
+    def __str__(self):
+        return f"{self.product_id} stripe {self.stripe}: {self.quantity:+d}"
+
 class InventoryLevel(models.Model):
     """Real-time inventory levels per product and location"""
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_levels')
     location = models.ForeignKey('locations.Location', on_delete=models.CASCADE, related_name='inventory_levels')
     quantity = models.IntegerField(default=0)
+    reorder_point = models.IntegerField(null=True, blank=True)
+    max_quantity = models.IntegerField(null=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ['product', 'location']
+        indexes = [
+            # Only levels at or below their reorder point, for per-location low_stock.
+            models.Index(
+                fields=['location', 'product'], name='inventorylevel_short_idx',
+                condition=models.Q(quantity__lte=models.F('reorder_point')),
+            ),
+        ]
         verbose_name = 'Inventory Level'
         verbose_name_plural = 'Inventory Levels'
     
     def __str__(self):
-        return f"{self.product.name} at {self.location.code}: {self.quantity}"
\ No newline at end of file
+        return f"{self.product.name} at {self.location.code}: {self.quantity}"
+
+class LowStockEvent(models.Model):
+    """Recorded when a stock level crosses its reorder point, in either direction"""
+    EVENT_TYPES = (
+        ('LOW', 'Low'),
+        ('RECOVERED', 'Recovered'),
+    )
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='low_stock_events')
+    # Empty for the product's total on-hand quantity rather than one location.
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, 
+                                 related_name='low_stock_events', null=True, blank=True)
+    event_type = models.CharField(max_length=10, choices=EVENT_TYPES)
+    quantity = models.IntegerField()
+    reorder_point = models.IntegerField()
+    timestamp = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['timestamp']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} {self.product_id} at {self.location_id}: {self.quantity}"
+
+class DemandForecastRun(models.Model):
+    """Parameters of a run_forecast() call; per-product results live on Product"""
+    method = models.CharField(max_length=30)
+    horizon_days = models.PositiveIntegerField()
+    history_days = models.PositiveIntegerField()
+    updated = models.PositiveIntegerField(default=0)
+    generated_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-id']
+    
+    def __str__(self):
+        return f"{self.method} forecast at {self.generated_at:%Y-%m-%d %H:%M}"
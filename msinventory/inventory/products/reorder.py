@@ -0,0 +1,87 @@
+from datetime import timedelta
+import numpy as np
+from django.db.models import Sum
+from django.utils import timezone
+from .counters import pending_deltas, striped_on_hand_enabled
+from .models import Product
+
+
+def outbound_totals(days=14, now=None, product_id=None):
+    """
+    Return (product_ids, quantities) arrays of completed outbound quantities over
+    the last ``days`` days (today included), from one grouped query on the
+    DailyMoveRollup table.
+    """
+    from inventory.stockmoves.models import DailyMoveRollup
+
+    today = timezone.localdate(now or timezone.now())
+    rollups = DailyMoveRollup.objects.filter(
+        day__gt=today - timedelta(days=days), day__lte=today, outbound_quantity__gt=0
+    )
+    if product_id is not None:
+        rollups = rollups.filter(product_id=product_id)
+    rows = list(
+        rollups.values('product_id').annotate(total=Sum('outbound_quantity'))
+        .order_by('product_id').values_list('product_id', 'total')
+    )
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    product_ids, totals = zip(*rows)
+    return np.array(product_ids, dtype=np.int64), np.array(totals, dtype=np.int64)
+
+
+def reorder_suggestions(days=14, min_daily_demand=1, max_days_of_supply=7,
+                        cover_days=14, min_reorder=10, now=None):
+    """
+    Suggest reorders for every product whose stock covers fewer than
+    ``max_days_of_supply`` days of its recent average daily demand.
+
+    Demand comes from a single grouped rollup query and on-hand quantities from a
+    single columnar fetch; days of supply and suggested quantities are then
+    computed with NumPy over the whole catalog at once. Results are sorted by
+    days of supply, most urgent first.
+    """
+    if days <= 0:
+        return []
+    demand_ids, demand_totals = outbound_totals(days, now=now)
+    if not len(demand_ids):
+        return []
+
+    catalog = np.array(
+        list(Product.objects.order_by('pk').values_list('pk', 'quantity_on_hand')), dtype=np.int64
+    ).reshape(-1, 2)
+    product_ids, on_hand = catalog[:, 0], catalog[:, 1].astype(np.float64)
+    if striped_on_hand_enabled():
+        # Only products with demand can be suggested, so only they need folding in.
+        for pk, delta in pending_deltas(demand_ids.tolist()).items():
+            on_hand[np.searchsorted(product_ids, pk)] += delta
+
+    daily_demand = np.zeros(len(product_ids))
+    positions = np.searchsorted(product_ids, demand_ids)
+    # Ignore demand for products deleted since the lines were written.
+    known = positions < len(product_ids)
+    known[known] = product_ids[positions[known]] == demand_ids[known]
+    daily_demand[positions[known]] = np.round(demand_totals[known] / days, 2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_supply = np.where(daily_demand > 0, on_hand / daily_demand, np.inf)
+    selected = np.flatnonzero(
+        (daily_demand >= min_daily_demand) & (daily_demand > 0) & (days_of_supply < max_days_of_supply)
+    )
+    selected = selected[np.argsort(days_of_supply[selected], kind='stable')]
+    suggested = np.maximum(np.round(daily_demand[selected] * cover_days), min_reorder)
+
+    names = dict(
+        Product.objects.filter(pk__in=product_ids[selected].tolist()).values_list('pk', 'name')
+    )
+    return [
+        {
+            'product': names[int(product_ids[index])],
+            'product_id': int(product_ids[index]),
+            'current_stock': int(on_hand[index]),
+            'daily_demand': float(daily_demand[index]),
+            'days_of_supply': round(float(days_of_supply[index]), 2),
+            'suggested_reorder': int(quantity),
+        }
+        for index, quantity in zip(selected, suggested)
+    ]
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Product, ProductCategory
+from .models import LowStockEvent, Product, ProductCategory
+from inventory.locations.models import Location
 from inventory.suppliers.serializers import SupplierSerializer
 from inventory.locations.serializers import LocationSerializer
 
@@ -16,10 +17,34 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
-        read_only_fields = ('quantity_on_hand', 'created_at', 'updated_at')
+        read_only_fields = (
+            'quantity_on_hand', 'forecast_demand', 'abc_class', 'xyz_class', 'created_at', 'updated_at'
+        )
 
 class ProductCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
-        read_only_fields = ('created_at', 'updated_at')
\ No newline at end of file
+        read_only_fields = ('forecast_demand', 'abc_class', 'xyz_class', 'created_at', 'updated_at')
+
+class LowStockEventSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    location_name = serializers.CharField(source='location.name', read_only=True, default=None)
+    
+    class Meta:
+        model = LowStockEvent
+        fields = '__all__'
+
+class ReorderPointSerializer(serializers.Serializer):
+    location_id = serializers.PrimaryKeyRelatedField(
+        queryset=Location.objects.all(), source='location', required=False, allow_null=True
+    )
+    reorder_point = serializers.IntegerField(allow_null=True, default=None)
+    max_quantity = serializers.IntegerField(allow_null=True, default=None)
+    
+    def validate(self, data):
+        reorder_point, max_quantity = data['reorder_point'], data['max_quantity']
+        if data.get('location') is not None and None not in (reorder_point, max_quantity):
+            if max_quantity < reorder_point:
+                raise serializers.ValidationError({'max_quantity': 'max_quantity cannot be below reorder_point'})
+        return data
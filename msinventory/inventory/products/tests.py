@@ -1,9 +1,22 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+import numpy as np
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from .models import Product, ProductCategory
+from .classification import abc_classes, xyz_classes
+from .counters import add_stock_deltas, fold_stock_deltas
+from .forecasting import (
+    demand_matrix, exponential_smoothing, get_forecast, moving_average, seasonal_naive
+)
+from .models import InventoryLevel, LowStockEvent, Product, ProductCategory, ProductStockDelta
 from inventory.suppliers.models import Supplier
+from utils.helpers import calculate_daily_demand, get_reorder_suggestions
 from inventory.locations.models import Location
 
 User = get_user_model()
@@ -134,4 +147,393 @@ class ProductAPITest(APITestCase):
         response = self.client.get('/api/products/low_stock/?threshold=10')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], "Low Stock")
\ No newline at end of file
+        self.assertEqual(response.data[0]['name'], "Low Stock")
+
+    def test_export_inventory_levels(self):
+        product = Product.objects.create(
+            name="Exported",
+            internal_reference="EX001",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category,
+            quantity_on_hand=12
+        )
+        other = Location.objects.create(code="WH2", name="Warehouse 2")
+        InventoryLevel.objects.create(product=product, location=self.location, quantity=7)
+        InventoryLevel.objects.create(product=product, location=other, quantity=5)
+        
+        response = self.client.get('/api/products/inventory_levels/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(rows[1].startswith(f'{product.id},EX001,Exported,{self.location.id},WH1,'))
+        
+        response = self.client.get(
+            '/api/products/inventory_levels/export/', {'output': 'ndjson', 'location_id': other.id}
+        )
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('"quantity": 5', lines[0])
+
+@override_settings(INVENTORY_STRIPED_ON_HAND=True, INVENTORY_ON_HAND_STRIPES=4)
+class StripedOnHandTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client.force_authenticate(user=self.user)
+        
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.product = Product.objects.create(
+            name="Hot Product",
+            internal_reference="HOT001",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category,
+            quantity_on_hand=0
+        )
+    
+    def test_moves_write_stripes_instead_of_product_row(self):
+        from inventory.stockmoves.models import StockMove, StockMoveLine
+        
+        for _ in range(5):
+            move = StockMove.objects.create(move_type="INBOUND", to_location=self.location)
+            StockMoveLine.objects.create(stock_move=move, product=self.product, quantity=3)
+            move.execute_move()
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_on_hand, 0)
+        stripes = ProductStockDelta.objects.filter(product=self.product)
+        self.assertLessEqual(stripes.count(), 4)
+        self.assertEqual(sum(stripe.quantity for stripe in stripes), 15)
+        
+        call_command('fold_stock_deltas', stdout=StringIO())
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_on_hand, 15)
+        self.assertFalse(ProductStockDelta.objects.exists())
+    
+    def test_retrieve_folds_pending_deltas(self):
+        add_stock_deltas({self.product.pk: 7})
+        add_stock_deltas({self.product.pk: -2})
+        
+        response = self.client.get(f'/api/products/{self.product.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['quantity_on_hand'], 5)
+        self.assertEqual(fold_stock_deltas([self.product.pk]), 0)
+
+class LowStockEventTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.product = Product.objects.create(
+            name="Watched",
+            internal_reference="WT001",
+            sales_price=100.00,
+            cost=50.00,
+            quantity_on_hand=10,
+            reorder_point=5
+        )
+        InventoryLevel.objects.create(product=self.product, location=self.location, quantity=10)
+    
+    def move(self, move_type, quantity):
+        location = 'to_location' if move_type == 'INBOUND' else 'from_location'
+        response = self.client.post('/api/stockmoves/', {
+            "move_type": move_type,
+            location: self.location.id,
+            "lines": [{"product": self.product.id, "quantity": quantity}]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    def events(self):
+        return list(
+            LowStockEvent.objects.order_by('id').values_list('location_id', 'event_type', 'quantity')
+        )
+    
+    def test_events_are_emitted_only_on_crossings(self):
+        response = self.client.post(
+            f'/api/products/{self.product.id}/reorder_point/',
+            {'location_id': self.location.id, 'reorder_point': 3}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.move('OUTBOUND', 6)
+        self.assertEqual(self.events(), [(None, 'LOW', 4)])
+        
+        self.move('OUTBOUND', 2)
+        self.assertEqual(self.events()[1:], [(self.location.id, 'LOW', 2)])
+        
+        self.move('OUTBOUND', 1)
+        self.assertEqual(len(self.events()), 2)
+        
+        self.move('INBOUND', 10)
+        self.assertEqual(
+            sorted(self.events()[2:], key=str),
+            sorted([(self.location.id, 'RECOVERED', 11), (None, 'RECOVERED', 11)], key=str)
+        )
+    
+    def test_event_feed_polls_after_id(self):
+        self.move('OUTBOUND', 6)
+        first = LowStockEvent.objects.get()
+        self.move('INBOUND', 6)
+        
+        response = self.client.get('/api/products/low-stock-events/', {'after_id': first.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([event['event_type'] for event in response.data['results']], ['RECOVERED'])
+        self.assertEqual(response.data['results'][0]['product_name'], "Watched")
+        
+        # Newer events come after older ones, so a small page never skips any.
+        self.move('OUTBOUND', 6)
+        response = self.client.get('/api/products/low-stock-events/', {'after_id': first.id})
+        self.assertEqual([event['event_type'] for event in response.data['results']], ['RECOVERED', 'LOW'])
+        response = self.client.get(
+            '/api/products/low-stock-events/', {'after_id': first.id, 'pagination': 'cursor', 'page_size': 1}
+        )
+        self.assertEqual([event['event_type'] for event in response.data['results']], ['RECOVERED'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([event['event_type'] for event in response.data['results']], ['LOW'])
+    
+    def test_low_stock_per_location_uses_level_reorder_points(self):
+        other = Location.objects.create(code="WH2", name="Warehouse 2")
+        InventoryLevel.objects.create(product=self.product, location=other, quantity=2, reorder_point=1)
+        response = self.client.post(
+            f'/api/products/{self.product.id}/reorder_point/',
+            {'location_id': self.location.id, 'reorder_point': 10, 'max_quantity': 25}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        response = self.client.get('/api/products/low_stock/', {'per_location': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['location'], self.location.id)
+        self.assertEqual(response.data[0]['order_quantity'], 15)
+        
+        response = self.client.get('/api/products/low_stock/', {'location_id': other.id})
+        self.assertEqual(response.data, [])
+        
+        response = self.client.post(
+            f'/api/products/{self.product.id}/reorder_point/',
+            {'location_id': other.id, 'reorder_point': 10, 'max_quantity': 5}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_reorder_point_at_new_location_starts_empty(self):
+        response = self.client.post(
+            f'/api/products/{self.product.id}/reorder_point/',
+            {'location_id': 'WH2', 'reorder_point': 3}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        other = Location.objects.create(code="WH2", name="Warehouse 2")
+        response = self.client.post(
+            f'/api/products/{self.product.id}/reorder_point/',
+            {'location_id': other.id, 'reorder_point': 3}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        level = InventoryLevel.objects.get(product=self.product, location=other)
+        self.assertEqual((level.quantity, level.reorder_point), (0, 3))
+    
+    def test_low_stock_levels_query_uses_partial_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = InventoryLevel.objects.filter(
+            quantity__lte=F('reorder_point'), location_id=self.location.id
+        ).explain()
+        self.assertIn('inventorylevel_short_idx', plan)
+    
+    def test_adjust_stock_emits_product_event(self):
+        self.product.update_quantity(-5)
+        self.assertEqual(self.events(), [(None, 'LOW', 5)])
+
+class ReorderSuggestionsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.fast, self.slow, self.idle = [
+            Product.objects.create(
+                name=name, internal_reference=name.upper(), sales_price=10.00, cost=5.00,
+                quantity_on_hand=100
+            )
+            for name in ("fast", "slow", "idle")
+        ]
+        for product in (self.fast, self.slow):
+            response = self.client.post('/api/stockmoves/', {
+                "move_type": "OUTBOUND",
+                "from_location": self.location.id,
+                "lines": [{"product": product.id, "quantity": 28}]
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        Product.objects.filter(pk=self.fast.pk).update(quantity_on_hand=10)
+    
+    def test_daily_demand_reads_move_lines(self):
+        demand = calculate_daily_demand(self.fast.id)
+        self.assertEqual(demand['total_quantity'], 28)
+        self.assertEqual(demand['daily_demand'], 2.0)
+        self.assertEqual(calculate_daily_demand(self.idle.id)['total_quantity'], 0)
+    
+    def test_suggestions_use_constant_queries(self):
+        with self.assertNumQueries(3):
+            suggestions = get_reorder_suggestions()
+        self.assertEqual(suggestions, [{
+            'product': 'fast',
+            'product_id': self.fast.id,
+            'current_stock': 10,
+            'daily_demand': 2.0,
+            'days_of_supply': 5.0,
+            'suggested_reorder': 28,
+        }])
+    
+    def test_reorder_suggestions_endpoint(self):
+        response = self.client.get('/api/products/reorder_suggestions/', {'max_days_of_supply': 60})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['product_id'] for row in response.data], [self.fast.id, self.slow.id])
+        
+        response = self.client.get('/api/products/reorder_suggestions/', {'days': 'two'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class DemandForecastTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.product = Product.objects.create(
+            name="Forecast", internal_reference="FC001", sales_price=10.00, cost=5.00,
+            quantity_on_hand=100
+        )
+        self.idle = Product.objects.create(
+            name="Idle", internal_reference="FC002", sales_price=10.00, cost=5.00,
+            quantity_on_hand=5
+        )
+        self.client.post('/api/stockmoves/', {
+            "move_type": "OUTBOUND",
+            "from_location": self.location.id,
+            "lines": [{"product": self.product.id, "quantity": 28}]
+        }, format='json')
+    
+    def test_models_are_vectorized_over_products(self):
+        matrix = np.array([[0, 0, 7, 7], [4, 0, 0, 0]], dtype=float)
+        np.testing.assert_allclose(moving_average(matrix, 3, window=2), [[7, 7, 7], [0, 0, 0]])
+        np.testing.assert_allclose(exponential_smoothing(matrix, 1, alpha=0.5)[:, 0], [5.25, 0.5])
+        np.testing.assert_allclose(seasonal_naive(matrix, 5, season=2), [[7, 7, 7, 7, 7], [0, 0, 0, 0, 0]])
+    
+    def test_demand_matrix_has_a_row_per_product(self):
+        product_ids, matrix = demand_matrix(history_days=7)
+        self.assertEqual(product_ids.tolist(), [self.product.id, self.idle.id])
+        self.assertEqual(matrix.shape, (2, 7))
+        self.assertEqual(matrix[0, -1], 28)
+        self.assertEqual(matrix.sum(), 28)
+    
+    def test_run_updates_forecasted_quantity_and_is_stored(self):
+        self.assertIsNone(get_forecast())
+        response = self.client.get('/api/products/forecast/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+        response = self.client.post('/api/products/forecast/', {'method': 'moving_average'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(response.data['results'][0], {'product_id': self.product.id, 'forecast_demand': 28})
+        
+        self.product.refresh_from_db()
+        self.idle.refresh_from_db()
+        self.assertEqual(self.product.forecasted_quantity, 72 - 28)
+        self.assertEqual(self.product.forecast_demand, 28)
+        self.assertEqual(self.idle.forecasted_quantity, 5)
+        
+        # Reads the stored run and the products' stored demand, nothing more.
+        with self.assertNumQueries(2):
+            self.assertEqual(get_forecast()['method'], 'moving_average')
+        response = self.client.get('/api/products/forecast/', {'product_id': self.idle.id})
+        self.assertEqual(response.data['results'], [{'product_id': self.idle.id, 'forecast_demand': 0}])
+        
+        call_command('forecast_demand', '--method', 'seasonal_naive', stdout=StringIO())
+        response = self.client.get('/api/products/forecast/', {'limit': 1})
+        self.assertEqual(response.data['method'], 'seasonal_naive')
+        self.assertEqual(response.data['results'], [{'product_id': self.product.id, 'forecast_demand': 56}])
+        
+        response = self.client.post('/api/products/forecast/', {'method': 'magic'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        with override_settings(FORECAST_MAX_HORIZON=30, FORECAST_MAX_HISTORY_DAYS=90):
+            for data in ({'horizon': 31}, {'history_days': 91}, {'horizon': 0}):
+                response = self.client.post(
+                    '/api/products/forecast/', data, format='json'
+                )
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(get_forecast()['method'], 'seasonal_naive')
+
+class ProductClassificationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        from inventory.stockmoves.models import DailyMoveRollup
+        
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.steady = Product.objects.create(
+            name="Steady", internal_reference="CL001", sales_price=20.00, cost=10.00
+        )
+        self.lumpy = Product.objects.create(
+            name="Lumpy", internal_reference="CL002", sales_price=10.00, cost=5.00
+        )
+        self.idle = Product.objects.create(
+            name="Idle", internal_reference="CL003", sales_price=2.00, cost=1.00
+        )
+        today = timezone.localdate()
+        DailyMoveRollup.objects.bulk_create([
+            DailyMoveRollup(
+                product=self.steady, location=self.location,
+                day=today - timedelta(days=7 * week), outbound_quantity=10
+            )
+            for week in range(8)
+        ] + [
+            DailyMoveRollup(
+                product=self.lumpy, location=self.location,
+                day=today - timedelta(days=20), outbound_quantity=24
+            )
+        ])
+    
+    def test_classes_are_vectorized(self):
+        values = np.array([0, 50, 900, 40, 10], dtype=float)
+        self.assertEqual(abc_classes(values).tolist(), ['C', 'B', 'A', 'C', 'C'])
+        self.assertEqual(abc_classes(np.zeros(2)).tolist(), ['C', 'C'])
+        
+        matrix = np.array([[5, 5, 5, 5], [1, 7, 1, 7], [0, 0, 0, 12], [0, 0, 0, 0]], dtype=float)
+        classes, cv = xyz_classes(matrix)
+        self.assertEqual(classes.tolist(), ['X', 'Y', 'Z', 'Z'])
+        self.assertAlmostEqual(cv[1], 0.75)
+        self.assertTrue(np.isnan(cv[3]))
+    
+    def test_classification_is_stored_and_filterable(self):
+        response = self.client.post('/api/products/classification/', {'days': 56}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['classified'], 3)
+        self.assertEqual(response.data['total_value'], 920)
+        self.assertEqual(response.data['counts']['AX'], 1)
+        self.assertEqual(response.data['counts']['BZ'], 1)
+        self.assertEqual(response.data['counts']['CZ'], 1)
+        
+        response = self.client.get('/api/products/', {'abc_class': 'a'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.steady.id])
+        response = self.client.get('/api/products/', {'xyz_class': 'Z', 'abc_class': 'B,C'})
+        self.assertEqual(
+            [product['id'] for product in response.data['results']], [self.lumpy.id, self.idle.id]
+        )
+        
+        response = self.client.get('/api/products/classification/')
+        self.assertEqual(response.data['counts'], {'AX': 1, 'BZ': 1, 'CZ': 1})
+        
+        out = StringIO()
+        call_command('classify_products', '--days', '56', stdout=out)
+        self.assertIn('Classified 3 products, updated 0', out.getvalue())
+        
+        response = self.client.post('/api/products/classification/', {'a_share': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
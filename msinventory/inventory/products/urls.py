@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, ProductCategoryViewSet
+from .views import ProductViewSet, ProductCategoryViewSet, LowStockEventViewSet
 
 router = DefaultRouter()
 router.register(r'categories', ProductCategoryViewSet)
+router.register(r'low-stock-events', LowStockEventViewSet)
 router.register(r'', ProductViewSet)
 
 urlpatterns = [
@@ -2,22 +2,76 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db import transaction
-from .models import Product, ProductCategory
-from .serializers import ProductSerializer, ProductCategorySerializer, ProductCreateSerializer
+from .counters import fold_stock_deltas, striped_on_hand_enabled
+from .models import LowStockEvent, Product, ProductCategory
+from .serializers import (
+    LowStockEventSerializer, ProductSerializer, ProductCategorySerializer, ProductCreateSerializer,
+    ReorderPointSerializer
+)
 from utils.exceptions import InsufficientStockException
+from utils.helpers import parse_timestamp
+from utils.pagination import KeysetPaginationMixin
+from utils.streaming import EXPORT_FORMATS, streaming_export
 
 class ProductCategoryViewSet(viewsets.ModelViewSet):
     queryset = ProductCategory.objects.all()
     serializer_class = ProductCategorySerializer
 
-class ProductViewSet(viewsets.ModelViewSet):
+class LowStockEventViewSet(KeysetPaginationMixin, viewsets.ReadOnlyModelViewSet):
+    """Reorder point crossings recorded by stock moves; poll with ``after_id``"""
+    queryset = LowStockEvent.objects.all().select_related('product', 'location')
+    serializer_class = LowStockEventSerializer
+    keyset_ordering = ('-id',)
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        
+        if params.get('product_id'):
+            queryset = queryset.filter(product_id=params['product_id'])
+        if params.get('location_id'):
+            queryset = queryset.filter(location_id=params['location_id'])
+        if params.get('event_type'):
+            queryset = queryset.filter(event_type=params['event_type'])
+        if params.get('after_id'):
+            # Polling reads forward from the last seen event, oldest first, so a
+            # page never skips events older than the ones it returns.
+            queryset = queryset.filter(id__gt=params['after_id']).order_by('id')
+        
+        return queryset
+    
+    def get_keyset_ordering(self):
+        if self.request.query_params.get('after_id'):
+            return ('id',)
+        return self.keyset_ordering
+
+class ProductViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all().select_related('product_category', 'supplier', 'default_location')
+    keyset_ordering = ('id',)
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        
+        # Accepts one class or several, e.g. ?abc_class=A,B
+        if params.get('abc_class'):
+            queryset = queryset.filter(abc_class__in=params['abc_class'].upper().split(','))
+        if params.get('xyz_class'):
+            queryset = queryset.filter(xyz_class__in=params['xyz_class'].upper().split(','))
+        
+        return queryset
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return ProductCreateSerializer
         return ProductSerializer
     
+    def get_object(self):
+        product = super().get_object()
+        if striped_on_hand_enabled() and fold_stock_deltas([product.pk]):
+            product.refresh_from_db(fields=['quantity_on_hand', 'updated_at'])
+        return product
+    
     @action(detail=True, methods=['post'])
     def adjust_stock(self, request, pk=None):
         product = self.get_object()
@@ -36,8 +90,49 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=True, methods=['post'])
+    def reorder_point(self, request, pk=None):
+        """
+        Set the reorder point of the product, or the reorder point and optional
+        ``max_quantity`` of its level at ``location_id``
+        """
+        product = self.get_object()
+        serializer = ReorderPointSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        values = serializer.validated_data
+        location = values.get('location')
+        
+        if location is None:
+            product.reorder_point = values['reorder_point']
+            product.save(update_fields=['reorder_point', 'updated_at'])
+            return Response({'product': product.id, 'reorder_point': product.reorder_point})
+        
+        from .models import InventoryLevel
+        
+        # A level created here holds no stock yet; seeding it from quantity_on_hand
+        # would add stock that no ledger entry accounts for.
+        level, _ = InventoryLevel.objects.get_or_create(
+            product=product, location=location, defaults={'quantity': 0}
+        )
+        level.reorder_point = values['reorder_point']
+        level.max_quantity = values['max_quantity']
+        level.save(update_fields=['reorder_point', 'max_quantity', 'last_updated'])
+        return Response({
+            'product': product.id,
+            'location': location.id,
+            'reorder_point': level.reorder_point,
+            'max_quantity': level.max_quantity,
+        })
+    
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
+        """
+        Products at or below ``threshold`` on hand, or with ``per_location=true``
+        (or a ``location_id``) the levels at or below their own reorder point
+        """
+        if request.query_params.get('per_location') == 'true' or request.query_params.get('location_id'):
+            return self.low_stock_levels(request)
+        
         threshold = request.query_params.get('threshold', 10)
         try:
             threshold = int(threshold)
@@ -48,14 +143,178 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(products, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def reorder_suggestions(self, request):
+        """Products whose stock covers too few days of recent outbound demand"""
+        params = {}
+        for name, cast, default in (
+            ('days', int, 14),
+            ('min_daily_demand', float, 1),
+            ('max_days_of_supply', float, 7),
+            ('cover_days', int, 14),
+        ):
+            try:
+                params[name] = cast(request.query_params.get(name, default))
+            except ValueError:
+                return Response(
+                    {'error': f'{name} must be a number'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        from .reorder import reorder_suggestions
+        
+        return Response(reorder_suggestions(**params))
+    
+    @action(detail=False, methods=['get', 'post'])
+    def forecast(self, request):
+        """
+        GET the last stored demand forecast (top ``limit`` products, or one
+        ``product_id``); POST to rerun it with ``method``, ``horizon`` and
+        ``history_days`` and update forecasted quantities
+        """
+        from .forecasting import get_forecast, run_forecast
+        
+        if request.method == 'POST':
+            try:
+                run_forecast(
+                    method=request.data.get('method', 'exponential_smoothing'),
+                    horizon=int(request.data.get('horizon', 14)),
+                    history_days=int(request.data.get('history_days', 56)),
+                )
+            except (TypeError, ValueError) as e:
+                return Response(
+                    {'error': str(e)}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        product_id = request.query_params.get('product_id')
+        try:
+            product_id = None if product_id is None else int(product_id)
+            limit = int(request.query_params.get('limit', 100))
+        except ValueError:
+            return Response(
+                {'error': 'product_id and limit must be integers'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        result = get_forecast(product_id=product_id, limit=max(limit, 0))
+        if result is None:
+            return Response(
+                {'error': 'No demand forecast has been run yet; POST to run one'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(result)
+    
+    @action(detail=False, methods=['get', 'post'])
+    def classification(self, request):
+        """
+        GET the product count per ABC/XYZ class; POST to reclassify the catalog
+        with ``days``, ``a_share``, ``b_share``, ``x_cv`` and ``y_cv``
+        """
+        if request.method == 'POST':
+            from .classification import classify_products
+            
+            params = {}
+            for name, cast in (('days', int), ('a_share', float), ('b_share', float),
+                               ('x_cv', float), ('y_cv', float)):
+                if request.data.get(name) is not None:
+                    try:
+                        params[name] = cast(request.data[name])
+                    except (TypeError, ValueError):
+                        return Response(
+                            {'error': f'{name} must be a number'}, 
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+            try:
+                return Response(classify_products(**params))
+            except ValueError as e:
+                return Response(
+                    {'error': str(e)}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        from django.db.models import Count
+        
+        counts = {
+            f"{row['abc_class'] or '-'}{row['xyz_class'] or '-'}": row['count']
+            for row in Product.objects.order_by().values('abc_class', 'xyz_class').annotate(count=Count('id'))
+        }
+        return Response({'counts': dict(sorted(counts.items()))})
+    
+    def low_stock_levels(self, request):
+        from django.db.models import F
+        from django.db.models.functions import Coalesce
+        from .models import InventoryLevel
+        
+        # Matches the partial index predicate, so only short levels are read.
+        levels = InventoryLevel.objects.filter(quantity__lte=F('reorder_point'))
+        location_id = request.query_params.get('location_id')
+        if location_id:
+            levels = levels.filter(location_id=location_id)
+        
+        levels = levels.order_by('location_id', 'product_id').annotate(
+            order_quantity=Coalesce('max_quantity', 'reorder_point') - F('quantity')
+        ).values(
+            'product_id', 'product__name', 'product__internal_reference',
+            'location_id', 'location__code', 'quantity', 'reorder_point',
+            'max_quantity', 'order_quantity',
+        )
+        return Response([
+            {
+                'product': level['product_id'],
+                'product_name': level['product__name'],
+                'product_sku': level['product__internal_reference'],
+                'location': level['location_id'],
+                'location_code': level['location__code'],
+                'quantity': level['quantity'],
+                'reorder_point': level['reorder_point'],
+                'max_quantity': level['max_quantity'],
+                'order_quantity': level['order_quantity'],
+            }
+            for level in levels
+        ])
+    
     @action(detail=False, methods=['get'])
     def inventory_levels(self, request):
-        """Get real-time inventory levels for products"""
+        """Get real-time inventory levels for products, or the levels at ``as_of`` when given"""
         product_id = request.query_params.get('product_id')
         location_id = request.query_params.get('location_id')
+        as_of = request.query_params.get('as_of')
         
         from .models import InventoryLevel
         
+        if as_of:
+            try:
+                as_of = parse_timestamp(as_of)
+            except ValueError:
+                return Response(
+                    {'error': 'as_of must be an ISO 8601 date or timestamp'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            from inventory.locations.models import Location
+            from inventory.snapshots.history import inventory_as_of
+            
+            quantities = inventory_as_of(as_of, product_id=product_id, location_id=location_id)
+            products = Product.objects.in_bulk({product for product, _ in quantities})
+            locations = Location.objects.in_bulk({location for _, location in quantities})
+            
+            inventory_data = {}
+            for (product, location), quantity in sorted(quantities.items()):
+                if product not in inventory_data:
+                    inventory_data[product] = {
+                        'product_name': products[product].name,
+                        'product_sku': products[product].internal_reference,
+                        'locations': {}
+                    }
+                inventory_data[product]['locations'][location] = {
+                    'location_name': locations[location].name,
+                    'location_code': locations[location].code,
+                    'quantity': quantity,
+                    'last_updated': as_of
+                }
+            return Response(inventory_data)
+        
         levels = InventoryLevel.objects.select_related('product', 'location')
         
         if product_id:
@@ -79,4 +338,34 @@ class ProductViewSet(viewsets.ModelViewSet):
                 'last_updated': level.last_updated
             }
         
-        return Response(inventory_data)
\ No newline at end of file
+        return Response(inventory_data)
+    
+    @action(detail=False, methods=['get'], url_path='inventory_levels/export')
+    def export_inventory_levels(self, request):
+        """Stream inventory levels as CSV or NDJSON (``?output=csv|ndjson``)"""
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"output must be one of: {', '.join(EXPORT_FORMATS)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        from .models import InventoryLevel
+        
+        levels = InventoryLevel.objects.all()
+        product_id = request.query_params.get('product_id')
+        location_id = request.query_params.get('location_id')
+        if product_id:
+            levels = levels.filter(product_id=product_id)
+        if location_id:
+            levels = levels.filter(location_id=location_id)
+        
+        fields = [
+            'product_id', 'product_internal_reference', 'product_name',
+            'location_id', 'location_code', 'location_name', 'quantity', 'last_updated',
+        ]
+        rows = levels.order_by('product_id', 'location_id').values_list(
+            'product_id', 'product__internal_reference', 'product__name',
+            'location_id', 'location__code', 'location__name', 'quantity', 'last_updated',
+        ).iterator(chunk_size=2000)
+        return streaming_export(fields, rows, export_format, 'inventory_levels')
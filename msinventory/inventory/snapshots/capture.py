@@ -0,0 +1,41 @@
+from django.db import connection, transaction
+from django.utils import timezone
+from inventory.locations.models import Location
+from inventory.products.models import InventoryLevel
+from .models import InventorySnapshot
+
+
+@transaction.atomic
+def capture_snapshots(note="Automated snapshot", chunk_size=50000):
+    """
+    Snapshot every stocked product/location pair at active locations.
+
+    Rows are copied from InventoryLevel with ``INSERT ... SELECT`` in chunks of
+    ``chunk_size`` level ids, so nothing is loaded into Python. All rows share
+    one timestamp. Returns the number of snapshots created.
+    """
+    quote = connection.ops.quote_name
+    snapshots = quote(InventorySnapshot._meta.db_table)
+    levels = quote(InventoryLevel._meta.db_table)
+    locations = quote(Location._meta.db_table)
+    timestamp = timezone.now()
+    
+    created, last_id = 0, 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                f"WITH chunk AS ("
+                f"  SELECT l.id, l.product_id, l.location_id, l.quantity "
+                f"  FROM {levels} l JOIN {locations} loc ON loc.id = l.location_id "
+                f"  WHERE loc.is_active AND l.id > %s ORDER BY l.id LIMIT %s"
+                f"), inserted AS ("
+                f"  INSERT INTO {snapshots} (product_id, location_id, quantity, timestamp, note) "
+                f"  SELECT product_id, location_id, quantity, %s, %s FROM chunk RETURNING 1"
+                f") "
+                f"SELECT (SELECT MAX(id) FROM chunk), (SELECT COUNT(*) FROM inserted)",
+                [last_id, chunk_size, timestamp, note],
+            )
+            last_id, count = cursor.fetchone()
+            created += count
+            if last_id is None or count < chunk_size:
+                return created
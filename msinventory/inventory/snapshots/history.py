@@ -0,0 +1,196 @@
+from django.db import connection
+from inventory.stockmoves.models import StockMove, StockMoveLine
+from .models import InventorySnapshot
+
+
+def _pairs_cte(snapshots, filters):
+    """
+    Return a recursive ``pairs`` CTE listing each snapshotted (product, location).
+
+    PostgreSQL has no skip scan, so ``DISTINCT ON`` would read every snapshot.
+    This loose index scan walks the (product, location, -timestamp) index one
+    pair at a time instead. ``filters`` appear twice, so their params do too.
+    """
+    return (
+        f"pairs AS ("
+        f"  (SELECT s.product_id, s.location_id FROM {snapshots} s WHERE TRUE{filters} "
+        f"  ORDER BY s.product_id, s.location_id LIMIT 1) "
+        f"  UNION ALL "
+        f"  SELECT next.product_id, next.location_id FROM pairs p CROSS JOIN LATERAL ("
+        f"    SELECT s.product_id, s.location_id FROM {snapshots} s "
+        f"    WHERE (s.product_id, s.location_id) > (p.product_id, p.location_id)"
+        f"{filters} "
+        f"    ORDER BY s.product_id, s.location_id LIMIT 1"
+        f"  ) next"
+        f")"
+    )
+
+
+def latest_snapshots(product_id=None, location_id=None):
+    """
+    Return the latest snapshot values per (product, location) pair.
+
+    Pairs come from a loose index scan and a LATERAL ``ORDER BY timestamp
+    DESC LIMIT 1`` per pair reads only its newest snapshot.
+    """
+    from inventory.locations.models import Location
+    from inventory.products.models import Product
+
+    quote = connection.ops.quote_name
+    snapshots = quote(InventorySnapshot._meta.db_table)
+    products = quote(Product._meta.db_table)
+    locations = quote(Location._meta.db_table)
+
+    filters, params = '', []
+    if product_id:
+        filters += ' AND s.product_id = %s'
+        params.append(product_id)
+    if location_id:
+        filters += ' AND s.location_id = %s'
+        params.append(location_id)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH RECURSIVE {_pairs_cte(snapshots, filters)} "
+            f"SELECT p.product_id, pr.name, p.location_id, l.name, latest.quantity "
+            f"FROM pairs p CROSS JOIN LATERAL ("
+            f"  SELECT s.quantity FROM {snapshots} s "
+            f"  WHERE s.product_id = p.product_id AND s.location_id = p.location_id "
+            f"  ORDER BY s.timestamp DESC LIMIT 1"
+            f") latest "
+            f"JOIN {products} pr ON pr.id = p.product_id "
+            f"JOIN {locations} l ON l.id = p.location_id "
+            f"ORDER BY p.product_id, p.location_id",
+            params + params,
+        )
+        columns = ('product_id', 'product__name', 'location_id', 'location__name', 'quantity')
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def inventory_as_of(as_of, product_id=None, location_id=None):
+    """
+    Return {(product_id, location_id): quantity} at ``as_of``.
+
+    Each pair starts from its latest snapshot taken at or before ``as_of``,
+    found per pair through the snapshot index, and replays only the lines of
+    moves completed (by ``completed_at``) between that snapshot and
+    ``as_of``, all in one query. Pairs with an inventory level but no
+    snapshot are replayed from the beginning of their product's history.
+    """
+    from inventory.products.models import InventoryLevel
+
+    quote = connection.ops.quote_name
+    snapshots = quote(InventorySnapshot._meta.db_table)
+    moves = quote(StockMove._meta.db_table)
+    lines = quote(StockMoveLine._meta.db_table)
+    levels = quote(InventoryLevel._meta.db_table)
+
+    filters, filter_params = '', []
+    if product_id:
+        filters += ' AND {0}.product_id = %s'
+        filter_params.append(product_id)
+    if location_id:
+        filters += ' AND {0}.location_id = %s'
+        filter_params.append(location_id)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH RECURSIVE {_pairs_cte(snapshots, filters.format('s'))}, base AS ("
+            f"  SELECT p.product_id, p.location_id, latest.quantity, latest.timestamp "
+            f"  FROM pairs p CROSS JOIN LATERAL ("
+            f"    SELECT s.quantity, s.timestamp FROM {snapshots} s "
+            f"    WHERE s.product_id = p.product_id AND s.location_id = p.location_id "
+            f"    AND s.timestamp <= %s ORDER BY s.timestamp DESC LIMIT 1"
+            f"  ) latest"
+            f"), starts AS ("
+            f"  SELECT product_id, location_id, quantity, timestamp FROM base "
+            f"  UNION ALL "
+            # Pairs that have to be replayed from the start of history.
+            f"  SELECT i.product_id, i.location_id, NULL, NULL FROM {levels} i "
+            f"  WHERE NOT EXISTS (SELECT 1 FROM base b "
+            f"    WHERE b.product_id = i.product_id AND b.location_id = i.location_id)"
+            f"{filters.format('i')}"
+            f") "
+            f"SELECT s.product_id, s.location_id, "
+            f"COALESCE(s.quantity, 0) + COALESCE(r.delta, 0) "
+            f"FROM starts s CROSS JOIN LATERAL ("
+            f"  SELECT COUNT(*) AS replayed, SUM("
+            f"    CASE WHEN m.to_location_id = s.location_id "
+            f"    AND m.move_type IN ('INBOUND', 'TRANSFER') THEN l.quantity ELSE 0 END"
+            f"    - CASE WHEN m.from_location_id = s.location_id "
+            f"    AND m.move_type IN ('OUTBOUND', 'TRANSFER') "
+            f"    THEN l.quantity ELSE 0 END"
+            f"  ) AS delta "
+            f"  FROM {lines} l JOIN {moves} m ON m.id = l.stock_move_id "
+            f"  WHERE l.product_id = s.product_id AND m.completed "
+            f"  AND (m.to_location_id = s.location_id "
+            f"  OR m.from_location_id = s.location_id) "
+            f"  AND (s.timestamp IS NULL OR m.completed_at > s.timestamp) "
+            f"  AND m.completed_at <= %s"
+            f") r "
+            f"WHERE s.timestamp IS NOT NULL OR r.replayed > 0",
+            filter_params + filter_params + [as_of] + filter_params + [as_of],
+        )
+        return {(product, location): quantity for product, location, quantity in cursor.fetchall()}
+
+
+def snapshot_diff(from_time, to_time, location_id=None, category_id=None, chunk_size=2000):
+    """
+    Yield the product/location pairs whose latest snapshot changed between two times.
+
+    Pairs come from the loose index scan in ``_pairs_cte`` and each side is a
+    LATERAL lookup of the pair's latest snapshot at or before the given time,
+    so neither side reads the full history; pairs missing on one side count
+    as zero. Rows are read through a server-side cursor ``chunk_size`` at a
+    time.
+    """
+    from inventory.locations.models import Location
+    from inventory.products.models import Product
+
+    quote = connection.ops.quote_name
+    snapshots = quote(InventorySnapshot._meta.db_table)
+    products = quote(Product._meta.db_table)
+    locations = quote(Location._meta.db_table)
+
+    filters, filter_params = '', []
+    if location_id:
+        filters += ' AND s.location_id = %s'
+        filter_params.append(location_id)
+    if category_id:
+        filters += f' AND s.product_id IN (SELECT id FROM {products} WHERE product_category_id = %s)'
+        filter_params.append(category_id)
+
+    latest = (
+        f"SELECT s.quantity FROM {snapshots} s "
+        f"WHERE s.product_id = p.product_id AND s.location_id = p.location_id "
+        f"AND s.timestamp <= %s ORDER BY s.timestamp DESC LIMIT 1"
+    )
+
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(
+            f"WITH RECURSIVE {_pairs_cte(snapshots, filters)} "
+            f"SELECT p.product_id, pr.name, p.location_id, loc.name, "
+            f"COALESCE(b.quantity, 0), COALESCE(a.quantity, 0) "
+            f"FROM pairs p "
+            f"LEFT JOIN LATERAL ({latest}) b ON TRUE "
+            f"LEFT JOIN LATERAL ({latest}) a ON TRUE "
+            f"JOIN {products} pr ON pr.id = p.product_id "
+            f"JOIN {locations} loc ON loc.id = p.location_id "
+            f"WHERE COALESCE(b.quantity, 0) <> COALESCE(a.quantity, 0) "
+            f"ORDER BY p.product_id, p.location_id",
+            filter_params + filter_params + [from_time, to_time],
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            for product_id, product_name, location_id, location_name, before, after in rows:
+                yield {
+                    'product_id': product_id,
+                    'product_name': product_name,
+                    'location_id': location_id,
+                    'location_name': location_name,
+                    'from_quantity': before,
+                    'to_quantity': after,
+                    'delta': after - before,
+                }
@@ -0,0 +1,39 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from inventory.snapshots.models import InventorySnapshot
+from utils.partitions import (
+    drop_partitions_before, ensure_partitions, is_partitioned, partition_table
+)
+
+class Command(BaseCommand):
+    help = 'Partition inventory snapshots by month and maintain upcoming and expired partitions'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Convert the snapshot table to a partitioned table first')
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Number of future monthly partitions to keep ready')
+        parser.add_argument('--retain-days', type=int,
+                            help='Drop partitions that end more than this many days ago')
+    
+    def handle(self, *args, **options):
+        try:
+            if options['convert']:
+                partition_table(InventorySnapshot, months_ahead=options['months_ahead'])
+                self.stdout.write('Converted snapshots to a partitioned table')
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        if not is_partitioned(InventorySnapshot):
+            raise CommandError('Snapshots are not partitioned; run with --convert first')
+        
+        created = ensure_partitions(InventorySnapshot, months_ahead=options['months_ahead'])
+        self.stdout.write(f'Created {len(created)} partitions')
+        
+        if options['retain_days']:
+            cutoff = timezone.now() - timedelta(days=options['retain_days'])
+            dropped = drop_partitions_before(InventorySnapshot, cutoff)
+            self.stdout.write(f'Dropped {len(dropped)} partitions')
+        
+        self.stdout.write(self.style.SUCCESS('Snapshot partitions are up to date'))
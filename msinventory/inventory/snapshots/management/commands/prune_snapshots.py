@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.snapshots.retention import apply_retention
+
+class Command(BaseCommand):
+    help = 'Downsample and delete old inventory snapshots according to SNAPSHOT_RETENTION'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--full-days', type=int, help='Keep every snapshot this many days')
+        parser.add_argument('--daily-days', type=int, help='Keep one snapshot per day until this age')
+        parser.add_argument('--monthly-days', type=int, help='Delete snapshots older than this')
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+    
+    def handle(self, *args, **options):
+        try:
+            report = apply_retention(
+                dry_run=options['dry_run'],
+                FULL_DAYS=options['full_days'],
+                DAILY_DAYS=options['daily_days'],
+                MONTHLY_DAYS=options['monthly_days'],
+                BATCH_SIZE=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        for step, count in report.items():
+            if step != 'total':
+                self.stdout.write(f'{step}: {count}')
+        self.stdout.write(self.style.SUCCESS(f"{verb} {report['total']} snapshot rows"))
@@ -12,6 +12,10 @@ class InventorySnapshot(models.Model):
     class Meta:
         ordering = ['-timestamp']
         unique_together = ['product', 'location', 'timestamp']
+        indexes = [
+            models.Index(fields=['product', 'location', '-timestamp']),
+            models.Index(fields=['timestamp', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.product.name} at {self.location.code}: {self.quantity}"
\ No newline at end of file
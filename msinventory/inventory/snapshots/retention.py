@@ -0,0 +1,113 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from utils.partitions import drop_partitions_before, is_partitioned
+from .models import InventorySnapshot
+
+DEFAULT_POLICY = {
+    'FULL_DAYS': 30,
+    'DAILY_DAYS': 365,
+    'MONTHLY_DAYS': None,
+    'BATCH_SIZE': 10000,
+}
+
+
+def get_policy(**overrides):
+    policy = dict(DEFAULT_POLICY)
+    policy.update(getattr(settings, 'SNAPSHOT_RETENTION', {}))
+    policy.update({key: value for key, value in overrides.items() if value is not None})
+    if policy['DAILY_DAYS'] < policy['FULL_DAYS']:
+        raise ValueError("DAILY_DAYS must not be shorter than FULL_DAYS")
+    if policy['MONTHLY_DAYS'] and policy['MONTHLY_DAYS'] < policy['DAILY_DAYS']:
+        raise ValueError("MONTHLY_DAYS must not be shorter than DAILY_DAYS")
+    if not isinstance(policy['BATCH_SIZE'], int) or policy['BATCH_SIZE'] <= 0:
+        raise ValueError("BATCH_SIZE must be a positive integer")
+    return policy
+
+
+def _redundant_ids(table, bucket, start, end):
+    """SQL selecting snapshots that are not the last of their pair and ``bucket``"""
+    lower = 'AND timestamp >= %s ' if start else ''
+    sql = (
+        f"SELECT id FROM ("
+        f"  SELECT id, ROW_NUMBER() OVER ("
+        f"    PARTITION BY product_id, location_id, date_trunc('{bucket}', timestamp) "
+        f"    ORDER BY timestamp DESC"
+        f"  ) AS position FROM {table} WHERE timestamp < %s {lower}"
+        f") ranked WHERE position > 1"
+    )
+    return sql, [end] + ([start] if start else [])
+
+
+def _expired_ids(table, end):
+    return f"SELECT id FROM {table} WHERE timestamp < %s", [end]
+
+
+def _delete_in_batches(table, select, *args, batch_size, dry_run):
+    sql, params = select(table, *args)
+    with connection.cursor() as cursor:
+        if dry_run:
+            cursor.execute(f"SELECT COUNT(*) FROM ({sql}) doomed", params)
+            return cursor.fetchone()[0]
+        
+        # The doomed ids are computed once up front; batches then walk them in id
+        # order instead of re-running the selection for every batch.
+        cursor.execute("CREATE TEMPORARY TABLE doomed_snapshots (id bigint PRIMARY KEY)")
+        try:
+            cursor.execute(f"INSERT INTO doomed_snapshots {sql}", params)
+            deleted, last_id = 0, 0
+            while True:
+                # Each batch commits on its own so no lock outlives one batch.
+                with transaction.atomic():
+                    cursor.execute(
+                        f"WITH batch AS ("
+                        f"  SELECT id FROM doomed_snapshots WHERE id > %s ORDER BY id LIMIT %s"
+                        f"), gone AS ("
+                        f"  DELETE FROM {table} WHERE id IN (SELECT id FROM batch) RETURNING 1"
+                        f") SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM gone)",
+                        [last_id, batch_size],
+                    )
+                    last_id, count = cursor.fetchone()
+                deleted += count
+                if last_id is None:
+                    return deleted
+        finally:
+            cursor.execute("DROP TABLE doomed_snapshots")
+
+
+def apply_retention(now=None, dry_run=False, **overrides):
+    """
+    Downsample and expire old snapshots according to the retention policy.
+
+    Snapshots younger than FULL_DAYS are kept. Up to DAILY_DAYS only the last
+    snapshot of each day per product/location survives, beyond that the last
+    one of each month, and anything older than MONTHLY_DAYS (when set) is
+    removed; on a partitioned table whole expired months are dropped first.
+    Returns the number of rows (or partitions) reclaimed by each step.
+    """
+    policy = get_policy(**overrides)
+    now = now or timezone.now()
+    table = connection.ops.quote_name(InventorySnapshot._meta.db_table)
+    batch_size = policy['BATCH_SIZE']
+    full_cutoff = now - timedelta(days=policy['FULL_DAYS'])
+    daily_cutoff = now - timedelta(days=policy['DAILY_DAYS'])
+    monthly_cutoff = now - timedelta(days=policy['MONTHLY_DAYS']) if policy['MONTHLY_DAYS'] else None
+    
+    report = {}
+    if monthly_cutoff and not dry_run and is_partitioned(InventorySnapshot):
+        report['dropped_partitions'] = len(drop_partitions_before(InventorySnapshot, monthly_cutoff))
+    if monthly_cutoff:
+        report['expired'] = _delete_in_batches(
+            table, _expired_ids, monthly_cutoff, batch_size=batch_size, dry_run=dry_run
+        )
+    report['downsampled_monthly'] = _delete_in_batches(
+        table, _redundant_ids, 'month', monthly_cutoff, daily_cutoff,
+        batch_size=batch_size, dry_run=dry_run
+    )
+    report['downsampled_daily'] = _delete_in_batches(
+        table, _redundant_ids, 'day', daily_cutoff, full_cutoff,
+        batch_size=batch_size, dry_run=dry_run
+    )
+    report['total'] = sum(count for step, count in report.items() if step != 'dropped_partitions')
+    return report
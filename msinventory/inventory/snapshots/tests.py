@@ -1,10 +1,24 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from .capture import capture_snapshots
+from .history import inventory_as_of, latest_snapshots, snapshot_diff
+from .retention import apply_retention
+from utils.partitions import (
+    drop_partitions_before, ensure_partitions, is_partitioned, list_partitions, month_start,
+    partition_name, partition_table
+)
 from .models import InventorySnapshot
-from inventory.products.models import Product, ProductCategory
+from inventory.products.models import Product, ProductCategory, InventoryLevel
 from inventory.locations.models import Location
+from inventory.stockmoves.models import StockMove, StockMoveLine
 
 User = get_user_model()
 
@@ -109,11 +123,31 @@ class InventorySnapshotAPITest(APITestCase):
             quantity_on_hand=10
         )
         location2 = Location.objects.create(code="WH2", name="Warehouse 2")
+        inactive = Location.objects.create(code="OLD", name="Closed", is_active=False)
+        InventoryLevel.objects.create(product=self.product, location=self.location, quantity=20)
+        InventoryLevel.objects.create(product=product2, location=location2, quantity=4)
+        InventoryLevel.objects.create(product=product2, location=inactive, quantity=6)
         
         response = self.client.post('/api/snapshots/capture_all/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
-        self.assertEqual(InventorySnapshot.objects.count(), 4)
+        self.assertEqual(InventorySnapshot.objects.count(), 2)
+        self.assertEqual(
+            set(InventorySnapshot.objects.values_list('product_id', 'location_id', 'quantity')),
+            {(self.product.id, self.location.id, 20), (product2.id, location2.id, 4)}
+        )
+        self.assertEqual(len(set(InventorySnapshot.objects.values_list('timestamp', flat=True))), 1)
+    
+    def test_capture_snapshots_in_chunks(self):
+        locations = [
+            Location.objects.create(code=f"BIN{i}", name=f"Bin {i}") for i in range(5)
+        ]
+        for location in locations:
+            InventoryLevel.objects.create(product=self.product, location=location, quantity=3)
+        
+        self.assertEqual(capture_snapshots(chunk_size=2), 5)
+        self.assertEqual(capture_snapshots(chunk_size=5), 5)
+        self.assertEqual(InventorySnapshot.objects.count(), 10)
     
     def test_current_inventory_endpoint(self):
         # Create multiple snapshots for the same product-location
@@ -155,4 +189,359 @@ class InventorySnapshotAPITest(APITestCase):
         
         product_data = response.data[str(self.product.id)]
         self.assertEqual(len(product_data['locations']), 1)
-        self.assertEqual(product_data['locations'][str(self.location.id)]['quantity'], 20)
\ No newline at end of file
+        self.assertEqual(product_data['locations'][str(self.location.id)]['quantity'], 20)
+
+class InventoryAsOfTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client.force_authenticate(user=self.user)
+        
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Test Product",
+            internal_reference="TP",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category
+        )
+        self.location1 = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.location2 = Location.objects.create(code="WH2", name="Warehouse 2")
+        self.now = timezone.now()
+        
+        snapshot = InventorySnapshot.objects.create(
+            product=self.product, location=self.location1, quantity=100
+        )
+        self.backdate(InventorySnapshot, snapshot.pk, days=10)
+        
+        self.create_move("OUTBOUND", 10, days=8, from_location=self.location1)
+        self.create_move(
+            "TRANSFER", 20, days=5, from_location=self.location1, to_location=self.location2
+        )
+        self.create_move("INBOUND", 7, days=2, to_location=self.location1)
+        self.create_move("OUTBOUND", 50, days=1, from_location=self.location1, completed=False)
+        InventoryLevel.objects.create(product=self.product, location=self.location1, quantity=77)
+        InventoryLevel.objects.create(product=self.product, location=self.location2, quantity=20)
+    
+    def backdate(self, model, pk, days):
+        model.objects.filter(pk=pk).update(timestamp=self.now - timedelta(days=days))
+    
+    def create_move(self, move_type, quantity, days, completed=True, completed_days=None, **locations):
+        move = StockMove.objects.create(move_type=move_type, **locations)
+        StockMoveLine.objects.create(stock_move=move, product=self.product, quantity=quantity)
+        self.backdate(StockMove, move.pk, days)
+        if completed:
+            completed_days = days if completed_days is None else completed_days
+            StockMove.objects.filter(pk=move.pk).update(
+                completed=True, completed_at=self.now - timedelta(days=completed_days)
+            )
+        return move
+    
+    def test_replays_moves_since_snapshot(self):
+        key1 = (self.product.id, self.location1.id)
+        key2 = (self.product.id, self.location2.id)
+        
+        self.assertEqual(inventory_as_of(self.now - timedelta(days=9)), {key1: 100})
+        self.assertEqual(inventory_as_of(self.now - timedelta(days=6)), {key1: 90})
+        self.assertEqual(inventory_as_of(self.now - timedelta(days=3)), {key1: 70, key2: 20})
+        self.assertEqual(inventory_as_of(self.now), {key1: 77, key2: 20})
+        self.assertEqual(inventory_as_of(self.now - timedelta(days=11)), {})
+    
+    def test_newer_snapshot_replaces_replay(self):
+        snapshot = InventorySnapshot.objects.create(
+            product=self.product, location=self.location1, quantity=60
+        )
+        self.backdate(InventorySnapshot, snapshot.pk, days=4)
+        
+        result = inventory_as_of(self.now, location_id=self.location1.id)
+        self.assertEqual(result, {(self.product.id, self.location1.id): 67})
+    
+    def test_replays_moves_by_completion_time(self):
+        # Drafted before the day-10 snapshot, completed after it: counted once.
+        self.create_move("INBOUND", 5, days=12, completed_days=3, to_location=self.location1)
+        key1 = (self.product.id, self.location1.id)
+        
+        self.assertEqual(inventory_as_of(self.now - timedelta(days=6))[key1], 90)
+        self.assertEqual(inventory_as_of(self.now)[key1], 82)
+    
+    def test_replays_levels_without_snapshot_from_start(self):
+        # Stock received at WH2 before any snapshot existed.
+        self.create_move("INBOUND", 5, days=12, to_location=self.location2)
+        key2 = (self.product.id, self.location2.id)
+        
+        self.assertEqual(inventory_as_of(self.now)[key2], 25)
+        self.assertEqual(inventory_as_of(self.now - timedelta(days=11)), {key2: 5})
+        self.assertEqual(inventory_as_of(self.now, location_id=self.location2.id), {key2: 25})
+    
+    def test_replay_is_bounded_per_pair(self):
+        # A stale snapshot at WH3 must not pull WH1's older moves into its replay.
+        location3 = Location.objects.create(code="WH3", name="Warehouse 3")
+        snapshot = InventorySnapshot.objects.create(
+            product=self.product, location=location3, quantity=3
+        )
+        self.backdate(InventorySnapshot, snapshot.pk, days=30)
+        self.create_move("INBOUND", 4, days=20, to_location=location3)
+        key1 = (self.product.id, self.location1.id)
+        key3 = (self.product.id, location3.id)
+        
+        with self.assertNumQueries(1) as queries:
+            result = inventory_as_of(self.now)
+        self.assertEqual((result[key1], result[key3]), (77, 7))
+        
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + queries.captured_queries[0]['sql'])
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('Recursive Union', plan)
+        self.assertNotIn("Seq Scan on snapshots_inventorysnapshot", plan)
+    
+    def test_current_inventory_as_of(self):
+        as_of = (self.now - timedelta(days=3)).isoformat()
+        response = self.client.get(
+            '/api/snapshots/current_inventory/', {'as_of': as_of, 'location_id': self.location2.id}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        locations = response.data[str(self.product.id)]['locations']
+        self.assertEqual(locations[str(self.location2.id)]['quantity'], 20)
+        
+        response = self.client.get('/api/snapshots/current_inventory/', {'as_of': 'last week'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_inventory_levels_as_of(self):
+        as_of = (self.now - timedelta(days=6)).isoformat()
+        response = self.client.get('/api/products/inventory_levels/', {'as_of': as_of})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        locations = response.data[self.product.id]['locations']
+        self.assertEqual(locations[self.location1.id]['quantity'], 90)
+        self.assertEqual(locations[self.location1.id]['location_code'], "WH1")
+    
+    def test_current_inventory_query_count(self):
+        location3 = Location.objects.create(code="WH3", name="Warehouse 3")
+        for quantity in (20, 15, 12):
+            InventorySnapshot.objects.create(product=self.product, location=location3, quantity=quantity)
+        
+        expected = [{
+            'product_id': self.product.id,
+            'product__name': "Test Product",
+            'location_id': location3.id,
+            'location__name': "Warehouse 3",
+            'quantity': 12,
+        }]
+        with self.assertNumQueries(1) as queries:
+            self.assertEqual(list(latest_snapshots(location_id=location3.id)), expected)
+        
+        # Pairs are walked through the index one at a time, not read in full.
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + queries.captured_queries[0]['sql'])
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('Recursive Union', plan)
+        self.assertNotIn("Seq Scan on snapshots_inventorysnapshot", plan)
+
+class SnapshotRetentionTest(TestCase):
+    def setUp(self):
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Test Product",
+            internal_reference="TP",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category
+        )
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    
+    def snapshot(self, age, quantity=1):
+        snapshot = InventorySnapshot.objects.create(
+            product=self.product, location=self.location, quantity=quantity
+        )
+        InventorySnapshot.objects.filter(pk=snapshot.pk).update(timestamp=self.now - age)
+        return snapshot.pk
+    
+    def test_downsamples_by_age(self):
+        recent = [self.snapshot(timedelta(days=1, hours=h)) for h in range(3)]
+        daily_kept = self.snapshot(timedelta(days=40, hours=1))
+        daily_dropped = [self.snapshot(timedelta(days=40, hours=h)) for h in (2, 3)]
+        monthly = [self.snapshot(timedelta(days=400 + d)) for d in range(3)]
+        expired = self.snapshot(timedelta(days=5000))
+        
+        report = apply_retention(
+            now=self.now, FULL_DAYS=30, DAILY_DAYS=365, MONTHLY_DAYS=3000, BATCH_SIZE=1
+        )
+        
+        self.assertEqual(report['expired'], 1)
+        self.assertEqual(report['downsampled_daily'], 2)
+        self.assertGreaterEqual(report['downsampled_monthly'], 1)
+        self.assertEqual(report['total'], 3 + report['downsampled_monthly'])
+        
+        remaining = set(InventorySnapshot.objects.values_list('pk', flat=True))
+        self.assertTrue(set(recent) <= remaining)
+        self.assertIn(daily_kept, remaining)
+        self.assertFalse(set(daily_dropped) & remaining)
+        self.assertIn(monthly[0], remaining)
+        self.assertNotIn(expired, remaining)
+    
+    def test_dry_run_and_command(self):
+        for hours in range(4):
+            self.snapshot(timedelta(days=60, hours=hours))
+        
+        self.assertEqual(apply_retention(now=self.now, dry_run=True)['total'], 3)
+        self.assertEqual(InventorySnapshot.objects.count(), 4)
+        
+        out = StringIO()
+        call_command('prune_snapshots', stdout=out)
+        self.assertIn("Reclaimed 3 snapshot rows", out.getvalue())
+        self.assertEqual(InventorySnapshot.objects.count(), 1)
+    
+    def test_rejects_invalid_batch_size(self):
+        with self.assertRaises(ValueError):
+            apply_retention(now=self.now, BATCH_SIZE=0)
+        with self.settings(SNAPSHOT_RETENTION={'BATCH_SIZE': None}):
+            with self.assertRaises(ValueError):
+                apply_retention(now=self.now)
+        with self.assertRaises(CommandError):
+            call_command('prune_snapshots', '--batch-size', '-5', stdout=StringIO())
+
+class SnapshotPartitioningTest(TestCase):
+    def setUp(self):
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Test Product",
+            internal_reference="TP",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category
+        )
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.now = timezone.now()
+        for days in (0, 70, 400):
+            snapshot = InventorySnapshot.objects.create(
+                product=self.product, location=self.location, quantity=days
+            )
+            InventorySnapshot.objects.filter(pk=snapshot.pk).update(
+                timestamp=self.now - timedelta(days=days)
+            )
+    
+    def test_convert_and_maintain_partitions(self):
+        call_command('manage_partitions', '--convert', stdout=StringIO())
+        
+        self.assertTrue(is_partitioned(InventorySnapshot))
+        self.assertEqual(InventorySnapshot.objects.count(), 3)
+        self.assertGreaterEqual(len(list_partitions(InventorySnapshot)), 17)
+        
+        snapshot = InventorySnapshot.objects.create(
+            product=self.product, location=self.location, quantity=5
+        )
+        self.assertGreater(snapshot.pk, 0)
+        self.assertEqual(InventorySnapshot.objects.get(pk=snapshot.pk).quantity, 5)
+        
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, InventorySnapshot._meta.db_table
+            ).values()
+        self.assertIn(
+            ['product_id', 'location_id', 'timestamp'],
+            [c['columns'] for c in constraints if c['unique'] and not c['primary_key']]
+        )
+        
+        report = apply_retention(now=self.now, FULL_DAYS=30, DAILY_DAYS=100, MONTHLY_DAYS=200)
+        self.assertGreaterEqual(report['dropped_partitions'], 1)
+        self.assertFalse(drop_partitions_before(InventorySnapshot, self.now - timedelta(days=200)))
+        self.assertEqual(
+            sorted(InventorySnapshot.objects.values_list('quantity', flat=True)), [0, 5, 70]
+        )
+    
+    def test_default_partition_catches_unplanned_months(self):
+        call_command('manage_partitions', '--convert', '--months-ahead', '0', stdout=StringIO())
+        default = f"{InventorySnapshot._meta.db_table}_default"
+        
+        # Two months ahead has no partition yet, so the row lands in the default.
+        later = self.now + timedelta(days=62)
+        snapshot = InventorySnapshot.objects.create(
+            product=self.product, location=self.location, quantity=9
+        )
+        InventorySnapshot.objects.filter(pk=snapshot.pk).update(timestamp=later)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM "{default}"')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        
+        created = ensure_partitions(InventorySnapshot, months_ahead=3)
+        self.assertIn(partition_name(InventorySnapshot._meta.db_table, month_start(later)), created)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM "{default}"')
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(InventorySnapshot.objects.get(pk=snapshot.pk).quantity, 9)
+    
+    def test_stock_moves_cannot_be_partitioned(self):
+        with self.assertRaisesMessage(ValueError, "referenced by"):
+            partition_table(StockMove)
+
+class SnapshotDiffAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client.force_authenticate(user=self.user)
+        
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.other_category = ProductCategory.objects.create(name="Furniture")
+        self.product1 = Product.objects.create(
+            name="Product 1", internal_reference="P1", sales_price=100.00, cost=50.00,
+            product_category=self.category
+        )
+        self.product2 = Product.objects.create(
+            name="Product 2", internal_reference="P2", sales_price=100.00, cost=50.00,
+            product_category=self.other_category
+        )
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.now = timezone.now()
+        
+        self.snapshot(self.product1, 10, days=10)
+        self.snapshot(self.product2, 5, days=10)
+        self.snapshot(self.product1, 10, days=2)
+        self.snapshot(self.product2, 8, days=2)
+    
+    def snapshot(self, product, quantity, days):
+        snapshot = InventorySnapshot.objects.create(
+            product=product, location=self.location, quantity=quantity
+        )
+        InventorySnapshot.objects.filter(pk=snapshot.pk).update(
+            timestamp=self.now - timedelta(days=days)
+        )
+    
+    def get_diff(self, **params):
+        params.setdefault('from', (self.now - timedelta(days=5)).isoformat())
+        params.setdefault('to', self.now.isoformat())
+        response = self.client.get('/api/snapshots/diff/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(b''.join(response.streaming_content))
+    
+    def test_diff_returns_only_changed_pairs(self):
+        self.assertEqual(self.get_diff(), [{
+            'product_id': self.product2.id,
+            'product_name': "Product 2",
+            'location_id': self.location.id,
+            'location_name': "Warehouse 1",
+            'from_quantity': 5,
+            'to_quantity': 8,
+            'delta': 3,
+        }])
+    
+    def test_diff_counts_missing_side_as_zero(self):
+        changes = self.get_diff(**{'from': (self.now - timedelta(days=20)).isoformat()})
+        self.assertEqual([(c['product_id'], c['delta']) for c in changes],
+                         [(self.product1.id, 10), (self.product2.id, 8)])
+    
+    def test_diff_filters_by_category(self):
+        self.assertEqual(self.get_diff(category_id=self.category.id), [])
+        self.assertEqual(len(self.get_diff(location_id=self.location.id)), 1)
+    
+    def test_diff_reads_latest_snapshot_per_pair(self):
+        with self.assertNumQueries(1) as queries:
+            changes = list(snapshot_diff(self.now - timedelta(days=5), self.now))
+        self.assertEqual([c['product_id'] for c in changes], [self.product2.id])
+        
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + queries.captured_queries[0]['sql'])
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('Recursive Union', plan)
+        self.assertNotIn("Seq Scan on snapshots_inventorysnapshot", plan)
+    
+    def test_diff_requires_valid_times(self):
+        response = self.client.get('/api/snapshots/diff/', {'from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,15 +1,22 @@
+import json
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Sum, Q
+from .capture import capture_snapshots
+from .history import inventory_as_of, latest_snapshots, snapshot_diff
 from .models import InventorySnapshot
 from .serializers import InventorySnapshotSerializer, InventorySnapshotCreateSerializer
 from inventory.products.models import Product
 from inventory.locations.models import Location
+from utils.helpers import parse_timestamp
+from utils.pagination import KeysetPaginationMixin
 
-class InventorySnapshotViewSet(viewsets.ModelViewSet):
+class InventorySnapshotViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = InventorySnapshot.objects.all().select_related('product', 'location')
+    keyset_ordering = ('-timestamp', '-id')
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -18,52 +25,77 @@ class InventorySnapshotViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def capture_all(self, request):
-        """Capture snapshot of all products at all locations"""
-        products = Product.objects.all()
-        locations = Location.objects.filter(is_active=True)
-        snapshots = []
-        
-        for product in products:
-            for location in locations:
-                snapshot = InventorySnapshot(
-                    product=product,
-                    location=location,
-                    quantity=product.quantity_on_hand,
-                    note="Automated snapshot"
-                )
-                snapshots.append(snapshot)
-        
-        InventorySnapshot.objects.bulk_create(snapshots)
-        return Response({'message': f'Created {len(snapshots)} snapshots'})
+        """Capture snapshot of every stocked product at all active locations"""
+        created = capture_snapshots()
+        return Response({'message': f'Created {created} snapshots'})
     
     @action(detail=False, methods=['get'])
     def current_inventory(self, request):
-        """Get current inventory levels"""
+        """Get current inventory levels, or the levels at ``as_of`` when given"""
         location_id = request.query_params.get('location_id')
         product_id = request.query_params.get('product_id')
+        as_of = request.query_params.get('as_of')
         
-        filters = Q()
-        if location_id:
-            filters &= Q(location_id=location_id)
-        if product_id:
-            filters &= Q(product_id=product_id)
+        if as_of:
+            try:
+                as_of = parse_timestamp(as_of)
+            except ValueError:
+                return Response(
+                    {'error': 'as_of must be an ISO 8601 date or timestamp'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            quantities = inventory_as_of(as_of, product_id=product_id, location_id=location_id)
+            products = Product.objects.in_bulk({product for product, _ in quantities})
+            locations = Location.objects.in_bulk({location for _, location in quantities})
+            rows = (
+                {
+                    'product_id': product,
+                    'product__name': products[product].name,
+                    'location_id': location,
+                    'location__name': locations[location].name,
+                    'quantity': quantity,
+                }
+                for (product, location), quantity in sorted(quantities.items())
+            )
+        else:
+            rows = latest_snapshots(product_id=product_id, location_id=location_id)
         
         inventory = {}
-        snapshots = InventorySnapshot.objects.filter(filters).order_by('product', 'location', '-timestamp')
+        for row in rows:
+            product = inventory.setdefault(str(row['product_id']), {
+                'product_name': row['product__name'],
+                'locations': {}
+            })
+            product['locations'][str(row['location_id'])] = {
+                'location_name': row['location__name'],
+                'quantity': row['quantity']
+            }
         
-        seen = set()
-        for snapshot in snapshots:
-            key = (snapshot.product_id, snapshot.location_id)
-            if key not in seen:
-                seen.add(key)
-                if snapshot.product_id not in inventory:
-                    inventory[snapshot.product_id] = {
-                        'product_name': snapshot.product.name,
-                        'locations': {}
-                    }
-                inventory[snapshot.product_id]['locations'][snapshot.location_id] = {
-                    'location_name': snapshot.location.name,
-                    'quantity': snapshot.quantity
-                }
+        return Response(inventory)
+    
+    @action(detail=False, methods=['get'])
+    def diff(self, request):
+        """Stream the product/location pairs whose snapshot quantity changed between two times"""
+        try:
+            from_time = parse_timestamp(request.query_params.get('from', ''))
+            to_time = parse_timestamp(request.query_params.get('to', ''))
+        except ValueError:
+            return Response(
+                {'error': 'from and to must be ISO 8601 dates or timestamps'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        changes = snapshot_diff(
+            from_time,
+            to_time,
+            location_id=request.query_params.get('location_id'),
+            category_id=request.query_params.get('category_id'),
+        )
+        
+        def render():
+            yield '['
+            for index, change in enumerate(changes):
+                yield (',' if index else '') + json.dumps(change, cls=DjangoJSONEncoder)
+            yield ']'
         
-        return Response(inventory)
\ No newline at end of file
+        return StreamingHttpResponse(render(), content_type='application/json')
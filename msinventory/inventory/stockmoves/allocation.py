@@ -0,0 +1,139 @@
+from itertools import combinations
+from math import comb
+import numpy as np
+
+# Largest number of location subsets the exact solver checks before settling
+# for the greedy cover.
+EXACT_MAX_SUBSETS = 20000
+
+
+def greedy_cover(stock, demand):
+    """
+    Pick locations one at a time, each time the one that can ship the most of
+    the remaining ``demand``. ``stock`` is a (products x locations) matrix.
+    Returns the chosen location columns in order.
+    """
+    remaining = demand.copy()
+    chosen = []
+    while remaining.any():
+        covered = np.minimum(stock, remaining[:, None]).sum(axis=0)
+        covered[chosen] = 0
+        best = int(np.argmax(covered))
+        if covered[best] <= 0:
+            break
+        chosen.append(best)
+        remaining = np.maximum(remaining - stock[:, best], 0)
+    return chosen
+
+
+def exact_cover(stock, demand, cover):
+    """
+    Return the smallest set of location columns that can ship all of
+    ``demand``, given a known ``cover``: a smaller set if one exists, else
+    ``cover`` itself. Returns None when checking every smaller subset would
+    exceed EXACT_MAX_SUBSETS.
+    """
+    locations = stock.shape[1]
+    if sum(comb(locations, size) for size in range(1, len(cover))) > EXACT_MAX_SUBSETS:
+        return None
+    for size in range(1, len(cover)):
+        subsets = np.array(list(combinations(range(locations), size)), dtype=np.int64)
+        # (products x subsets) stock available in each candidate subset.
+        feasible = (stock[:, subsets].sum(axis=2) >= demand[:, None]).all(axis=0)
+        if feasible.any():
+            return subsets[np.argmax(feasible)].tolist()
+    return cover
+
+
+def allocate_order(lines, location_ids=None, reference=None):
+    """
+    Choose the locations to ship an order from, using as few locations as
+    possible, and split each line across them.
+
+    ``lines`` are (product_id, quantity) pairs. Stock comes from a single
+    InventoryLevel query over active locations (optionally only
+    ``location_ids``). A greedy cover is always computed; when it could be
+    beaten by a subset small enough to check exhaustively, the exact
+    solver finds the smallest one.
+
+    Returns {'solver', 'locations', 'moves', 'unallocated'}; moves are OUTBOUND
+    drafts in the create payload shape.
+    """
+    from inventory.products.models import InventoryLevel
+
+    requested = {}
+    for product_id, quantity in lines:
+        requested[product_id] = requested.get(product_id, 0) + quantity
+    product_ids = np.array(sorted(requested), dtype=np.int64)
+    demand = np.array([requested[pk] for pk in product_ids.tolist()], dtype=np.int64)
+
+    levels = InventoryLevel.objects.filter(
+        product_id__in=product_ids.tolist(), quantity__gt=0, location__is_active=True
+    )
+    if location_ids is not None:
+        levels = levels.filter(location_id__in=location_ids)
+    rows = list(levels.values_list('product_id', 'location_id', 'location__code', 'quantity'))
+
+    codes = {location_id: code for _, location_id, code, _ in rows}
+    columns = np.array(sorted(codes), dtype=np.int64)
+    stock = np.zeros((len(product_ids), len(columns)), dtype=np.int64)
+    if rows:
+        row_products, row_locations, _, quantities = zip(*rows)
+        stock[
+            np.searchsorted(product_ids, np.array(row_products, dtype=np.int64)),
+            np.searchsorted(columns, np.array(row_locations, dtype=np.int64)),
+        ] = quantities
+
+    # Lines short of stock everywhere are covered as far as possible.
+    target = np.minimum(demand, stock.sum(axis=1))
+    chosen = greedy_cover(stock, target)
+    solver = 'greedy'
+    exact = exact_cover(stock, target, chosen)
+    if exact is not None:
+        chosen, solver = exact, 'exact'
+
+    # Each line draws on the chosen location holding most of it first, so
+    # lines are split as rarely as possible.
+    chosen = np.array(chosen, dtype=np.int64)
+    shipped = np.zeros_like(stock)
+    remaining = target.copy()
+    if len(chosen):
+        order = np.argsort(-stock[:, chosen], axis=1, kind='stable')
+        rows_index = np.arange(len(product_ids))
+        for rank in range(len(chosen)):
+            columns_at_rank = chosen[order[:, rank]]
+            take = np.minimum(stock[rows_index, columns_at_rank], remaining)
+            shipped[rows_index, columns_at_rank] = take
+            remaining -= take
+
+    moves = []
+    for column in sorted(chosen.tolist(), key=lambda column: -shipped[:, column].sum()):
+        products = np.flatnonzero(shipped[:, column])
+        if not len(products):
+            continue
+        location_id = int(columns[column])
+        moves.append({
+            'move_type': 'OUTBOUND',
+            'reference': reference,
+            'from_location': location_id,
+            'from_location_code': codes[location_id],
+            'lines': [
+                {'product': int(product_ids[index]), 'quantity': int(shipped[index, column])}
+                for index in products.tolist()
+            ],
+        })
+
+    allocated = shipped.sum(axis=1)
+    return {
+        'solver': solver,
+        'locations': len(moves),
+        'moves': moves,
+        'unallocated': [
+            {
+                'product': int(product_ids[index]),
+                'requested': int(demand[index]),
+                'allocated': int(allocated[index]),
+            }
+            for index in np.flatnonzero(allocated < demand).tolist()
+        ],
+    }
@@ -0,0 +1,264 @@
+import random
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from inventory.products.counters import (
+    add_stock_deltas, pending_deltas, striped_on_hand_enabled
+)
+from inventory.ledger.models import LedgerEntry
+from inventory.products.models import (
+    InventoryLevel, LowStockEvent, Product, threshold_crossing
+)
+from .rollup import record_rollup
+
+
+def line_effects(move_type, from_location_id, to_location_id, product_id, quantity):
+    """Return the (product, location) deltas and on-hand delta of one move line"""
+    if move_type == 'INBOUND':
+        return [((product_id, to_location_id), quantity)], quantity
+    if move_type == 'OUTBOUND':
+        return [((product_id, from_location_id), -quantity)], -quantity
+    if move_type == 'TRANSFER':
+        return [
+            ((product_id, from_location_id), -quantity),
+            ((product_id, to_location_id), quantity),
+        ], 0
+    raise ValueError(f"Unknown move type: {move_type}")
+
+
+# deadlock_detected, serialization_failure and unique_violation (two writers
+# creating the same missing InventoryLevel row).
+RETRYABLE_SQLSTATES = {'40P01', '40001', '23505'}
+
+
+def is_retryable(error):
+    """True if ``error`` is a lock conflict that succeeds when simply retried"""
+    return getattr(error.__cause__, 'pgcode', None) in RETRYABLE_SQLSTATES
+
+
+def run_with_retry(func, attempts=None, on_retry=None):
+    """
+    Run ``func`` in its own transaction, retrying it with jittered backoff when
+    it fails on a deadlock, serialization failure or duplicate level insert.
+
+    Inside an outer transaction the failure has already aborted that
+    transaction, so ``func`` then runs once and errors propagate unchanged.
+    """
+    if connection.in_atomic_block:
+        return func()
+    if attempts is None:
+        attempts = getattr(settings, 'INVENTORY_LOCK_RETRIES', 3)
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic():
+                return func()
+        except DatabaseError as e:
+            if attempt >= attempts or not is_retryable(e):
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+
+def _insufficient_message(move_type):
+    if move_type == 'TRANSFER':
+        return "Insufficient stock at source location"
+    return "Insufficient stock at location"
+
+
+def bulk_increment(model, field, deltas, touched_field, now):
+    """Add ``deltas`` ({pk: delta}) to ``field`` in a single UPDATE ... FROM unnest()"""
+    if not deltas:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.get_field(field).column)
+    touched = connection.ops.quote_name(model._meta.get_field(touched_field).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} AS t SET {column} = t.{column} + v.delta, {touched} = %s "
+            f"FROM unnest(%s::bigint[], %s::integer[]) AS v(id, delta) "
+            f"WHERE t.id = v.id",
+            [now, list(deltas.keys()), list(deltas.values())],
+        )
+
+
+@transaction.atomic
+def apply_moves(moves, lines=None, partial=False):
+    """
+    Apply the stock effects of ``moves`` with a constant number of queries.
+
+    All affected Product and InventoryLevel rows are locked up front in
+    canonical (product_id, location_id) order, whatever the line order, so
+    concurrent moves cannot deadlock on each other (products are not locked
+    when INVENTORY_STRIPED_ON_HAND is enabled). Every line is validated in
+    memory against running balances and the net deltas are then written with
+    one ``UPDATE ... SET quantity = quantity + delta`` per table.
+    Every line also appends a signed LedgerEntry per affected location, and a
+    LowStockEvent is written for each level or product whose net change
+    crosses its reorder point. Applied moves are added to DailyMoveRollup and
+    get their ``completed_at`` set.
+
+    ``moves`` must already be saved. ``lines`` may give the (product_id, quantity)
+    pairs of each move, in the same order as ``moves``; otherwise they are read
+    from the database. A move that was already applied (``completed_at`` set)
+    or would drive a balance negative raises ValueError, or with ``partial`` is
+    skipped. Returns the error message (or None) of each move.
+    """
+    moves = list(moves)
+    if lines is None:
+        from .models import StockMoveLine
+
+        grouped = defaultdict(list)
+        for move_id, product_id, quantity in StockMoveLine.objects.filter(
+            stock_move__in=[move.pk for move in moves]
+        ).values_list('stock_move_id', 'product_id', 'quantity'):
+            grouped[move_id].append((product_id, quantity))
+        lines = [grouped[move.pk] for move in moves]
+
+    product_ids = sorted({p for move_lines in lines for p, _ in move_lines})
+    if not product_ids:
+        return [None] * len(moves)
+
+    from .models import StockMove
+
+    # Locking the moves first makes a second apply of the same move wait, then
+    # see the completed_at the first one set.
+    applied = {
+        pk for pk, completed_at in StockMove.objects.select_for_update()
+        .filter(pk__in=[move.pk for move in moves]).order_by('pk')
+        .values_list('pk', 'completed_at')
+        if completed_at is not None
+    }
+    location_ids = {
+        location_id
+        for move in moves
+        for location_id in (move.from_location_id, move.to_location_id)
+        if location_id
+    }
+
+    striped = striped_on_hand_enabled()
+    products = Product.objects.filter(pk__in=product_ids).order_by('pk')
+    if not striped:
+        # With striping, product rows are left unlocked; on-hand changes go to delta stripes.
+        products = products.select_for_update()
+    initial_on_hand, product_reorder_points = {}, {}
+    for pk, quantity, reorder_point in products.values_list('pk', 'quantity_on_hand', 'reorder_point'):
+        initial_on_hand[pk] = quantity
+        product_reorder_points[pk] = reorder_point
+    if striped:
+        for pk, delta in pending_deltas(product_ids).items():
+            initial_on_hand[pk] += delta
+    levels, level_reorder_points = {}, {}
+    for pk, product_id, location_id, quantity, reorder_point in (
+        InventoryLevel.objects
+        .select_for_update()
+        .filter(product_id__in=product_ids, location_id__in=location_ids)
+        .order_by('product_id', 'location_id')
+        .values_list('pk', 'product_id', 'location_id', 'quantity', 'reorder_point')
+    ):
+        levels[(product_id, location_id)] = (pk, quantity)
+        level_reorder_points[(product_id, location_id)] = reorder_point
+
+    on_hand = dict(initial_on_hand)
+    balances = {key: quantity for key, (pk, quantity) in levels.items()}
+    entries = []
+    errors = []
+
+    for move, move_lines in zip(moves, lines):
+        staged_levels, staged_on_hand, staged_entries = {}, {}, []
+        try:
+            if move.pk in applied:
+                raise ValueError("Stock move has already been applied")
+            for product_id, quantity in move_lines:
+                pairs, on_hand_delta = line_effects(
+                    move.move_type, move.from_location_id, move.to_location_id,
+                    product_id, quantity
+                )
+                for key, delta in pairs:
+                    balance = staged_levels.get(key, balances.get(key))
+                    if balance is None:
+                        # Locations without a level row start from the product's
+                        # on-hand quantity, matching Product.get_inventory_level.
+                        balance = on_hand[product_id]
+                        if balance:
+                            staged_entries.append((key, None, balance))
+                    if balance + delta < 0:
+                        raise ValueError(_insufficient_message(move.move_type))
+                    staged_levels[key] = balance + delta
+                    staged_entries.append((key, move.pk, delta))
+                product_balance = staged_on_hand.get(product_id, on_hand[product_id])
+                if product_balance + on_hand_delta < 0:
+                    raise ValueError("Insufficient stock")
+                staged_on_hand[product_id] = product_balance + on_hand_delta
+        except ValueError as e:
+            if not partial:
+                raise
+            errors.append(str(e))
+            continue
+        balances.update(staged_levels)
+        on_hand.update(staged_on_hand)
+        entries.extend(staged_entries)
+        errors.append(None)
+
+    now = timezone.now()
+    new_levels = [
+        InventoryLevel(product_id=key[0], location_id=key[1], quantity=balances[key])
+        for key in sorted(balances) if key not in levels
+    ]
+    if new_levels:
+        InventoryLevel.objects.bulk_create(new_levels)
+
+    if entries:
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(
+                product_id=key[0], location_id=key[1], stock_move_id=move_id,
+                quantity=quantity, timestamp=now,
+            )
+            for key, move_id, quantity in entries
+        ])
+
+    level_deltas = {
+        pk: balances[key] - quantity
+        for key, (pk, quantity) in levels.items() if balances[key] != quantity
+    }
+    bulk_increment(InventoryLevel, 'quantity', level_deltas, 'last_updated', now)
+
+    product_deltas = {
+        pk: on_hand[pk] - quantity
+        for pk, quantity in initial_on_hand.items() if on_hand[pk] != quantity
+    }
+    if striped:
+        add_stock_deltas(product_deltas)
+    else:
+        bulk_increment(Product, 'quantity_on_hand', product_deltas, 'updated_at', now)
+
+    accepted = [index for index, error in enumerate(errors) if error is None]
+    record_rollup([moves[index] for index in accepted], [lines[index] for index in accepted])
+    if accepted:
+        # History replays order moves by when they took effect, not when they were created.
+        StockMove.objects.filter(pk__in=[moves[index].pk for index in accepted]).update(completed_at=now)
+        for index in accepted:
+            moves[index].completed_at = now
+
+    # Only levels and products whose net change crosses the reorder point emit events.
+    events = []
+    for key, (pk, quantity) in levels.items():
+        event_type = threshold_crossing(quantity, balances[key], level_reorder_points[key])
+        if event_type:
+            events.append(LowStockEvent(
+                product_id=key[0], location_id=key[1], event_type=event_type,
+                quantity=balances[key], reorder_point=level_reorder_points[key], timestamp=now,
+            ))
+    for pk, quantity in initial_on_hand.items():
+        event_type = threshold_crossing(quantity, on_hand[pk], product_reorder_points[pk])
+        if event_type:
+            events.append(LowStockEvent(
+                product_id=pk, event_type=event_type, quantity=on_hand[pk],
+                reorder_point=product_reorder_points[pk], timestamp=now,
+            ))
+    if events:
+        LowStockEvent.objects.bulk_create(events)
+
+    return errors
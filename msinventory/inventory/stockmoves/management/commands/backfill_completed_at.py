@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from inventory.stockmoves.models import StockMove
+
+class Command(BaseCommand):
+    help = 'Set completed_at on completed stock moves recorded before it existed (uses their timestamp)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Moves updated per statement')
+    
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        updated = 0
+        while True:
+            ids = list(
+                StockMove.objects.filter(completed=True, completed_at__isnull=True)
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            updated += StockMove.objects.filter(pk__in=ids).update(completed_at=F('timestamp'))
+        self.stdout.write(self.style.SUCCESS(f'Backfilled completed_at on {updated} moves'))
@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from inventory.stockmoves.queue import process_pending, requeue_stale
+
+class Command(BaseCommand):
+    help = 'Apply stock moves queued by the async create endpoint'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Moves claimed per batch')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent transactions per batch')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=300, help='Requeue jobs claimed this many seconds ago')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+    
+    def handle(self, *args, **options):
+        total_done = total_failed = 0
+        while True:
+            requeue_stale(timedelta(seconds=options['stale_after']))
+            done, failed = process_pending(options['batch_size'], options['workers'])
+            total_done += done
+            total_failed += failed
+            if done or failed:
+                self.stdout.write(f'Applied {done} moves, {failed} failed')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+        
+        self.stdout.write(self.style.SUCCESS(f'Applied {total_done} moves, {total_failed} failed'))
@@ -0,0 +1,20 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from inventory.stockmoves.rollup import rebuild_rollup
+
+class Command(BaseCommand):
+    help = 'Recompute the daily move rollup from completed stock moves (backfill or repair)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date on (YYYY-MM-DD)')
+    
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+        
+        rows = rebuild_rollup(since)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} rollup rows'))
@@ -0,0 +1,201 @@
+import random
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+from inventory.ledger.models import LedgerEntry
+from inventory.locations.models import Location
+from inventory.products.counters import pending_deltas
+from inventory.products.models import InventoryLevel, Product
+from inventory.stockmoves.engine import apply_moves, is_retryable, run_with_retry
+from inventory.stockmoves.models import StockMove, StockMoveLine
+
+PREFIX = 'STRESS-'
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent random stock moves at the configured database and report '
+        'throughput, latency, lock conflicts and whether balances stayed consistent. '
+        'Creates and removes its own STRESS-* products and locations.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--moves', type=int, default=1000, help='Number of moves to execute')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent worker threads')
+        parser.add_argument('--products', type=int, default=20, help='Products moves pick from')
+        parser.add_argument('--locations', type=int, default=4, help='Locations moves pick from')
+        parser.add_argument('--max-lines', type=int, default=5, help='Maximum lines per move')
+        parser.add_argument('--initial-stock', type=int, default=1000, help='Starting quantity per product and location')
+        parser.add_argument('--seed', type=int, help='Random seed for a reproducible run')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated data afterwards')
+    
+    def handle(self, *args, **options):
+        if options['locations'] < 2 or options['products'] < 1:
+            raise CommandError('Need at least 2 locations and 1 product')
+        rng = random.Random(options['seed'])
+        
+        self.cleanup()
+        products, locations = self.create_fixtures(
+            options['products'], options['locations'], options['initial_stock']
+        )
+        plans = [
+            self.random_move(rng, products, locations, options['max_lines'])
+            for _ in range(options['moves'])
+        ]
+        
+        self.stats_lock = threading.Lock()
+        self.latencies, self.conflicts, self.rejected, self.errors = [], 0, 0, 0
+        
+        workers = max(1, options['concurrency'])
+        started = time.perf_counter()
+        if workers == 1:
+            self.run_plans(plans)
+        else:
+            threads = [
+                threading.Thread(target=self.run_plans_in_thread, args=(plans[offset::workers],))
+                for offset in range(workers)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+        
+        self.report(elapsed, products)
+        if not options['keep']:
+            self.cleanup()
+    
+    def create_fixtures(self, product_count, location_count, initial_stock):
+        locations = Location.objects.bulk_create([
+            Location(code=f'{PREFIX}{index}', name=f'Stress location {index}')
+            for index in range(location_count)
+        ])
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Stress product {index}', internal_reference=f'{PREFIX}{index}',
+                sales_price=1, cost=1
+            )
+            for index in range(product_count)
+        ])
+        InventoryLevel.objects.bulk_create([
+            InventoryLevel(product=product, location=location, quantity=0)
+            for product in products for location in locations
+        ])
+        
+        seeds = StockMove.objects.bulk_create([
+            StockMove(move_type='INBOUND', to_location=location, reference=f'{PREFIX}seed', completed=True)
+            for location in locations
+        ])
+        apply_moves(seeds, lines=[[(product.pk, initial_stock) for product in products]] * len(seeds))
+        return [product.pk for product in products], [location.pk for location in locations]
+    
+    def random_move(self, rng, products, locations, max_lines):
+        move_type = rng.choice(['TRANSFER', 'TRANSFER', 'INBOUND', 'OUTBOUND'])
+        source, destination = rng.sample(locations, 2)
+        count = rng.randint(1, min(max_lines, len(products)))
+        # Lines come in random order so lock ordering is actually exercised.
+        lines = [(product_id, rng.randint(1, 20)) for product_id in rng.sample(products, count)]
+        return {
+            'move_type': move_type,
+            'from_location_id': source if move_type != 'INBOUND' else None,
+            'to_location_id': destination if move_type != 'OUTBOUND' else None,
+            'lines': lines,
+        }
+    
+    def execute_plan(self, plan):
+        move = StockMove(
+            move_type=plan['move_type'], from_location_id=plan['from_location_id'],
+            to_location_id=plan['to_location_id'], reference=f'{PREFIX}move', completed=True
+        )
+        StockMove.objects.bulk_create([move])
+        StockMoveLine.objects.bulk_create([
+            StockMoveLine(stock_move=move, product_id=product_id, quantity=quantity)
+            for product_id, quantity in plan['lines']
+        ])
+        apply_moves([move], lines=[plan['lines']])
+    
+    def count_conflict(self, error):
+        with self.stats_lock:
+            self.conflicts += 1
+    
+    def run_plans(self, plans):
+        for plan in plans:
+            started = time.perf_counter()
+            rejected = failed = 0
+            try:
+                run_with_retry(lambda: self.execute_plan(plan), on_retry=self.count_conflict)
+            except ValueError:
+                rejected = 1
+            except DatabaseError as e:
+                failed = 1
+                if is_retryable(e):
+                    self.count_conflict(e)
+            with self.stats_lock:
+                self.latencies.append(time.perf_counter() - started)
+                self.rejected += rejected
+                self.errors += failed
+    
+    def run_plans_in_thread(self, plans):
+        try:
+            self.run_plans(plans)
+        finally:
+            connection.close()
+    
+    def check_consistency(self, products):
+        problems = []
+        levels = InventoryLevel.objects.filter(product_id__in=products)
+        negative = levels.filter(quantity__lt=0).count()
+        if negative:
+            problems.append(f'{negative} negative inventory levels')
+        
+        on_hand = dict(Product.objects.filter(pk__in=products).values_list('pk', 'quantity_on_hand'))
+        for product_id, delta in pending_deltas(products).items():
+            on_hand[product_id] += delta
+        located = dict(
+            levels.values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+        )
+        mismatched = [pk for pk in products if on_hand[pk] != located.get(pk, 0)]
+        if mismatched:
+            problems.append(f'{len(mismatched)} products whose on-hand differs from their levels')
+        
+        ledger = dict(
+            ((product_id, location_id), total)
+            for product_id, location_id, total in LedgerEntry.objects.filter(product_id__in=products)
+            .values('product_id', 'location_id').annotate(total=Sum('quantity'))
+            .values_list('product_id', 'location_id', 'total')
+        )
+        drifted = sum(
+            1 for product_id, location_id, quantity
+            in levels.values_list('product_id', 'location_id', 'quantity')
+            if ledger.get((product_id, location_id), 0) != quantity
+        )
+        if drifted:
+            problems.append(f'{drifted} levels that differ from their ledger balance')
+        return problems
+    
+    def report(self, elapsed, products):
+        latencies = sorted(self.latencies)
+        
+        def percentile(fraction):
+            if not latencies:
+                return 0
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+        
+        self.stdout.write(f'Moves: {len(latencies)} in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} moves/s)')
+        self.stdout.write(f'Latency: p50 {percentile(0.5):.1f}ms, p99 {percentile(0.99):.1f}ms')
+        self.stdout.write(f'Lock conflicts (deadlock/serialization, retried): {self.conflicts}')
+        self.stdout.write(f'Rejected for insufficient stock: {self.rejected}')
+        self.stdout.write(f'Failed after retries: {self.errors}')
+        
+        problems = self.check_consistency(products)
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'Inconsistent: {problem}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Final balances are consistent'))
+    
+    def cleanup(self):
+        StockMove.objects.filter(reference__startswith=PREFIX).delete()
+        Product.objects.filter(internal_reference__startswith=PREFIX).delete()
+        Location.objects.filter(code__startswith=PREFIX).delete()
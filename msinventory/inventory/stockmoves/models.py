@@ -1,6 +1,7 @@
 from django.db import models
 from inventory.products.models import Product
 from inventory.locations.models import Location
+from .engine import apply_moves
 
 class StockMoveLine(models.Model):
     """Represents one product line within a multi-product stock move"""
@@ -9,6 +10,11 @@ class StockMoveLine(models.Model):
     quantity = models.PositiveIntegerField()
     description = models.TextField(blank=True, null=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'stock_move', 'id']),
+        ]
+    
     def __str__(self):
         return f"{self.product.name} - {self.quantity}"
 
@@ -28,9 +34,15 @@ class StockMove(models.Model):
                                    related_name='inbound_moves', null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     completed = models.BooleanField(default=False)
+    # When the move's stock effects were applied; set by apply_moves.
+    completed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp', 'id']),
+            models.Index(fields=['completed_at']),
+        ]
     
     def __str__(self):
         return f"{self.move_type} - {self.reference}"
@@ -50,33 +62,57 @@ class StockMove(models.Model):
             self.execute_move()
     
     def execute_move(self):
+        """Apply this move's stock effects in a constant number of queries"""
         if not self.pk:
             self.save()
-            
-        for line in self.lines.all():
-            if self.move_type == 'INBOUND':
-                line.product.update_quantity(line.quantity)
-                inventory_level = line.product.get_inventory_level(self.to_location)
-                inventory_level.quantity += line.quantity
-                inventory_level.save()
-                
-            elif self.move_type == 'OUTBOUND':
-                line.product.update_quantity(-line.quantity)
-                inventory_level = line.product.get_inventory_level(self.from_location)
-                if inventory_level.quantity < line.quantity:
-                    raise ValueError("Insufficient stock at location")
-                inventory_level.quantity -= line.quantity
-                inventory_level.save()
-                
-            elif self.move_type == 'TRANSFER':
-                source_level = line.product.get_inventory_level(self.from_location)
-                dest_level = line.product.get_inventory_level(self.to_location)
-                
-                if source_level.quantity < line.quantity:
-                    raise ValueError("Insufficient stock at source location")
-                    
-                source_level.quantity -= line.quantity
-                dest_level.quantity += line.quantity
-                
-                source_level.save()
-                dest_level.save()
\ No newline at end of file
+        
+        apply_moves([self])
+
+
+class StockMoveJob(models.Model):
+    """Queue entry for a stock move applied in the background by process_stock_moves"""
+    STATUSES = (
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+    
+    stock_move = models.OneToOneField(StockMove, on_delete=models.CASCADE, 
+                                      primary_key=True, related_name='job')
+    status = models.CharField(max_length=10, choices=STATUSES, default='PENDING')
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # Identifies the claim_jobs() call that owns a PROCESSING job.
+    claim_token = models.UUIDField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.stock_move_id} - {self.status}"
+
+class DailyMoveRollup(models.Model):
+    """Completed move quantities per product, location and day, kept current by apply_moves"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_move_rollups')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='daily_move_rollups')
+    day = models.DateField()
+    inbound_quantity = models.IntegerField(default=0)
+    outbound_quantity = models.IntegerField(default=0)
+    transfer_in_quantity = models.IntegerField(default=0)
+    transfer_out_quantity = models.IntegerField(default=0)
+    move_count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['product', 'location', 'day']
+        indexes = [
+            models.Index(fields=['day', 'product']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} at {self.location_id} on {self.day}"
+
@@ -0,0 +1,188 @@
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import connection, transaction
+from django.utils import timezone
+from inventory.products.counters import striped_on_hand_enabled
+from .engine import apply_moves, line_effects, run_with_retry
+from .models import StockMove, StockMoveJob, StockMoveLine
+
+
+def enqueue_moves(moves):
+    """Queue saved, not yet completed ``moves`` for the background worker"""
+    return StockMoveJob.objects.bulk_create([StockMoveJob(stock_move=move) for move in moves])
+
+
+def requeue_stale(older_than=timedelta(minutes=5), now=None):
+    """
+    Return jobs claimed by a worker that died before finishing them to the queue.
+
+    A worker that is merely slow loses its claim: process_group() only applies
+    jobs still held under the claim token it was given.
+    """
+    cutoff = (now or timezone.now()) - older_than
+    return StockMoveJob.objects.filter(status='PROCESSING', claimed_at__lt=cutoff).update(
+        status='PENDING', claimed_at=None, claim_token=None
+    )
+
+
+@transaction.atomic
+def claim_jobs(limit):
+    """
+    Mark up to ``limit`` of the oldest pending jobs as processing and return
+    (claim token, move ids in queue order).
+
+    ``SKIP LOCKED`` lets several workers claim concurrently without waiting on
+    or double-claiming each other's rows.
+    """
+    move_ids = list(
+        StockMoveJob.objects.select_for_update(skip_locked=True)
+        .filter(status='PENDING')
+        .order_by('created_at', 'pk')
+        .values_list('pk', flat=True)[:limit]
+    )
+    token = uuid.uuid4()
+    if move_ids:
+        StockMoveJob.objects.filter(pk__in=move_ids).update(
+            status='PROCESSING', claimed_at=timezone.now(), claim_token=token
+        )
+    return token, move_ids
+
+
+def _touched_keys(move, move_lines, striped):
+    keys = set()
+    for product_id, quantity in move_lines:
+        pairs, _ = line_effects(
+            move.move_type, move.from_location_id, move.to_location_id, product_id, quantity
+        )
+        keys.update(key for key, _ in pairs)
+        if not striped:
+            # apply_moves also locks the product row itself.
+            keys.add(product_id)
+    return keys
+
+
+def group_disjoint(moves, lines, groups=1):
+    """
+    Split ``moves`` into at most ``groups`` lists whose product/location sets do
+    not overlap, so each list can run in its own transaction without waiting on
+    the others' row locks.
+
+    Moves sharing a key always land in the same list, in their original order.
+    """
+    striped = striped_on_hand_enabled()
+    parent = list(range(len(moves)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    owner = {}
+    for index, move in enumerate(moves):
+        for key in _touched_keys(move, lines[index], striped):
+            if key in owner:
+                parent[find(index)] = find(owner[key])
+            else:
+                owner[key] = index
+
+    components = defaultdict(list)
+    for index in range(len(moves)):
+        components[find(index)].append(index)
+
+    # Largest components first onto the least loaded group.
+    buckets = [[] for _ in range(max(1, groups))]
+    for component in sorted(components.values(), key=len, reverse=True):
+        min(buckets, key=len).extend(component)
+    return [[moves[index] for index in sorted(bucket)] for bucket in buckets if bucket]
+
+
+def _finish(moves, errors):
+    now = timezone.now()
+    done = [move.pk for move, error in zip(moves, errors) if error is None]
+    if done:
+        StockMove.objects.filter(pk__in=done).update(completed=True)
+        StockMoveJob.objects.filter(pk__in=done).update(status='DONE', error=None, finished_at=now)
+    failed = defaultdict(list)
+    for move, error in zip(moves, errors):
+        if error is not None:
+            failed[error].append(move.pk)
+    for error, move_ids in failed.items():
+        StockMoveJob.objects.filter(pk__in=move_ids).update(
+            status='FAILED', error=error, finished_at=now
+        )
+    return len(done), len(moves) - len(done)
+
+
+def process_group(moves, lines, token):
+    """
+    Apply one disjoint group of queued moves in a single transaction.
+
+    Only jobs still PROCESSING under ``token`` are applied; their rows stay
+    locked until the transaction ends, so a job requeued by requeue_stale() and
+    claimed by another worker is skipped here. Moves that were already applied
+    are marked done without touching stock again.
+    """
+    def claimed():
+        return dict(
+            StockMoveJob.objects.select_for_update()
+            .filter(
+                pk__in=[move.pk for move in moves], status='PROCESSING', claim_token=token
+            )
+            .values_list('pk', 'stock_move__completed_at')
+        )
+
+    def apply():
+        held = claimed()
+        pending = [move for move in moves if move.pk in held and held[move.pk] is None]
+        applied = [move for move in moves if held.get(move.pk) is not None]
+        errors = apply_moves(
+            pending, lines=[lines[move.pk] for move in pending], partial=True
+        )
+        return _finish(pending + applied, errors + [None] * len(applied))
+
+    try:
+        return run_with_retry(apply)
+    except Exception as e:
+        with transaction.atomic():
+            held = [move for move in moves if move.pk in claimed()]
+            return _finish(held, [str(e)] * len(held))
+
+
+def _process_group_in_thread(moves, lines, token):
+    try:
+        return process_group(moves, lines, token)
+    finally:
+        connection.close()
+
+
+def process_pending(batch_size=500, workers=1):
+    """
+    Claim a batch of queued moves and apply them, splitting the batch into
+    ``workers`` disjoint groups that run concurrently on a thread pool.
+
+    Returns (done, failed) counts; (0, 0) means the queue was empty.
+    """
+    token, move_ids = claim_jobs(batch_size)
+    if not move_ids:
+        return 0, 0
+
+    moves = StockMove.objects.in_bulk(move_ids)
+    moves = [moves[pk] for pk in move_ids]
+    lines = defaultdict(list)
+    for move_id, product_id, quantity in StockMoveLine.objects.filter(
+        stock_move__in=move_ids
+    ).order_by('pk').values_list('stock_move_id', 'product_id', 'quantity'):
+        lines[move_id].append((product_id, quantity))
+
+    groups = group_disjoint(moves, [lines[move.pk] for move in moves], workers)
+    if len(groups) == 1:
+        results = [process_group(groups[0], lines, token)]
+    else:
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            results = list(pool.map(
+                lambda group: _process_group_in_thread(group, lines, token), groups
+            ))
+    return sum(done for done, _ in results), sum(failed for _, failed in results)
@@ -0,0 +1,179 @@
+from collections import defaultdict
+import numpy as np
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from .engine import apply_moves, run_with_retry
+from .models import StockMove, StockMoveLine
+
+REFERENCE = 'REPLENISH'
+
+
+def allocate(need_products, need_quantities, supply_products, supply_quantities):
+    """
+    Fill needs from supplies of the same product, both taken in the order given
+    within each product, so each need draws on as few supplies as possible.
+
+    Both sides must be grouped by product in ascending order. Returns
+    (need_index, supply_index, quantity) arrays, one entry per transfer.
+    """
+    if not len(need_products) or not len(supply_products):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    products = np.union1d(need_products, supply_products)
+    need_positions = np.searchsorted(products, need_products)
+    supply_positions = np.searchsorted(products, supply_products)
+    need_totals = np.bincount(need_positions, need_quantities, len(products)).astype(np.int64)
+    supply_totals = np.bincount(supply_positions, supply_quantities, len(products)).astype(np.int64)
+
+    # Lay every product's needs and supplies end to end on one shared axis,
+    # products back to back, so overlapping intervals are the transfers.
+    width = np.maximum(need_totals, supply_totals)
+    base = np.cumsum(width) - width
+
+    def intervals(positions, quantities, totals):
+        end = base[positions] + np.cumsum(quantities) - (np.cumsum(totals) - totals)[positions]
+        return end - quantities, end
+
+    need_start, need_end = intervals(need_positions, need_quantities, need_totals)
+    supply_start, supply_end = intervals(supply_positions, supply_quantities, supply_totals)
+
+    points = np.unique(np.concatenate([need_start, need_end, supply_start, supply_end]))
+    starts, lengths = points[:-1], np.diff(points)
+    needs = np.searchsorted(need_end, starts, side='right')
+    supplies = np.searchsorted(supply_end, starts, side='right')
+    covered = (needs < len(need_end)) & (supplies < len(supply_end))
+    needs, supplies, starts, lengths = needs[covered], supplies[covered], starts[covered], lengths[covered]
+    covered = (need_start[needs] <= starts) & (supply_start[supplies] <= starts)
+    needs, supplies, lengths = needs[covered], supplies[covered], lengths[covered]
+
+    pairs, inverse = np.unique(needs * len(supply_end) + supplies, return_inverse=True)
+    quantities = np.bincount(inverse, lengths).astype(np.int64)
+    return pairs // len(supply_end), pairs % len(supply_end), quantities
+
+
+def plan_replenishment(reserve_ids=None, location_id=None):
+    """
+    Plan the TRANSFER moves that bring every forward level at or below its
+    reorder point back up to its max quantity (or reorder point) from the
+    reserve locations, for the whole catalog at once.
+
+    Reserves default to the active locations marked ``is_reserve`` and are
+    drawn on in the order given (by code by default). Levels of the same
+    reserve and forward location share one move. ``location_id`` limits the
+    plan to one forward location.
+
+    Returns {'moves': [...], 'unfilled': [...]}; moves use the same shape as
+    the bulk create payload.
+    """
+    from inventory.locations.models import Location
+    from inventory.products.models import InventoryLevel
+
+    if reserve_ids is None:
+        reserve_ids = list(
+            Location.objects.filter(is_active=True, is_reserve=True)
+            .order_by('code').values_list('pk', flat=True)
+        )
+    if not reserve_ids:
+        raise ValueError("No reserve locations to replenish from")
+    reserve_ids = np.array(reserve_ids, dtype=np.int64)
+
+    # The short side matches the partial index predicate on quantity <= reorder_point.
+    short = Q(quantity__lte=F('reorder_point')) & ~Q(location_id__in=reserve_ids.tolist())
+    if location_id is not None:
+        short &= Q(location_id=location_id)
+    rows = list(
+        InventoryLevel.objects.filter(location__is_active=True)
+        .filter(Q(location_id__in=reserve_ids.tolist(), quantity__gt=0) | short)
+        .annotate(target=Coalesce('max_quantity', 'reorder_point', Value(0)),
+                  minimum=Coalesce('reorder_point', Value(0)))
+        .values_list('product_id', 'location_id', 'quantity', 'target', 'minimum')
+    )
+    if not rows:
+        return {'moves': [], 'unfilled': []}
+    product, location, quantity, target, minimum = np.array(rows, dtype=np.int64).T
+
+    reserve = np.isin(location, reserve_ids)
+    need = np.where(reserve, 0, target - quantity)
+    # Within each product the deepest shortfall is served first.
+    needs = np.flatnonzero(need > 0)
+    needs = needs[np.lexsort((location[needs], quantity[needs] - minimum[needs], product[needs]))]
+    # Reserves are drawn on in priority order, their position in reserve_ids.
+    supplies = np.flatnonzero(reserve)
+    sorter = np.argsort(reserve_ids)
+    rank = sorter[np.searchsorted(reserve_ids, location[supplies], sorter=sorter)]
+    supplies = supplies[np.lexsort((rank, product[supplies]))]
+
+    need_index, supply_index, moved = allocate(
+        product[needs], need[needs], product[supplies], quantity[supplies]
+    )
+    need_index, supply_index = needs[need_index], supplies[supply_index]
+
+    moves = defaultdict(list)
+    for to_index, from_index, amount in zip(need_index.tolist(), supply_index.tolist(), moved.tolist()):
+        moves[(int(location[from_index]), int(location[to_index]))].append(
+            {'product': int(product[to_index]), 'quantity': amount}
+        )
+    filled = np.zeros(len(product), dtype=np.int64)
+    np.add.at(filled, need_index, moved)
+
+    codes = dict(Location.objects.filter(
+        pk__in=np.unique(location).tolist()
+    ).values_list('pk', 'code'))
+    return {
+        'moves': [
+            {
+                'move_type': 'TRANSFER',
+                'reference': REFERENCE,
+                'from_location': from_id,
+                'from_location_code': codes[from_id],
+                'to_location': to_id,
+                'to_location_code': codes[to_id],
+                'lines': sorted(lines, key=lambda line: line['product']),
+            }
+            for (from_id, to_id), lines in sorted(moves.items())
+        ],
+        'unfilled': [
+            {
+                'product': int(product[index]),
+                'location': int(location[index]),
+                'location_code': codes[int(location[index])],
+                'needed': int(need[index]),
+                'planned': int(filled[index]),
+            }
+            for index in needs.tolist() if filled[index] < need[index]
+        ],
+    }
+
+
+def replenish(reserve_ids=None, location_id=None):
+    """
+    Plan and create the replenishment transfers as completed moves in a single
+    transaction. The plan is recomputed inside the transaction, so it reflects
+    stock at confirmation time rather than at preview time.
+
+    Returns (plan, moves).
+    """
+    def create_moves():
+        plan = plan_replenishment(reserve_ids, location_id)
+        if not plan['moves']:
+            return plan, []
+        moves = [
+            StockMove(
+                move_type='TRANSFER', reference=REFERENCE, completed=True,
+                from_location_id=planned['from_location'], to_location_id=planned['to_location']
+            )
+            for planned in plan['moves']
+        ]
+        StockMove.objects.bulk_create(moves)
+        StockMoveLine.objects.bulk_create([
+            StockMoveLine(stock_move=move, product_id=line['product'], quantity=line['quantity'])
+            for move, planned in zip(moves, plan['moves'])
+            for line in planned['lines']
+        ])
+        apply_moves(
+            moves,
+            lines=[[(line['product'], line['quantity']) for line in planned['lines']] for planned in plan['moves']],
+        )
+        return plan, moves
+
+    return run_with_retry(create_moves)
@@ -0,0 +1,110 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+# Rollup column that a line adds to at each side of a move.
+DESTINATION_COLUMNS = {'INBOUND': 'inbound_quantity', 'TRANSFER': 'transfer_in_quantity'}
+SOURCE_COLUMNS = {'OUTBOUND': 'outbound_quantity', 'TRANSFER': 'transfer_out_quantity'}
+QUANTITY_COLUMNS = ['inbound_quantity', 'outbound_quantity', 'transfer_in_quantity', 'transfer_out_quantity']
+
+
+def rollup_rows(moves, lines):
+    """
+    Return {(product_id, location_id, day): {column: quantity, 'move_count': n}}
+    for ``moves`` and their (product_id, quantity) ``lines``.
+    """
+    rows = defaultdict(lambda: dict.fromkeys(QUANTITY_COLUMNS + ['move_count'], 0))
+    for move, move_lines in zip(moves, lines):
+        day = timezone.localdate(move.timestamp or timezone.now())
+        touched = set()
+        for product_id, quantity in move_lines:
+            for location_id, columns in (
+                (move.to_location_id, DESTINATION_COLUMNS),
+                (move.from_location_id, SOURCE_COLUMNS),
+            ):
+                if location_id and move.move_type in columns:
+                    key = (product_id, location_id, day)
+                    rows[key][columns[move.move_type]] += quantity
+                    touched.add(key)
+        for key in touched:
+            rows[key]['move_count'] += 1
+    return rows
+
+
+def record_rollup(moves, lines):
+    """Add the effects of completed ``moves`` to DailyMoveRollup with one upsert"""
+    from .models import DailyMoveRollup
+
+    rows = rollup_rows(moves, lines)
+    if not rows:
+        return
+    keys = sorted(rows)
+    columns = QUANTITY_COLUMNS + ['move_count']
+    table = connection.ops.quote_name(DailyMoveRollup._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} AS t (product_id, location_id, day, {', '.join(columns)}) "
+            f"SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::date[], "
+            f"{', '.join(['%s::integer[]'] * len(columns))}) "
+            f"ON CONFLICT (product_id, location_id, day) DO UPDATE SET "
+            + ', '.join(f"{column} = t.{column} + EXCLUDED.{column}" for column in columns),
+            [
+                [key[0] for key in keys],
+                [key[1] for key in keys],
+                [key[2] for key in keys],
+            ] + [[rows[key][column] for key in keys] for column in columns],
+        )
+
+
+@transaction.atomic
+def rebuild_rollup(since=None):
+    """
+    Recompute DailyMoveRollup from completed moves, for every day or for days
+    from ``since`` on, in one INSERT ... SELECT. Returns the number of rows written.
+    """
+    from .models import DailyMoveRollup, StockMove, StockMoveLine
+
+    quote = connection.ops.quote_name
+    rollup = quote(DailyMoveRollup._meta.db_table)
+    moves = quote(StockMove._meta.db_table)
+    move_lines = quote(StockMoveLine._meta.db_table)
+    day = "(m.timestamp AT TIME ZONE %s)::date"
+    params = [settings.TIME_ZONE]
+    where = ''
+    if since is not None:
+        where = f"AND {day} >= %s"
+        params += [settings.TIME_ZONE, since]
+
+    def side(location_column, columns):
+        # One row per line for this side of the move, quantities in their column.
+        move_types = {column: move_type for move_type, column in columns.items()}
+        quantities = ', '.join(
+            f"CASE WHEN m.move_type = '{move_types[column]}' THEN l.quantity ELSE 0 END AS {column}"
+            if column in move_types else f"0 AS {column}"
+            for column in QUANTITY_COLUMNS
+        )
+        move_type_list = ', '.join(f"'{move_type}'" for move_type in columns)
+        return (
+            f"SELECT l.product_id, m.{location_column} AS location_id, {day} AS day, "
+            f"m.id AS move_id, {quantities} "
+            f"FROM {move_lines} l JOIN {moves} m ON m.id = l.stock_move_id "
+            f"WHERE m.completed AND m.{location_column} IS NOT NULL "
+            f"AND m.move_type IN ({move_type_list}) {where}"
+        )
+
+    with connection.cursor() as cursor:
+        if since is None:
+            cursor.execute(f"DELETE FROM {rollup}")
+        else:
+            cursor.execute(f"DELETE FROM {rollup} WHERE day >= %s", [since])
+        sums = ', '.join(f"SUM({column})" for column in QUANTITY_COLUMNS)
+        cursor.execute(
+            f"INSERT INTO {rollup} (product_id, location_id, day, {', '.join(QUANTITY_COLUMNS)}, move_count) "
+            f"SELECT product_id, location_id, day, {sums}, COUNT(DISTINCT move_id) FROM ("
+            f"{side('to_location_id', DESTINATION_COLUMNS)} UNION ALL "
+            f"{side('from_location_id', SOURCE_COLUMNS)}"
+            f") effects GROUP BY product_id, location_id, day",
+            params * 2,
+        )
+        return cursor.rowcount
@@ -1,5 +1,8 @@
+from collections import defaultdict
 from rest_framework import serializers
 from .models import StockMove, StockMoveLine
+from inventory.locations.models import Location
+from inventory.products.models import Product
 from inventory.products.serializers import ProductSerializer
 from inventory.locations.serializers import LocationSerializer
 
@@ -12,10 +15,102 @@ class StockMoveLineSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('stock_move',)  # Make stock_move read-only
 
+class StockMoveHistorySerializer(serializers.ModelSerializer):
+    """One product's line of a move, flattened with the move's header fields"""
+    line_id = serializers.IntegerField(source='id', read_only=True)
+    move_id = serializers.IntegerField(source='stock_move_id', read_only=True)
+    move_type = serializers.CharField(source='stock_move.move_type', read_only=True)
+    reference = serializers.CharField(source='stock_move.reference', read_only=True)
+    timestamp = serializers.DateTimeField(source='stock_move.timestamp', read_only=True)
+    completed = serializers.BooleanField(source='stock_move.completed', read_only=True)
+    from_location = serializers.IntegerField(source='stock_move.from_location_id', read_only=True)
+    from_location_name = serializers.CharField(source='stock_move.from_location.name', read_only=True, default=None)
+    to_location = serializers.IntegerField(source='stock_move.to_location_id', read_only=True)
+    to_location_name = serializers.CharField(source='stock_move.to_location.name', read_only=True, default=None)
+    
+    class Meta:
+        model = StockMoveLine
+        fields = [
+            'line_id', 'move_id', 'move_type', 'reference', 'timestamp', 'completed',
+            'from_location', 'from_location_name', 'to_location', 'to_location_name',
+            'product', 'quantity', 'description',
+        ]
+
+def prefetch_line_products(items):
+    """Fetch every product referenced by the lines of ``items`` with one in_bulk()"""
+    product_ids = set()
+    for item in items:
+        lines = item.get('lines') if isinstance(item, dict) else None
+        if not isinstance(lines, list):
+            continue
+        for line in lines:
+            if not isinstance(line, dict) or isinstance(line.get('product'), bool):
+                continue
+            try:
+                product_ids.add(int(line.get('product')))
+            except (TypeError, ValueError):
+                pass
+    return Product.objects.in_bulk(product_ids)
+
+def prefetch_move_locations(items):
+    """Fetch every source and destination location of ``items`` with one in_bulk()"""
+    location_ids = set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        for field in ('from_location', 'to_location'):
+            value = item.get(field)
+            if value is None or isinstance(value, bool):
+                continue
+            try:
+                location_ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+    return Location.objects.in_bulk(location_ids)
+
+class PrefetchedPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field resolved from ``context[context_key]`` (a ``{pk: instance}``
+    map filled with in_bulk()) instead of one SELECT per value. Falls back to
+    the queryset when no map is given.
+    """
+    context_key = None
+    
+    def to_internal_value(self, data):
+        instances = self.context.get(self.context_key)
+        if instances is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            instance = instances.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+class PrefetchedProductField(PrefetchedPrimaryKeyField):
+    """Product field backed by prefetch_line_products()"""
+    context_key = 'products'
+
+class PrefetchedLocationField(PrefetchedPrimaryKeyField):
+    """Location field backed by prefetch_move_locations()"""
+    context_key = 'locations'
+
 class StockMoveLineCreateSerializer(serializers.ModelSerializer):
+    product = PrefetchedProductField(queryset=Product.objects.all())
+    
     class Meta:
         model = StockMoveLine
         fields = ['product', 'quantity', 'description']
+        extra_kwargs = {'quantity': {'min_value': 1}}
+
+class StockMoveLineUpdateSerializer(StockMoveLineCreateSerializer):
+    id = serializers.IntegerField(required=False)
+    
+    class Meta(StockMoveLineCreateSerializer.Meta):
+        fields = ['id', 'product', 'quantity', 'description']
 
 class StockMoveSerializer(serializers.ModelSerializer):
     from_location_name = serializers.CharField(source='from_location.name', read_only=True)
@@ -25,9 +120,11 @@ class StockMoveSerializer(serializers.ModelSerializer):
     class Meta:
         model = StockMove
         fields = '__all__'
-        read_only_fields = ('timestamp',)
+        read_only_fields = ('timestamp', 'completed_at')
 
 class StockMoveCreateSerializer(serializers.ModelSerializer):
+    from_location = PrefetchedLocationField(queryset=Location.objects.all(), required=False, allow_null=True)
+    to_location = PrefetchedLocationField(queryset=Location.objects.all(), required=False, allow_null=True)
     lines = StockMoveLineCreateSerializer(many=True, required=False)
     
     class Meta:
@@ -35,6 +132,20 @@ class StockMoveCreateSerializer(serializers.ModelSerializer):
         fields = ['move_type', 'from_location', 'to_location', 'reference', 'description', 'lines']
         read_only_fields = ('timestamp', 'completed')
     
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            # Existing lines may be addressed by id when editing a move.
+            fields['lines'] = StockMoveLineUpdateSerializer(many=True, required=False)
+        return fields
+    
+    def to_internal_value(self, data):
+        if 'products' not in self.context:
+            self._context['products'] = prefetch_line_products([data])
+        if 'locations' not in self.context:
+            self._context['locations'] = prefetch_move_locations([data])
+        return super().to_internal_value(data)
+    
     def validate(self, data):
         move_type = data.get('move_type')
         from_location = data.get('from_location')
@@ -47,14 +158,39 @@ class StockMoveCreateSerializer(serializers.ModelSerializer):
         if move_type == 'TRANSFER' and (not from_location or not to_location):
             raise serializers.ValidationError("TRANSFER moves require both source and destination locations")
         
+        if self.instance is not None and data.get('lines') is not None:
+            self.validate_line_ids(data['lines'])
+        
         return data
     
+    def validate_line_ids(self, lines_data):
+        """
+        Line ids given when editing must be distinct lines of this move; lines
+        without an id are new and need a product and quantity.
+        """
+        lines = self.instance.lines.all().order_by('pk')
+        self._existing_lines = {line.pk: line for line in lines}
+        seen = set()
+        for line_data in lines_data:
+            line_id = line_data.get('id')
+            if line_id is None:
+                if 'product' not in line_data or 'quantity' not in line_data:
+                    raise serializers.ValidationError(
+                        {'lines': "Lines without an id require a product and quantity"}
+                    )
+                continue
+            if line_id not in self._existing_lines or line_id in seen:
+                raise serializers.ValidationError(
+                    {'lines': f"Line {line_id} does not belong to this stock move"}
+                )
+            seen.add(line_id)
+    
     def create(self, validated_data):
         lines_data = validated_data.pop('lines', [])
         stock_move = StockMove.objects.create(**validated_data)
-        
-        for line_data in lines_data:
-            StockMoveLine.objects.create(stock_move=stock_move, **line_data)
+        StockMoveLine.objects.bulk_create([
+            StockMoveLine(stock_move=stock_move, **line_data) for line_data in lines_data
+        ])
         
         return stock_move
     
@@ -66,9 +202,73 @@ class StockMoveCreateSerializer(serializers.ModelSerializer):
         instance.save()
         
         if lines_data is not None:
-            instance.lines.all().delete()
+            self.update_lines(instance, lines_data)
+        
+        return instance
+    
+    def update_lines(self, instance, lines_data):
+        """
+        Reconcile the move's lines with ``lines_data`` in at most three writes.
+        
+        Items are matched to existing lines by ``id`` when given, otherwise to an
+        unmatched line of the same product, so primary keys of kept lines stay
+        stable. Fields an item leaves out keep the matched line's stored values.
+        Changed lines are bulk updated, new ones bulk created and the rest
+        deleted with one query.
+        """
+        # Loaded and checked against the line ids by validate().
+        existing = self._existing_lines
+        matched = {
+            index: line_data['id']
+            for index, line_data in enumerate(lines_data) if line_data.get('id') is not None
+        }
+        
+        unmatched_by_product = defaultdict(list)
+        for line in existing.values():
+            if line.pk not in matched.values():
+                unmatched_by_product[line.product_id].append(line)
+        
+        fields = ('product', 'quantity', 'description')
+        to_update, to_create, kept = [], [], set(matched.values())
+        for index, line_data in enumerate(lines_data):
+            if index in matched:
+                line = existing[matched[index]]
+            else:
+                candidates = unmatched_by_product[line_data['product'].pk]
+                line = candidates.pop(0) if candidates else None
             
-            for line_data in lines_data:
-                StockMoveLine.objects.create(stock_move=instance, **line_data)
+            values = {field: line_data[field] for field in fields if field in line_data}
+            if line is None:
+                to_create.append(StockMoveLine(stock_move=instance, **values))
+                continue
+            kept.add(line.pk)
+            stored = {
+                'product': line.product_id,
+                'quantity': line.quantity,
+                'description': line.description,
+            }
+            if any(
+                (value.pk if field == 'product' else value) != stored[field]
+                for field, value in values.items()
+            ):
+                for field, value in values.items():
+                    setattr(line, field, value)
+                to_update.append(line)
         
-        return instance
\ No newline at end of file
+        removed = [pk for pk in existing if pk not in kept]
+        if removed:
+            StockMoveLine.objects.filter(pk__in=removed).delete()
+        if to_update:
+            StockMoveLine.objects.bulk_update(to_update, fields)
+        if to_create:
+            StockMoveLine.objects.bulk_create(to_create)
+
+class OrderAllocationLineSerializer(serializers.Serializer):
+    # Plain ids: unknown products simply have no stock and come back unallocated.
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class OrderAllocationSerializer(serializers.Serializer):
+    lines = OrderAllocationLineSerializer(many=True, allow_empty=False)
+    locations = serializers.ListField(child=serializers.IntegerField(), required=False)
+    reference = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
@@ -1,13 +1,36 @@
+import json
+from datetime import timedelta
+from io import StringIO
+import numpy as np
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from .models import StockMove, StockMoveLine
-from inventory.products.models import Product, ProductCategory
+from .models import DailyMoveRollup, StockMove, StockMoveJob, StockMoveLine
+from .allocation import allocate_order, exact_cover, greedy_cover
+from .engine import apply_moves
+from .queue import (
+    claim_jobs, group_disjoint, process_group, process_pending, requeue_stale
+)
+from .serializers import StockMoveCreateSerializer
+from inventory.products.models import Product, ProductCategory, InventoryLevel
 from inventory.locations.models import Location
 
 User = get_user_model()
 
+def explain_keyset_page(queries):
+    """EXPLAIN the captured query that applied a keyset cursor, index scans only"""
+    sql = next(query['sql'] for query in queries if ') < (' in query['sql'])
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('SET LOCAL enable_bitmapscan = off')
+        cursor.execute('EXPLAIN ' + sql)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
 class StockMoveModelTest(TestCase):
     def setUp(self):
         self.category = ProductCategory.objects.create(name="Electronics")
@@ -225,4 +248,719 @@ class StockMoveAPITest(APITestCase):
         move.refresh_from_db()
         self.assertTrue(move.completed)
         self.product.refresh_from_db()
-        self.assertEqual(self.product.quantity_on_hand, 15)  # 20 - 5
\ No newline at end of file
+        self.assertEqual(self.product.quantity_on_hand, 15)  # 20 - 5
+    
+    def test_bulk_create_reports_partial_failures(self):
+        payload = [
+            {
+                "move_type": "INBOUND",
+                "to_location": self.location1.id,
+                "reference": "BULK01",
+                "lines": [{"product": self.product.id, "quantity": 10}]
+            },
+            {
+                "move_type": "OUTBOUND",
+                "from_location": self.location1.id,
+                "reference": "BULK02",
+                "lines": [{"product": self.product.id, "quantity": 500}]
+            },
+            {
+                "move_type": "TRANSFER",
+                "from_location": self.location1.id,
+                "reference": "BULK03",
+                "lines": [{"product": self.product.id, "quantity": 1}]
+            },
+            {
+                "move_type": "TRANSFER",
+                "from_location": self.location1.id,
+                "to_location": self.location2.id,
+                "reference": "BULK04",
+                "lines": [{"product": self.product.id, "quantity": 5}]
+            },
+        ]
+        
+        response = self.client.post('/api/stockmoves/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'error', 'error', 'created']
+        )
+        self.assertIn("Insufficient stock", str(response.data['results'][1]['errors']))
+        
+        self.assertEqual(StockMove.objects.count(), 2)
+        self.assertTrue(all(move.completed for move in StockMove.objects.all()))
+        self.assertEqual(StockMoveLine.objects.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_on_hand, 30)
+    
+    def test_bulk_create_query_count_is_independent_of_move_count(self):
+        locations = [
+            Location.objects.create(code=f"BQ{number}", name=f"Bulk {number}") for number in range(10)
+        ]
+        payload = [
+            {
+                "move_type": "TRANSFER",
+                "from_location": self.location1.id,
+                "to_location": location.id,
+                "lines": [{"product": self.product.id, "quantity": 1}]
+            }
+            for location in locations
+        ]
+        InventoryLevel.objects.create(product=self.product, location=self.location1, quantity=20)
+        
+        # Products and locations are each fetched once for the whole request.
+        with self.assertNumQueries(14):
+            response = self.client.post('/api/stockmoves/bulk/', payload[:2], format='json')
+        self.assertEqual(response.data['created'], 2)
+        with self.assertNumQueries(14):
+            response = self.client.post('/api/stockmoves/bulk/', payload[2:], format='json')
+        self.assertEqual(response.data['created'], 8)
+    
+    def test_bulk_create_accepts_ndjson(self):
+        body = "\n".join([
+            '{"move_type": "INBOUND", "to_location": %d, "lines": [{"product": %d, "quantity": 2}]}'
+            % (self.location1.id, self.product.id)
+        ] * 3)
+        
+        response = self.client.post(
+            '/api/stockmoves/bulk/', body, content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_on_hand, 26)
+    
+    def test_bulk_create_rejects_zero_quantities_and_empty_batches(self):
+        payload = [
+            {
+                "move_type": "INBOUND",
+                "to_location": self.location1.id,
+                "lines": [{"product": self.product.id, "quantity": quantity}]
+            }
+            for quantity in (0, 3)
+        ]
+        
+        response = self.client.post('/api/stockmoves/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['error', 'created']
+        )
+        self.assertIn('lines', response.data['results'][0]['errors'])
+        self.assertEqual(StockMove.objects.count(), 1)
+        
+        response = self.client.post('/api/stockmoves/bulk/', [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_cursor_pagination(self):
+        for number in range(5):
+            StockMove.objects.create(
+                move_type="INBOUND", to_location=self.location1, reference=f"CUR{number}"
+            )
+        same_time = StockMove.objects.get(reference="CUR1").timestamp
+        StockMove.objects.filter(reference__in=["CUR2", "CUR3"]).update(timestamp=same_time)
+        expected = list(StockMove.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        
+        seen = []
+        url = '/api/stockmoves/?pagination=cursor&page_size=2'
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(move['id'] for move in response.data['results'])
+            url = response.data['next']
+        
+        self.assertEqual(seen, expected)
+        
+        response = self.client.get('/api/stockmoves/?cursor=bogus')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_cursor_is_an_index_condition(self):
+        for number in range(3):
+            StockMove.objects.create(move_type="INBOUND", to_location=self.location1)
+        response = self.client.get('/api/stockmoves/?pagination=cursor&page_size=1')
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'])
+        # A row comparison seeks into the (timestamp, id) index instead of filtering.
+        self.assertIn('Index Cond: (ROW("timestamp", id) < ROW(', explain_keyset_page(queries))
+
+    def test_create_validates_products_with_one_query(self):
+        products = [
+            Product.objects.create(
+                name=f"Bulk {i}", internal_reference=f"BK{i}", sales_price=10.00, cost=5.00,
+                product_category=self.category
+            )
+            for i in range(55)
+        ]
+        
+        def payload(line_products):
+            return {
+                "move_type": "INBOUND",
+                "to_location": self.location1.id,
+                "lines": [{"product": product.id, "quantity": 1} for product in line_products]
+            }
+        
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/stockmoves/', payload(products[:5]), format='json')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post('/api/stockmoves/', payload(products[5:]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['lines']), 50)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        
+        invalid = payload(products[:1])
+        invalid["lines"].append({"product": 999999, "quantity": 1})
+        response = self.client.post('/api/stockmoves/', invalid, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('product', response.data['error']['details']['lines'][1])
+    
+    def test_update_diffs_lines_and_keeps_ids(self):
+        products = [
+            Product.objects.create(
+                name=f"Draft {i}", internal_reference=f"DR{i}", sales_price=10.00, cost=5.00,
+                product_category=self.category
+            )
+            for i in range(20)
+        ]
+        move = StockMove.objects.create(move_type="INBOUND", to_location=self.location1)
+        lines = StockMoveLine.objects.bulk_create([
+            StockMoveLine(stock_move=move, product=product, quantity=1) for product in products
+        ])
+        payload = [{"product": line.product_id, "quantity": line.quantity} for line in lines]
+        payload[0]["quantity"] = 9
+        payload[1] = {"id": lines[1].pk, "product": products[1].id, "quantity": 4}
+        del payload[2]
+        payload.append({"product": self.product.id, "quantity": 3})
+        
+        serializer = StockMoveCreateSerializer(move, data={"lines": payload}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        # Move UPDATE, DELETE, bulk UPDATE and INSERT; lines were read by validation.
+        with self.assertNumQueries(4):
+            serializer.save()
+        
+        current = {line.pk: line for line in move.lines.all()}
+        self.assertEqual(len(current), 20)
+        self.assertNotIn(lines[2].pk, current)
+        self.assertEqual(current[lines[0].pk].quantity, 9)
+        self.assertEqual(current[lines[1].pk].quantity, 4)
+        self.assertEqual(current[lines[19].pk].quantity, 1)
+        
+        response = self.client.patch(
+            f'/api/stockmoves/{move.id}/', {"lines": [{"id": 0, "product": self.product.id, "quantity": 1}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('lines', response.data['error']['details'])
+    
+    def test_patch_partial_lines_keeps_stored_fields(self):
+        move = StockMove.objects.create(move_type="INBOUND", to_location=self.location1)
+        line = StockMoveLine.objects.create(
+            stock_move=move, product=self.product, quantity=1, description="Pallet 4"
+        )
+        url = f'/api/stockmoves/{move.id}/'
+        
+        response = self.client.patch(
+            url, {"lines": [{"id": line.pk, "quantity": 6}]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        line.refresh_from_db()
+        self.assertEqual(
+            (line.product_id, line.quantity, line.description),
+            (self.product.id, 6, "Pallet 4"),
+        )
+        
+        response = self.client.patch(
+            url, {"lines": [{"product": self.product.id, "quantity": 2}]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        line.refresh_from_db()
+        self.assertEqual((line.quantity, line.description), (2, "Pallet 4"))
+        
+        response = self.client.patch(url, {"lines": [{"quantity": 3}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('lines', response.data['error']['details'])
+        self.assertEqual(move.lines.get().quantity, 2)
+    
+    def test_by_product_history_is_paginated_per_line(self):
+        other = Product.objects.create(
+            name="Other", internal_reference="OT", sales_price=10.00, cost=5.00,
+            product_category=self.category, quantity_on_hand=0
+        )
+        move_ids = []
+        for reference in ("H1", "H2", "H3"):
+            data = dict(self.stock_move_data, reference=reference, move_type="INBOUND", from_location=None)
+            data["lines"] = [{"product": self.product.id, "quantity": 1}, {"product": other.id, "quantity": 2}]
+            move_ids.append(self.client.post('/api/stockmoves/', data, format='json').data['id'])
+        
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/stockmoves/by_product/', {'product_id': self.product.id, 'page_size': 2})
+        self.assertEqual([row['move_id'] for row in response.data['results']], [move_ids[2], move_ids[1]])
+        self.assertEqual(response.data['results'][0]['reference'], "H3")
+        self.assertEqual(response.data['results'][0]['quantity'], 1)
+        self.assertEqual(response.data['results'][0]['to_location_name'], "Warehouse 2")
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(response.data['next'])
+        self.assertEqual([row['move_id'] for row in response.data['results']], [move_ids[0]])
+        self.assertIsNone(response.data['next'])
+        # Deep pages seek into the (product, stock_move, id) index instead of
+        # filtering every newer line of the product.
+        self.assertRegex(
+            explain_keyset_page(queries),
+            r'Index Cond: \(\(product_id = \d+\) AND \(ROW\(stock_move_id, id\) < ROW\('
+        )
+        
+        response = self.client.get('/api/stockmoves/by_product/', {'product_id': self.product.id, 'from': '2999-01-01'})
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get('/api/stockmoves/by_product/', {'product_id': self.product.id, 'to': 'soon'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_export_streams_csv_and_ndjson(self):
+        self.client.post('/api/stockmoves/', self.stock_move_data, format='json')
+        
+        response = self.client.get('/api/stockmoves/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0].split(',')[0], 'move_id')
+        self.assertEqual(len(rows), 2)
+        self.assertIn('API001', rows[1])
+        
+        response = self.client.get('/api/stockmoves/export/', {'output': 'ndjson', 'move_type': 'TRANSFER'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['from_location'], 'WH1')
+        self.assertEqual(records[0]['quantity'], 5)
+        
+        response = self.client.get('/api/stockmoves/export/', {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+class StockMoveEngineTest(TestCase):
+    def setUp(self):
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.location1 = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.location2 = Location.objects.create(code="WH2", name="Warehouse 2")
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}",
+                internal_reference=f"EP{i}",
+                sales_price=100.00,
+                cost=50.00,
+                product_category=self.category,
+                quantity_on_hand=0
+            )
+            for i in range(20)
+        ]
+    
+    def create_move(self, move_type, products, quantity, **locations):
+        move = StockMove.objects.create(move_type=move_type, **locations)
+        StockMoveLine.objects.bulk_create([
+            StockMoveLine(stock_move=move, product=product, quantity=quantity)
+            for product in products
+        ])
+        return move
+    
+    def test_query_count_is_independent_of_line_count(self):
+        small = self.create_move("INBOUND", self.products[:1], 10, to_location=self.location1)
+        large = self.create_move("INBOUND", self.products[1:], 10, to_location=self.location1)
+        
+        with self.assertNumQueries(11):
+            small.execute_move()
+        with self.assertNumQueries(11):
+            large.execute_move()
+        
+        levels = InventoryLevel.objects.filter(location=self.location1)
+        self.assertEqual(levels.count(), 20)
+        self.assertTrue(all(level.quantity == 10 for level in levels))
+        self.assertEqual(Product.objects.filter(quantity_on_hand=10).count(), 20)
+    
+    def test_transfer_updates_both_locations(self):
+        self.create_move("INBOUND", self.products, 10, to_location=self.location1).execute_move()
+        InventoryLevel.objects.bulk_create([
+            InventoryLevel(product=product, location=self.location2, quantity=0)
+            for product in self.products
+        ])
+        transfer = self.create_move(
+            "TRANSFER", self.products, 4,
+            from_location=self.location1, to_location=self.location2
+        )
+        
+        with self.assertNumQueries(10):
+            transfer.execute_move()
+        
+        source = InventoryLevel.objects.get(product=self.products[0], location=self.location1)
+        dest = InventoryLevel.objects.get(product=self.products[0], location=self.location2)
+        self.assertEqual(source.quantity, 6)
+        self.assertEqual(dest.quantity, 4)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).quantity_on_hand, 10)
+    
+    def test_insufficient_line_rolls_back_whole_move(self):
+        self.create_move("INBOUND", self.products[:2], 5, to_location=self.location1).execute_move()
+        outbound = StockMove.objects.create(move_type="OUTBOUND", from_location=self.location1)
+        StockMoveLine.objects.create(stock_move=outbound, product=self.products[0], quantity=3)
+        StockMoveLine.objects.create(stock_move=outbound, product=self.products[1], quantity=8)
+        
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            outbound.execute_move()
+        
+        level = InventoryLevel.objects.get(product=self.products[0], location=self.location1)
+        self.assertEqual(level.quantity, 5)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).quantity_on_hand, 5)
+
+class StockMoveQueueTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Queued Product",
+            internal_reference="QP",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category,
+            quantity_on_hand=10
+        )
+        self.other = Product.objects.create(
+            name="Other Product",
+            internal_reference="OP",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category,
+            quantity_on_hand=10
+        )
+        self.location = Location.objects.create(code="WH1", name="Warehouse 1")
+        InventoryLevel.objects.create(product=self.product, location=self.location, quantity=10)
+    
+    def move_data(self, move_type, quantity, product=None):
+        location = 'to_location' if move_type == 'INBOUND' else 'from_location'
+        return {
+            "move_type": move_type,
+            location: self.location.id,
+            "lines": [{"product": (product or self.product).id, "quantity": quantity}]
+        }
+    
+    def test_async_create_queues_until_processed(self):
+        response = self.client.post('/api/stockmoves/?async=true', self.move_data('INBOUND', 5), format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'PENDING')
+        move_id = response.data['id']
+        self.assertFalse(StockMove.objects.get(pk=move_id).completed)
+        self.assertEqual(InventoryLevel.objects.get(product=self.product).quantity, 10)
+        
+        response = self.client.post(f'/api/stockmoves/{move_id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        out = StringIO()
+        call_command('process_stock_moves', '--once', '--workers', '1', stdout=out)
+        self.assertIn('Applied 1 moves, 0 failed', out.getvalue())
+        
+        response = self.client.get(f'/api/stockmoves/{move_id}/status/')
+        self.assertEqual(response.data['status'], 'DONE')
+        self.assertTrue(response.data['completed'])
+        self.assertEqual(InventoryLevel.objects.get(product=self.product).quantity, 15)
+    
+    def test_failed_moves_report_their_error(self):
+        ok = self.client.post('/api/stockmoves/?async=true', self.move_data('OUTBOUND', 4), format='json')
+        too_much = self.client.post('/api/stockmoves/?async=true', self.move_data('OUTBOUND', 7), format='json')
+        
+        self.assertEqual(process_pending(workers=1), (1, 1))
+        self.assertEqual(process_pending(workers=1), (0, 0))
+        
+        self.assertEqual(StockMoveJob.objects.get(pk=ok.data['id']).status, 'DONE')
+        response = self.client.get(f"/api/stockmoves/{too_much.data['id']}/status/")
+        self.assertEqual(response.data['status'], 'FAILED')
+        self.assertEqual(response.data['error'], 'Insufficient stock at location')
+        self.assertFalse(response.data['completed'])
+        self.assertEqual(InventoryLevel.objects.get(product=self.product).quantity, 6)
+    
+    def test_requeued_job_is_applied_once(self):
+        response = self.client.post(
+            '/api/stockmoves/?async=true', self.move_data('INBOUND', 5), format='json'
+        )
+        move = StockMove.objects.get(pk=response.data['id'])
+        lines = {move.pk: [(self.product.id, 5)]}
+        
+        # A slow worker's claim goes stale and another worker takes the job over.
+        slow_token, _ = claim_jobs(10)
+        self.assertEqual(requeue_stale(timedelta(0)), 1)
+        self.assertEqual(process_pending(workers=1), (1, 0))
+        self.assertEqual(process_group([move], lines, slow_token), (0, 0))
+        
+        # A finished job pushed back into the queue does not apply the move again.
+        StockMoveJob.objects.filter(pk=move.pk).update(status='PENDING')
+        self.assertEqual(process_pending(workers=1), (1, 0))
+        with self.assertRaisesMessage(ValueError, "already been applied"):
+            apply_moves([move])
+        
+        self.assertEqual(StockMoveJob.objects.get(pk=move.pk).status, 'DONE')
+        self.assertEqual(InventoryLevel.objects.get(product=self.product).quantity, 15)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_on_hand, 15)
+    
+    def test_group_disjoint_keeps_conflicting_moves_together(self):
+        moves = [
+            StockMove(pk=1, move_type='INBOUND', to_location_id=self.location.id),
+            StockMove(pk=2, move_type='INBOUND', to_location_id=self.location.id),
+            StockMove(pk=3, move_type='OUTBOUND', from_location_id=self.location.id),
+        ]
+        lines = [[(self.product.id, 1)], [(self.other.id, 1)], [(self.product.id, 1)]]
+        
+        groups = group_disjoint(moves, lines, groups=4)
+        self.assertEqual(
+            sorted([move.pk for move in group] for group in groups),
+            [[1, 3], [2]]
+        )
+        self.assertEqual(len(group_disjoint(moves, lines, groups=1)), 1)
+    
+    def test_status_of_synchronous_move(self):
+        response = self.client.post('/api/stockmoves/', self.move_data('INBOUND', 1), format='json')
+        response = self.client.get(f"/api/stockmoves/{response.data['id']}/status/")
+        self.assertEqual(response.data['status'], 'DONE')
+    
+    def test_stress_harness_reports_consistent_balances(self):
+        out = StringIO()
+        call_command(
+            'stress_stock_moves', '--moves', '40', '--concurrency', '1', '--products', '5',
+            '--initial-stock', '10', '--seed', '7', stdout=out
+        )
+        self.assertIn('Moves: 40', out.getvalue())
+        self.assertIn('Final balances are consistent', out.getvalue())
+        self.assertFalse(Product.objects.filter(internal_reference__startswith='STRESS-').exists())
+
+class DailyMoveRollupTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        self.category = ProductCategory.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Rolled Product",
+            internal_reference="RP",
+            sales_price=100.00,
+            cost=50.00,
+            product_category=self.category,
+            quantity_on_hand=0
+        )
+        self.location1 = Location.objects.create(code="WH1", name="Warehouse 1")
+        self.location2 = Location.objects.create(code="WH2", name="Warehouse 2")
+    
+    def post_move(self, move_type, quantity, **locations):
+        data = {"move_type": move_type, "lines": [{"product": self.product.id, "quantity": quantity}]}
+        data.update({key: location.id for key, location in locations.items()})
+        response = self.client.post('/api/stockmoves/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    def rollup(self):
+        return {
+            row.location.code: (
+                row.inbound_quantity, row.outbound_quantity,
+                row.transfer_in_quantity, row.transfer_out_quantity, row.move_count
+            )
+            for row in DailyMoveRollup.objects.select_related('location')
+        }
+    
+    def test_moves_accumulate_into_daily_rows(self):
+        self.post_move("INBOUND", 20, to_location=self.location1)
+        self.post_move("INBOUND", 5, to_location=self.location1)
+        self.post_move("TRANSFER", 8, from_location=self.location1, to_location=self.location2)
+        self.post_move("OUTBOUND", 3, from_location=self.location2)
+        
+        self.assertEqual(self.rollup(), {
+            'WH1': (25, 0, 0, 8, 3),
+            'WH2': (0, 3, 8, 0, 2),
+        })
+        self.assertEqual(DailyMoveRollup.objects.get(location=self.location2).day, timezone.localdate())
+    
+    def test_rejected_moves_are_not_rolled_up(self):
+        self.post_move("INBOUND", 2, to_location=self.location1)
+        response = self.client.post('/api/stockmoves/bulk/', [
+            {"move_type": "OUTBOUND", "from_location": self.location1.id,
+             "lines": [{"product": self.product.id, "quantity": 5}]},
+            {"move_type": "OUTBOUND", "from_location": self.location1.id,
+             "lines": [{"product": self.product.id, "quantity": 1}]},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(self.rollup(), {'WH1': (2, 1, 0, 0, 2)})
+    
+    def test_rebuild_matches_incremental_rows(self):
+        self.post_move("INBOUND", 20, to_location=self.location1)
+        self.post_move("TRANSFER", 8, from_location=self.location1, to_location=self.location2)
+        self.post_move("OUTBOUND", 3, from_location=self.location2)
+        incremental = self.rollup()
+        
+        DailyMoveRollup.objects.update(outbound_quantity=99)
+        out = StringIO()
+        call_command('rebuild_move_rollup', stdout=out)
+        self.assertIn('Wrote 2 rollup rows', out.getvalue())
+        self.assertEqual(self.rollup(), incremental)
+        
+        call_command('rebuild_move_rollup', '--since', timezone.localdate().isoformat(), stdout=out)
+        self.assertEqual(self.rollup(), incremental)
+
+class ReplenishmentTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        self.main = Location.objects.create(code="MAIN", name="Main Warehouse", is_reserve=True)
+        self.staging = Location.objects.create(code="STAGING", name="Staging Area", is_reserve=True)
+        self.pick1 = Location.objects.create(code="PICK1", name="Pick face 1")
+        self.pick2 = Location.objects.create(code="PICK2", name="Pick face 2")
+        self.a = Product.objects.create(name="A", internal_reference="RA", sales_price=1, cost=1)
+        self.b = Product.objects.create(name="B", internal_reference="RB", sales_price=1, cost=1)
+        
+        InventoryLevel.objects.bulk_create([
+            InventoryLevel(product=self.a, location=self.main, quantity=10),
+            InventoryLevel(product=self.a, location=self.staging, quantity=20),
+            InventoryLevel(product=self.b, location=self.main, quantity=0),
+            InventoryLevel(product=self.b, location=self.staging, quantity=5),
+            InventoryLevel(product=self.a, location=self.pick1, quantity=2, reorder_point=5, max_quantity=15),
+            InventoryLevel(product=self.b, location=self.pick1, quantity=0, reorder_point=2, max_quantity=4),
+            InventoryLevel(product=self.a, location=self.pick2, quantity=1, reorder_point=3),
+            InventoryLevel(product=self.b, location=self.pick2, quantity=9, reorder_point=3),
+        ])
+    
+    def planned(self, data):
+        return {
+            (move['from_location_code'], move['to_location_code']):
+                [(line['product'], line['quantity']) for line in move['lines']]
+            for move in data['moves']
+        }
+    
+    def test_preview_fills_deepest_shortfall_from_reserves_in_order(self):
+        response = self.client.get('/api/stockmoves/replenishment/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.planned(response.data), {
+            ('MAIN', 'PICK1'): [(self.a.id, 10)],
+            ('STAGING', 'PICK1'): [(self.a.id, 3), (self.b.id, 4)],
+            ('STAGING', 'PICK2'): [(self.a.id, 2)],
+        })
+        self.assertEqual(response.data['unfilled'], [])
+        self.assertFalse(StockMove.objects.exists())
+        
+        response = self.client.get('/api/stockmoves/replenishment/', {'reserve': str(self.main.id)})
+        self.assertEqual(self.planned(response.data), {('MAIN', 'PICK1'): [(self.a.id, 10)]})
+        self.assertEqual(
+            [(row['location_code'], row['needed'], row['planned']) for row in response.data['unfilled']],
+            [('PICK1', 13, 10), ('PICK2', 2, 0), ('PICK1', 4, 0)]
+        )
+        
+        response = self.client.get('/api/stockmoves/replenishment/', {'location_id': self.pick2.id})
+        self.assertEqual(self.planned(response.data), {('MAIN', 'PICK2'): [(self.a.id, 2)]})
+        
+        response = self.client.get('/api/stockmoves/replenishment/', {'reserve': 'main'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_confirm_creates_transfers_in_one_transaction(self):
+        response = self.client.post('/api/stockmoves/replenishment/', [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StockMove.objects.filter(reference='REPLENISH').exists())
+        
+        response = self.client.post('/api/stockmoves/replenishment/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['moves']), 3)
+        self.assertEqual(
+            StockMove.objects.filter(move_type='TRANSFER', reference='REPLENISH', completed=True).count(), 3
+        )
+        
+        def level(product, location):
+            return InventoryLevel.objects.get(product=product, location=location).quantity
+        
+        self.assertEqual(level(self.a, self.pick1), 15)
+        self.assertEqual(level(self.a, self.pick2), 3)
+        self.assertEqual(level(self.b, self.pick1), 4)
+        self.assertEqual(level(self.a, self.main), 0)
+        self.assertEqual(level(self.a, self.staging), 15)
+        
+        response = self.client.post('/api/stockmoves/replenishment/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['moves'], [])
+        
+        Location.objects.update(is_reserve=False)
+        response = self.client.get('/api/stockmoves/replenishment/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class OrderAllocationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        self.locations = [
+            Location.objects.create(code=f"L{i}", name=f"Location {i}") for i in range(1, 4)
+        ]
+        self.products = [
+            Product.objects.create(
+                name=f"P{i}", internal_reference=f"AP{i}", sales_price=1, cost=1, quantity_on_hand=20
+            )
+            for i in range(1, 5)
+        ]
+        # Greedy takes L1 (most stock) and then needs two more; L2 + L3 cover the order.
+        stock = {
+            0: [5, 5, 4, 0],
+            1: [5, 0, 5, 0],
+            2: [0, 5, 0, 5],
+        }
+        InventoryLevel.objects.bulk_create([
+            InventoryLevel(product=product, location=self.locations[location], quantity=quantity)
+            for location, quantities in stock.items()
+            for product, quantity in zip(self.products, quantities)
+        ])
+        self.order = [(product.id, 5) for product in self.products]
+    
+    def test_exact_solver_beats_greedy_on_small_orders(self):
+        stock = np.array([[5, 5, 0], [5, 0, 5], [4, 5, 0], [0, 0, 5]])
+        demand = np.array([5, 5, 5, 5])
+        greedy = greedy_cover(stock, demand)
+        self.assertEqual(greedy, [0, 2, 1])
+        self.assertEqual(exact_cover(stock, demand, greedy), [1, 2])
+        self.assertEqual(exact_cover(stock, demand, [1]), [1])
+    
+    def test_allocation_minimizes_source_locations_in_one_query(self):
+        with self.assertNumQueries(1):
+            result = allocate_order(self.order, reference="SO-1")
+        self.assertEqual(result['solver'], 'exact')
+        self.assertEqual(result['locations'], 2)
+        self.assertEqual(result['unallocated'], [])
+        self.assertEqual(
+            {move['from_location_code']: [(line['product'], line['quantity']) for line in move['lines']]
+             for move in result['moves']},
+            {
+                'L2': [(self.products[0].id, 5), (self.products[2].id, 5)],
+                'L3': [(self.products[1].id, 5), (self.products[3].id, 5)],
+            }
+        )
+        
+        response = self.client.post('/api/stockmoves/bulk/', result['moves'], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(StockMove.objects.filter(move_type='OUTBOUND', reference='SO-1').count(), 2)
+    
+    def test_endpoint_reports_unallocated_quantities(self):
+        response = self.client.post('/api/stockmoves/allocate/', {
+            'lines': [
+                {'product': self.products[0].id, 'quantity': 8},
+                {'product': self.products[0].id, 'quantity': 4},
+                {'product': self.products[3].id, 'quantity': 2},
+            ],
+            'locations': [self.locations[0].id, self.locations[2].id],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(move['from_location_code'], move['move_type']) for move in response.data['moves']],
+            [('L1', 'OUTBOUND'), ('L3', 'OUTBOUND')]
+        )
+        self.assertEqual(response.data['unallocated'], [
+            {'product': self.products[0].id, 'requested': 12, 'allocated': 5}
+        ])
+        
+        response = self.client.post('/api/stockmoves/allocate/', {'lines': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
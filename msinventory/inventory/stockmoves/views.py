@@ -1,41 +1,76 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.parsers import JSONParser
+from rest_framework.reverse import reverse
+from django.conf import settings
 from django.db import transaction
-from .models import StockMove, StockMoveLine
-from .serializers import StockMoveSerializer, StockMoveCreateSerializer
+from django.db.models import prefetch_related_objects
+from .engine import apply_moves, run_with_retry
+from .models import StockMove, StockMoveJob, StockMoveLine
+from .queue import enqueue_moves
+from .serializers import (
+    OrderAllocationSerializer, StockMoveSerializer, StockMoveCreateSerializer,
+    StockMoveHistorySerializer, prefetch_line_products, prefetch_move_locations
+)
 from utils.exceptions import InsufficientStockException
+from utils.helpers import parse_timestamp
+from utils.parsers import NDJSONParser
+from utils.pagination import KeysetPagination, KeysetPaginationMixin
+from utils.streaming import EXPORT_FORMATS, streaming_export
 
-class StockMoveViewSet(viewsets.ModelViewSet):
+class StockMoveViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = StockMove.objects.all().select_related('from_location', 'to_location').prefetch_related('lines__product')
+    keyset_ordering = ('-timestamp', '-id')
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return StockMoveCreateSerializer
         return StockMoveSerializer
     
+    def use_async(self, request):
+        value = request.query_params.get('async')
+        if value is None:
+            return settings.INVENTORY_ASYNC_MOVES
+        return value.lower() == 'true'
+    
+    def is_queued(self, move):
+        return StockMoveJob.objects.filter(
+            pk=move.pk, status__in=['PENDING', 'PROCESSING']
+        ).exists()
+    
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
+        if self.use_async(request):
+            return self.create_async(serializer)
+        
+        lines_data = serializer.validated_data.pop('lines', [])
+        
+        def create_move():
+            stock_move = StockMove(**serializer.validated_data, completed=True)
+            StockMove.objects.bulk_create([stock_move])
+            lines = StockMoveLine.objects.bulk_create([
+                StockMoveLine(stock_move=stock_move, **line_data) for line_data in lines_data
+            ])
+            
+            # Reuse the products resolved during validation instead of reloading them.
+            apply_moves([stock_move], lines=[[(line.product_id, line.quantity) for line in lines]])
+            return stock_move
+        
         try:
-            with transaction.atomic():
-                lines_data = serializer.validated_data.pop('lines', [])
-                stock_move = StockMove.objects.create(**serializer.validated_data, completed=True)
-                
-                for line_data in lines_data:
-                    StockMoveLine.objects.create(stock_move=stock_move, **line_data)
-                
-                stock_move.execute_move()
-                
-                response_serializer = StockMoveSerializer(stock_move)
-                
-                headers = self.get_success_headers(serializer.data)
-                return Response(
-                    response_serializer.data, 
-                    status=status.HTTP_201_CREATED, 
-                    headers=headers
-                )
+            stock_move = run_with_retry(create_move)
+            prefetch_related_objects([stock_move], 'lines__product')
+            
+            response_serializer = StockMoveSerializer(stock_move)
+            
+            headers = self.get_success_headers(serializer.data)
+            return Response(
+                response_serializer.data, 
+                status=status.HTTP_201_CREATED, 
+                headers=headers
+            )
         except ValueError as e:
             if "Insufficient stock" in str(e):
                 raise InsufficientStockException()
@@ -49,6 +84,28 @@ class StockMoveViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    def create_async(self, serializer):
+        """Persist the move as pending and queue it for process_stock_moves"""
+        with transaction.atomic():
+            lines_data = serializer.validated_data.pop('lines', [])
+            stock_move = StockMove.objects.create(**serializer.validated_data, completed=False)
+            StockMoveLine.objects.bulk_create([
+                StockMoveLine(stock_move=stock_move, **line_data) for line_data in lines_data
+            ])
+            job, = enqueue_moves([stock_move])
+        
+        return Response(
+            {
+                'id': stock_move.id,
+                'job_id': job.pk,
+                'status': job.status,
+                'status_url': self.request.build_absolute_uri(
+                    reverse('stockmove-status', kwargs={'pk': stock_move.id})
+                ),
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+    
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
@@ -58,6 +115,11 @@ class StockMoveViewSet(viewsets.ModelViewSet):
                 {'error': 'Cannot update a completed stock move'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if self.is_queued(instance):
+            return Response(
+                {'error': 'Cannot update a stock move queued for processing'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
@@ -78,11 +140,6 @@ class StockMoveViewSet(viewsets.ModelViewSet):
                 {'error': str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        except Exception as e:
-            return Response(
-                {'error': str(e)}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
     
     def perform_update(self, serializer):
         serializer.save()
@@ -96,12 +153,19 @@ class StockMoveViewSet(viewsets.ModelViewSet):
                 {'error': 'Move is already completed'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if self.is_queued(move):
+            return Response(
+                {'error': 'Move is queued for processing'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        def complete_move():
+            move.completed = True
+            move.save()
         
         try:
-            with transaction.atomic():
-                move.completed = True
-                move.save() 
-                return Response({'message': 'Move completed successfully'})
+            run_with_retry(complete_move)
+            return Response({'message': 'Move completed successfully'})
         except ValueError as e:
             if "Insufficient stock" in str(e):
                 raise InsufficientStockException()
@@ -110,8 +174,204 @@ class StockMoveViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=True, methods=['get'], url_path='status', url_name='status')
+    def move_status(self, request, pk=None):
+        """Processing state of a move; queued moves report their job's status"""
+        move = self.get_object()
+        job = StockMoveJob.objects.filter(pk=move.pk).first()
+        if job is None:
+            return Response({
+                'id': move.id,
+                'status': 'DONE' if move.completed else 'DRAFT',
+                'completed': move.completed,
+            })
+        return Response({
+            'id': move.id,
+            'job_id': job.pk,
+            'status': job.status,
+            'completed': move.completed,
+            'error': job.error,
+            'queued_at': job.created_at,
+            'finished_at': job.finished_at,
+        })
+    
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """Create and complete many moves at once, reporting failures per move"""
+        if not isinstance(request.data, list) or not request.data:
+            return Response(
+                {'error': 'Expected a non-empty list of stock moves'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = []
+        items = []
+        context = {
+            'products': prefetch_line_products(request.data),
+            'locations': prefetch_move_locations(request.data),
+        }
+        for index, item in enumerate(request.data):
+            serializer = StockMoveCreateSerializer(data=item, context=context)
+            if not serializer.is_valid():
+                results.append({'index': index, 'status': 'error', 'errors': serializer.errors})
+                continue
+            move_data = dict(serializer.validated_data)
+            lines_data = move_data.pop('lines', [])
+            results.append({'index': index, 'status': 'pending'})
+            items.append((index, move_data, lines_data))
+        
+        def create_moves():
+            moves = [StockMove(**move_data, completed=True) for _, move_data, _ in items]
+            StockMove.objects.bulk_create(moves)
+            errors = apply_moves(
+                moves,
+                lines=[
+                    [(line['product'].pk, line['quantity']) for line in lines_data]
+                    for _, _, lines_data in items
+                ],
+                partial=True,
+            )
+            
+            accepted, rejected = [], []
+            for (index, _, lines_data), move, error in zip(items, moves, errors):
+                if error:
+                    rejected.append((index, move.pk, error))
+                else:
+                    accepted.append((index, move, lines_data))
+            
+            if rejected:
+                StockMove.objects.filter(pk__in=[pk for _, pk, _ in rejected]).delete()
+            StockMoveLine.objects.bulk_create([
+                StockMoveLine(stock_move=move, **line_data)
+                for _, move, lines_data in accepted
+                for line_data in lines_data
+            ])
+            return accepted, rejected
+        
+        accepted, rejected = run_with_retry(create_moves)
+        for index, move, _ in accepted:
+            results[index] = {'index': index, 'status': 'created', 'id': move.pk}
+        for index, _, error in rejected:
+            results[index] = {'index': index, 'status': 'error', 'errors': {'detail': error}}
+        
+        failed = len(results) - len(accepted)
+        return Response(
+            {'created': len(accepted), 'failed': failed, 'results': results},
+            status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_201_CREATED
+        )
+    
+    @action(detail=False, methods=['post'])
+    def allocate(self, request):
+        """
+        Choose source locations for a multi-line order, using as few locations
+        as possible, and return OUTBOUND move drafts ready to POST back to this
+        endpoint or to ``bulk``. Nothing is reserved or moved.
+        """
+        from .allocation import allocate_order
+        
+        serializer = OrderAllocationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        return Response(allocate_order(
+            [(line['product'], line['quantity']) for line in data['lines']],
+            location_ids=data.get('locations'),
+            reference=data.get('reference'),
+        ))
+    
+    @action(detail=False, methods=['get', 'post'])
+    def replenishment(self, request):
+        """
+        GET previews the transfers that restore forward locations at or below
+        their reorder point from reserve locations; POST creates them as
+        completed moves in one transaction. ``reserve`` (comma-separated
+        location ids, in priority order) overrides the reserve locations and
+        ``location_id`` limits the plan to one forward location.
+        """
+        from .replenishment import plan_replenishment, replenish
+        
+        params = request.query_params if request.method == 'GET' else request.data
+        if not isinstance(params, dict):
+            return Response(
+                {'error': 'Expected an object of replenishment options'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            reserve = params.get('reserve')
+            if isinstance(reserve, str):
+                reserve = reserve.split(',')
+            reserve_ids = [int(pk) for pk in reserve] if reserve else None
+            location_id = int(params['location_id']) if params.get('location_id') else None
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'reserve and location_id must be location ids'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            if request.method == 'GET':
+                return Response(plan_replenishment(reserve_ids, location_id))
+            plan, moves = replenish(reserve_ids, location_id)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        for planned, move in zip(plan['moves'], moves):
+            planned['id'] = move.pk
+        return Response(plan, status=status.HTTP_201_CREATED if moves else status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream one row per move line as CSV or NDJSON (``?output=csv|ndjson``)"""
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"output must be one of: {', '.join(EXPORT_FORMATS)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        lines = StockMoveLine.objects.all()
+        try:
+            if request.query_params.get('from'):
+                lines = lines.filter(stock_move__timestamp__gte=parse_timestamp(request.query_params['from']))
+            if request.query_params.get('to'):
+                lines = lines.filter(stock_move__timestamp__lt=parse_timestamp(request.query_params['to']))
+        except ValueError:
+            return Response(
+                {'error': 'from and to must be ISO 8601 dates or timestamps'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        move_type = request.query_params.get('move_type')
+        if move_type:
+            lines = lines.filter(stock_move__move_type=move_type)
+        completed = request.query_params.get('completed')
+        if completed is not None:
+            lines = lines.filter(stock_move__completed=completed.lower() == 'true')
+        
+        fields = [
+            'move_id', 'timestamp', 'move_type', 'reference', 'completed',
+            'from_location', 'to_location', 'product_id', 'product_internal_reference',
+            'product_name', 'quantity',
+        ]
+        rows = lines.order_by('stock_move__timestamp', 'stock_move_id', 'id').values_list(
+            'stock_move_id', 'stock_move__timestamp', 'stock_move__move_type',
+            'stock_move__reference', 'stock_move__completed',
+            'stock_move__from_location__code', 'stock_move__to_location__code',
+            'product_id', 'product__internal_reference', 'product__name', 'quantity',
+        ).iterator(chunk_size=2000)
+        return streaming_export(fields, rows, export_format, 'stockmoves')
+    
     @action(detail=False, methods=['get'])
     def by_product(self, request):
+        """
+        Cursor-paginated move history of one product, newest move first.
+        
+        Each row is the product's line of a move with the move's header fields;
+        ``from`` and ``to`` bound the move timestamps.
+        """
         product_id = request.query_params.get('product_id')
         if not product_id:
             return Response(
@@ -119,6 +379,22 @@ class StockMoveViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        moves = StockMove.objects.filter(lines__product_id=product_id).distinct()
-        serializer = self.get_serializer(moves, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        lines = StockMoveLine.objects.filter(product_id=product_id).select_related(
+            'stock_move__from_location', 'stock_move__to_location'
+        )
+        try:
+            if request.query_params.get('from'):
+                lines = lines.filter(stock_move__timestamp__gte=parse_timestamp(request.query_params['from']))
+            if request.query_params.get('to'):
+                lines = lines.filter(stock_move__timestamp__lt=parse_timestamp(request.query_params['to']))
+        except ValueError:
+            return Response(
+                {'error': 'from and to must be ISO 8601 dates or timestamps'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Seeks into the (product, stock_move, id) index with a row comparison
+        # instead of sorting a DISTINCT join or filtering newer lines.
+        paginator = KeysetPagination(ordering=('-stock_move_id', '-id'))
+        page = paginator.paginate_queryset(lines, request, view=self)
+        return paginator.get_paginated_response(StockMoveHistorySerializer(page, many=True).data)
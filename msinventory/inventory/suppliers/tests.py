@@ -75,4 +75,16 @@ class SupplierAPITest(APITestCase):
         response = self.client.get('/api/suppliers/?is_company=false')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
-        self.assertEqual(response.data['results'][0]['name'], "Individual Supplier")
\ No newline at end of file
+        self.assertEqual(response.data['results'][0]['name'], "Individual Supplier")
+    
+    def test_cursor_pagination(self):
+        for number in range(3):
+            Supplier.objects.create(name=f"Supplier {number}")
+        
+        response = self.client.get('/api/suppliers/?pagination=cursor&page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        
+        response = self.client.get(response.data['next'])
+        self.assertEqual([s['name'] for s in response.data['results']], ["Supplier 2"])
+        self.assertIsNone(response.data['next'])
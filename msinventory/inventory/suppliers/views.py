@@ -1,13 +1,15 @@
 from rest_framework import viewsets
 from .models import Supplier, AddressType
 from .serializers import SupplierSerializer, AddressTypeSerializer
+from utils.pagination import KeysetPaginationMixin
 
 class AddressTypeViewSet(viewsets.ModelViewSet):
     queryset = AddressType.objects.all()
     serializer_class = AddressTypeSerializer
 
-class SupplierViewSet(viewsets.ModelViewSet):
+class SupplierViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = Supplier.objects.all().select_related('address_type', 'related_company')
+    keyset_ordering = ('id',)
     serializer_class = SupplierSerializer
     
     def get_queryset(self):
@@ -9,4 +9,5 @@ urlpatterns = [
     path('locations/', include('inventory.locations.urls')),
     path('stockmoves/', include('inventory.stockmoves.urls')),
     path('snapshots/', include('inventory.snapshots.urls')),
+    path('ledger/', include('inventory.ledger.urls')),
 ]
\ No newline at end of file
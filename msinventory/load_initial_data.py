@@ -14,8 +14,8 @@ def load_initial_data():
     """Load initial data from CSV files"""
     
     locations = [
-        {'code': 'MAIN', 'name': 'Main Warehouse'},
-        {'code': 'STAGING', 'name': 'Staging Area'},
+        {'code': 'MAIN', 'name': 'Main Warehouse', 'is_reserve': True},
+        {'code': 'STAGING', 'name': 'Staging Area', 'is_reserve': True},
         {'code': 'RETURNS', 'name': 'Returns Area'},
     ]
     
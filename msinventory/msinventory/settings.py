@@ -34,6 +34,7 @@ INSTALLED_APPS = [
     'inventory.locations',
     'inventory.stockmoves',
     'inventory.snapshots',
+    'inventory.ledger',
 ]
 
 MIDDLEWARE = [
@@ -113,6 +114,34 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'utils.exceptions.custom_exception_handler',
 }
 
+# Accumulate Product.quantity_on_hand changes in striped delta rows that are
+# folded in periodically (manage.py fold_stock_deltas) instead of updating the
+# product row on every move.
+INVENTORY_STRIPED_ON_HAND = os.getenv('INVENTORY_STRIPED_ON_HAND', 'False') == 'True'
+INVENTORY_ON_HAND_STRIPES = int(os.getenv('INVENTORY_ON_HAND_STRIPES', '16'))
+
+# Queue created stock moves (202 + job id) for manage.py process_stock_moves
+# instead of applying them inside the request. ?async=true|false overrides it.
+INVENTORY_ASYNC_MOVES = os.getenv('INVENTORY_ASYNC_MOVES', 'False') == 'True'
+
+# Attempts for a stock move transaction that fails on a deadlock or
+# serialization error before the error is returned.
+INVENTORY_LOCK_RETRIES = int(os.getenv('INVENTORY_LOCK_RETRIES', '3'))
+
+# Largest horizon and history window, in days, a demand forecast run accepts.
+FORECAST_MAX_HORIZON = int(os.getenv('FORECAST_MAX_HORIZON', '365'))
+FORECAST_MAX_HISTORY_DAYS = int(os.getenv('FORECAST_MAX_HISTORY_DAYS', '730'))
+
+# Snapshot retention (manage.py prune_snapshots): keep every snapshot for
+# FULL_DAYS, the last one per day until DAILY_DAYS, the last one per month after
+# that, and drop everything older than MONTHLY_DAYS when it is set.
+SNAPSHOT_RETENTION = {
+    'FULL_DAYS': int(os.getenv('SNAPSHOT_RETENTION_FULL_DAYS', '30')),
+    'DAILY_DAYS': int(os.getenv('SNAPSHOT_RETENTION_DAILY_DAYS', '365')),
+    'MONTHLY_DAYS': int(os.getenv('SNAPSHOT_RETENTION_MONTHLY_DAYS', '0')) or None,
+    'BATCH_SIZE': int(os.getenv('SNAPSHOT_RETENTION_BATCH_SIZE', '10000')),
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
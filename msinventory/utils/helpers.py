@@ -3,21 +3,14 @@ from datetime import datetime, timedelta
 
 def calculate_daily_demand(product_id, days=14):
     """Calculate average daily demand for a product based on recent outbound moves"""
-    from inventory.stockmoves.models import StockMove
-    from django.db.models import Sum
+    from inventory.products.reorder import outbound_totals
     from django.utils import timezone
     
     end_date = timezone.now()
     start_date = end_date - timedelta(days=days)
     
-    outbound_moves = StockMove.objects.filter(
-        product_id=product_id,
-        move_type='OUTBOUND',
-        timestamp__range=(start_date, end_date),
-        completed=True
-    )
-    
-    total_quantity = outbound_moves.aggregate(Sum('quantity'))['quantity__sum'] or 0
+    _, totals = outbound_totals(days, now=end_date, product_id=product_id)
+    total_quantity = int(totals.sum())
     daily_demand = total_quantity / days if days > 0 else 0
     
     return {
@@ -29,25 +22,22 @@ def calculate_daily_demand(product_id, days=14):
     }
 
 def get_reorder_suggestions(threshold_days=14, min_daily_demand=1):
-    """Get reorder suggestions based on recent demand"""
-    from inventory.products.models import Product
-    
-    suggestions = []
+    """Get reorder suggestions based on recent demand across the whole catalog"""
+    from inventory.products.reorder import reorder_suggestions
     
-    for product in Product.objects.all():
-        demand_data = calculate_daily_demand(product.id, threshold_days)
-        
-        if demand_data['daily_demand'] >= min_daily_demand:
-            days_of_supply = product.quantity_on_hand / demand_data['daily_demand'] if demand_data['daily_demand'] > 0 else float('inf')
-            
-            if days_of_supply < 7:
-                suggestions.append({
-                    'product': product.name,
-                    'product_id': product.id,
-                    'current_stock': product.quantity_on_hand,
-                    'daily_demand': demand_data['daily_demand'],
-                    'days_of_supply': round(days_of_supply, 2),
-                    'suggested_reorder': max(round(demand_data['daily_demand'] * 14), 10)
-                })
+    return reorder_suggestions(days=threshold_days, min_daily_demand=min_daily_demand)
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 date or datetime query parameter into an aware datetime"""
+    from django.utils import timezone
+    from django.utils.dateparse import parse_date, parse_datetime
     
-    return sorted(suggestions, key=lambda x: x['days_of_supply'])
\ No newline at end of file
+    parsed = parse_datetime(value)
+    if parsed is None:
+        parsed_date = parse_date(value)
+        if parsed_date is None:
+            raise ValueError(f"Invalid timestamp: {value}")
+        parsed = datetime.combine(parsed_date, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
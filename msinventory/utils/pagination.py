@@ -0,0 +1,174 @@
+import base64
+import json
+from datetime import datetime
+from django.conf import settings
+from django.db.models import BooleanField, DateTimeField, F, Func, Value
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class RowAfter(Func):
+    """
+    ``(a, b, ...) > (x, y, ...)`` (or ``<``) as a single row-value comparison,
+    which PostgreSQL uses as an index condition on a matching (a, b, ...)
+    index, unlike the equivalent OR-expanded filter.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, fields, values, descending):
+        self.operator = '<' if descending else '>'
+        super().__init__(*fields, *values)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sqls, params = [], []
+        for expression in self.source_expressions:
+            sql, expression_params = compiler.compile(expression)
+            sqls.append(sql)
+            params.extend(expression_params)
+        size = len(sqls) // 2
+        fields, values = ', '.join(sqls[:size]), ', '.join(sqls[size:])
+        return f"({fields}) {self.operator} ({values})", params
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination keyed on the values of ``ordering``.
+
+    Each page is fetched with a ``WHERE (key) after (last key)`` filter instead of
+    an OFFSET, and no COUNT query is issued, so every page costs the same no
+    matter how deep it is. ``ordering`` must end in a unique field.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=('-id',)):
+        self.ordering = tuple(ordering)
+        if len({field_name.startswith('-') for field_name in self.ordering}) != 1:
+            raise ValueError(
+                'Keyset ordering fields must all sort in the same direction'
+            )
+        self.page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 100
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, values):
+        # Full isoformat keeps microseconds, which DjangoJSONEncoder would truncate.
+        values = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in values
+        ]
+        payload = json.dumps(values).encode()
+        return base64.urlsafe_b64encode(payload).decode()
+
+    def decode_cursor(self, model, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        decoded = []
+        for field_name, value in zip(self.ordering, values):
+            field = model._meta.get_field(field_name.lstrip('-'))
+            if isinstance(field, DateTimeField):
+                value = parse_datetime(value)
+                if value is None:
+                    raise NotFound(self.invalid_cursor_message)
+            decoded.append(value)
+        return decoded
+
+    def keyset_filter(self, model, values):
+        """Rows strictly after ``values`` in ``ordering``, as one row comparison"""
+        names = [field_name.lstrip('-') for field_name in self.ordering]
+        return RowAfter(
+            [F(name) for name in names],
+            [
+                Value(value, output_field=model._meta.get_field(name))
+                for name, value in zip(names, values)
+            ],
+            descending=self.ordering[0].startswith('-'),
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self.decode_cursor(queryset.model, cursor)
+            queryset = queryset.filter(self.keyset_filter(queryset.model, values))
+
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.next_values = None
+        if self.has_next:
+            last = results[-1]
+            self.next_values = [
+                getattr(last, name.lstrip('-')) for name in self.ordering
+            ]
+        return results
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self.next_values)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class KeysetPaginationMixin:
+    """
+    Opt-in keyset pagination for list endpoints.
+
+    Requests with ``?pagination=cursor`` (or an existing ``cursor``) are paged
+    with KeysetPagination on ``keyset_ordering``; all others keep the default
+    page number pagination.
+    """
+    keyset_ordering = ('-id',)
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def use_keyset_pagination(self):
+        request = getattr(self, 'request', None)
+        if request is None:
+            return False
+        params = request.query_params
+        return (
+            params.get('pagination') == 'cursor'
+            or KeysetPagination.cursor_query_param in params
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.use_keyset_pagination():
+            self._paginator = KeysetPagination(ordering=self.get_keyset_ordering())
+        return super().paginator
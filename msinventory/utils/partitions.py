@@ -0,0 +1,240 @@
+import re
+from datetime import datetime
+from django.db import connection, transaction
+from django.utils import timezone
+
+PARTITION_SUFFIX = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def is_partitioned(model):
+    """Return True if ``model``'s table is a PostgreSQL partitioned table"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+        return bool(row and row[0])
+
+
+def _create_default_partition(cursor, table):
+    """Create the DEFAULT partition catching rows no monthly partition covers yet"""
+    name = default_partition_name(table)
+    cursor.execute("SELECT to_regclass(%s)", [name])
+    if cursor.fetchone()[0]:
+        return None
+    quote = connection.ops.quote_name
+    cursor.execute(f"CREATE TABLE {quote(name)} PARTITION OF {quote(table)} DEFAULT")
+    return name
+
+
+def _create_partition(cursor, table, month, column='timestamp'):
+    name = partition_name(table, month)
+    cursor.execute("SELECT to_regclass(%s)", [name])
+    if cursor.fetchone()[0]:
+        return None
+    quote = connection.ops.quote_name
+    bounds = [month, add_months(month, 1)]
+    default = default_partition_name(table)
+    cursor.execute("SELECT to_regclass(%s)", [default])
+    stray = False
+    if cursor.fetchone()[0]:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {quote(default)} "
+            f"WHERE {quote(column)} >= %s AND {quote(column)} < %s)",
+            bounds,
+        )
+        stray = cursor.fetchone()[0]
+    if stray:
+        # Rows of this month already landed in the default partition; it is
+        # detached while they move so the new partition's range can be claimed.
+        cursor.execute(f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(default)}")
+    cursor.execute(
+        f"CREATE TABLE {quote(name)} PARTITION OF {quote(table)} "
+        f"FOR VALUES FROM (%s) TO (%s)",
+        bounds,
+    )
+    if stray:
+        cursor.execute(
+            f"WITH moved AS ("
+            f"  DELETE FROM {quote(default)} "
+            f"  WHERE {quote(column)} >= %s AND {quote(column)} < %s "
+            f"  RETURNING *"
+            f") INSERT INTO {quote(table)} SELECT * FROM moved",
+            bounds,
+        )
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(default)} DEFAULT"
+        )
+    return name
+
+
+@transaction.atomic
+def ensure_partitions(model, months_ahead=3, now=None, column='timestamp'):
+    """
+    Create the monthly partitions from the current month to ``months_ahead``
+    ahead, plus the DEFAULT partition if it is missing. Rows that went to the
+    DEFAULT partition because their month had no partition yet are moved into
+    the new one.
+    """
+    table = model._meta.db_table
+    current = month_start(now or timezone.now())
+    with connection.cursor() as cursor:
+        created = [_create_default_partition(cursor, table)] + [
+            _create_partition(cursor, table, add_months(current, offset), column)
+            for offset in range(months_ahead + 1)
+        ]
+    return [name for name in created if name]
+
+
+def list_partitions(model):
+    """Return [(name, month)] of the monthly partitions of ``model``'s table"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s) ORDER BY child.relname",
+            [model._meta.db_table],
+        )
+        partitions = []
+        for (name,) in cursor.fetchall():
+            match = PARTITION_SUFFIX.search(name)
+            if match:
+                month = datetime(int(match.group(1)), int(match.group(2)), 1,
+                                 tzinfo=timezone.get_current_timezone())
+                partitions.append((name, month))
+        return partitions
+
+
+@transaction.atomic
+def drop_partitions_before(model, cutoff):
+    """
+    Detach and drop every monthly partition that ends on or before ``cutoff``.
+
+    This replaces a mass DELETE with a metadata operation. Returns the names of
+    the dropped partitions.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    dropped = []
+    with connection.cursor() as cursor:
+        for name, month in list_partitions(model):
+            if add_months(month, 1) <= cutoff:
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {quote(name)}")
+                cursor.execute(f"DROP TABLE {quote(name)}")
+                dropped.append(name)
+    return dropped
+
+
+@transaction.atomic
+def partition_table(model, column='timestamp', months_ahead=3):
+    """
+    Convert ``model``'s table into one range-partitioned by month on ``column``.
+
+    Existing rows are copied into monthly partitions, a DEFAULT partition
+    catches rows of months without one, and every constraint and
+    index is recreated on the partitioned table under its original name, with
+    ``column`` added to the primary key as PostgreSQL requires. Tables that
+    other tables reference by foreign key cannot be converted.
+    """
+    quote = connection.ops.quote_name
+    table = model._meta.db_table
+    legacy = f"{table}_unpartitioned"
+    sequence = f"{table}_part_id_seq"
+
+    referencing = [
+        relation.related_model._meta.label
+        for relation in model._meta.related_objects
+        if relation.field.db_constraint and not relation.many_to_many
+    ]
+    if referencing:
+        raise ValueError(
+            f"{model._meta.label} is referenced by {', '.join(referencing)}; "
+            f"PostgreSQL foreign keys cannot target a partitioned table by id alone"
+        )
+    if is_partitioned(model):
+        raise ValueError(f"{table} is already partitioned")
+
+    with connection.cursor() as cursor:
+        # Deferred foreign key checks must not be pending on the table we drop.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}")
+        cursor.execute(
+            "SELECT c.conname, c.contype, pg_get_constraintdef(c.oid), "
+            "ARRAY(SELECT a.attname FROM pg_attribute a "
+            "      WHERE a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)) "
+            "FROM pg_constraint c WHERE c.conrelid = to_regclass(%s) "
+            "ORDER BY c.contype DESC",
+            [legacy],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+            "LEFT JOIN pg_constraint c "
+            "ON c.conindid = i.indexrelid AND c.conrelid = i.indrelid "
+            "WHERE i.indrelid = to_regclass(%s) AND c.oid IS NULL",
+            [legacy],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+
+        for name, kind, definition, columns in constraints:
+            if kind == 'u' and column not in columns:
+                raise ValueError(f"Unique constraint {name} does not include {column}")
+
+        cursor.execute(
+            f"CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE ({quote(column)})"
+        )
+        cursor.execute(
+            f"SELECT MIN({quote(column)}), COALESCE(MAX(id), 0) FROM {quote(legacy)}"
+        )
+        oldest, last_id = cursor.fetchone()
+
+        # Identity columns are not supported on partitioned tables, so ids come
+        # from a plain sequence that continues after the existing rows.
+        cursor.execute(f"CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id")
+        cursor.execute("SELECT setval(%s, %s, false)", [sequence, last_id + 1])
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval(%s)",
+            [sequence],
+        )
+
+        current = month_start(timezone.now())
+        month = month_start(oldest) if oldest and oldest < current else current
+        while month <= add_months(current, months_ahead):
+            _create_partition(cursor, table, month, column)
+            month = add_months(month, 1)
+        # Inserts keep working if manage_partitions stops running.
+        _create_default_partition(cursor, table)
+
+        cursor.execute(f"INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}")
+        cursor.execute(f"DROP TABLE {quote(legacy)}")
+
+        for name, kind, definition, columns in constraints:
+            if kind == 'p' and column not in columns:
+                key = ', '.join(quote(col) for col in columns + [column])
+                definition = f"PRIMARY KEY ({key})"
+            cursor.execute(
+                f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}"
+            )
+        for definition in indexes:
+            cursor.execute(re.sub(
+                r' ON \S+ USING ', f' ON {quote(table)} USING ', definition, count=1
+            ))
@@ -0,0 +1,43 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose write() hands the written line back to csv.writer"""
+    def write(self, value):
+        return value
+
+
+def render_csv(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_ndjson(fields, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def streaming_export(fields, rows, export_format, filename):
+    """
+    Stream ``rows`` (tuples matching ``fields``) as a CSV or NDJSON download.
+
+    ``rows`` should be a lazy iterator, such as ``QuerySet.iterator()``, so that
+    memory stays flat however large the export is.
+    """
+    renderer = render_ndjson if export_format == 'ndjson' else render_csv
+    response = StreamingHttpResponse(
+        renderer(fields, rows), content_type=EXPORT_FORMATS[export_format]
+    )
+    disposition = f'attachment; filename="{filename}.{export_format}"'
+    response['Content-Disposition'] = disposition
+    return response